@@ -0,0 +1,127 @@
+"""
+比較分類器推論後端（torch / onnx FP32 / onnx INT8）的延遲與記憶體用量。
+
+每個後端在獨立子行程中載入與測量，RSS 互不影響。
+
+用法：
+    python benchmark_backends.py --model-dir finetuned_classifier
+    python benchmark_backends.py --model-dir finetuned_classifier --batch-sizes 1 8 32 --runs 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from classifier_backend import ONNX_DIRNAME, ONNX_FP32_FILENAME, ONNX_INT8_FILENAME, load_classifier_backend
+
+SAMPLE_FILE = os.path.join(os.path.dirname(__file__), "data", "complex_dialog.txt")
+FALLBACK_TEXTS = ["寶貝，你現在方便匯款嗎？", "最近我對投資有點興趣", "你好呀！今天過得如何？"]
+
+
+def _rss_mb() -> float:
+    """目前行程的常駐記憶體（MB）"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def _load_texts() -> List[str]:
+    try:
+        with open(SAMPLE_FILE, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        return texts or FALLBACK_TEXTS
+    except OSError:
+        return FALLBACK_TEXTS
+
+
+def measure(model_dir: str, backend: str, onnx_path: str, batch_sizes: List[int], runs: int) -> Dict:
+    """在目前行程中測量單一後端"""
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    clf = load_classifier_backend(model_dir, backend=backend, onnx_path=onnx_path or None)
+    load_seconds = time.perf_counter() - start
+
+    texts = _load_texts()
+    latencies = {}
+    for batch_size in batch_sizes:
+        batch = [texts[i % len(texts)] for i in range(batch_size)]
+        clf.predict_proba(batch)  # 暖身
+        samples = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            clf.predict_proba(batch)
+            samples.append((time.perf_counter() - t0) * 1000)
+        samples.sort()
+        latencies[batch_size] = {
+            "p50_ms": round(statistics.median(samples), 2),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+            "items_per_s": round(batch_size * 1000 / statistics.mean(samples), 1),
+        }
+    return {
+        "load_seconds": round(load_seconds, 2),
+        "rss_mb": round(_rss_mb() - rss_before, 1),
+        "latency": latencies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較分類器推論後端的延遲與 RSS")
+    parser.add_argument("--model-dir", default="finetuned_classifier")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--worker", nargs=2, metavar=("BACKEND", "ONNX_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        backend, onnx_path = args.worker
+        print(json.dumps(measure(args.model_dir, backend, onnx_path, args.batch_sizes, args.runs)))
+        return
+
+    onnx_dir = os.path.join(args.model_dir, ONNX_DIRNAME)
+    variants = [("torch", "torch", "")]
+    for label, filename in (("onnx-fp32", ONNX_FP32_FILENAME), ("onnx-int8", ONNX_INT8_FILENAME)):
+        path = os.path.join(onnx_dir, filename)
+        if os.path.exists(path):
+            variants.append((label, "onnx", path))
+        else:
+            print(f"略過 {label}：找不到 {path}（請先執行 export_onnx.py）")
+
+    results = {}
+    for label, backend, onnx_path in variants:
+        cmd = [sys.executable, __file__, "--model-dir", args.model_dir, "--runs", str(args.runs),
+               "--batch-sizes", *map(str, args.batch_sizes), "--worker", backend, onnx_path]
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results[label] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"\n{'後端':<10}{'載入(s)':>9}{'RSS(MB)':>9}" + "".join(
+        f"{f'b={b} p50':>12}{f'b={b} p95':>12}{f'b={b} 則/s':>12}" for b in args.batch_sizes))
+    for label, result in results.items():
+        row = f"{label:<10}{result['load_seconds']:>9}{result['rss_mb']:>9}"
+        for b in args.batch_sizes:
+            lat = result["latency"][str(b)]
+            row += f"{lat['p50_ms']:>12}{lat['p95_ms']:>12}{lat['items_per_s']:>12}"
+        print(row)
+
+    base = results["torch"]
+    for label, result in results.items():
+        if label == "torch":
+            continue
+        b = str(args.batch_sizes[0])
+        speedup = base["latency"][b]["p50_ms"] / max(result["latency"][b]["p50_ms"], 1e-6)
+        print(f"{label}: b={b} p50 加速 {speedup:.2f}x，RSS 減少 {base['rss_mb'] - result['rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
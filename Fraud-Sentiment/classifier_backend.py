@@ -0,0 +1,203 @@
+"""
+詐騙分類器推論後端
+
+提供 finetuned_classifier 的兩種 CPU 推論後端，介面一致：
+- torch: 原始 PyTorch BertForSequenceClassification（全精度）
+- onnx: 由 export_onnx.py 匯出的 ONNX 模型（可為動態 INT8 量化版本），以 ONNX Runtime 執行
+
+後端由 CLASSIFIER_BACKEND 環境變數（或呼叫端參數）選擇，
+FraudSentimentDetectionStrategy 與 pipeline.ClassifierModule 共用。
+模型、tokenizer 與 session 經由 model_registry 取得，同一行程只載入一次。
+"""
+
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+import model_registry
+from conversation_windows import RULE_MAX, aggregate, split_windows
+
+LABELS = ["安全或初期探索", "情感連結強化疑慮", "高風險詐騙徵兆"]
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+
+# export_onnx.py 的輸出檔名
+ONNX_DIRNAME = "onnx"
+ONNX_FP32_FILENAME = "model.onnx"
+ONNX_INT8_FILENAME = "model.int8.onnx"
+
+MAX_LENGTH = 64
+
+
+class ClassifierBackend(ABC):
+    """分類器後端介面：輸入文字列表，回傳每則文字的類別機率"""
+
+    name = ""
+
+    def __init__(self, model_dir: str, tokenizer_dir: Optional[str] = None, max_length: int = MAX_LENGTH):
+        """
+        Args:
+            model_dir: finetuned_classifier 資料夾
+            tokenizer_dir: tokenizer 資料夾，預設與 model_dir 相同
+            max_length: 截斷長度
+        """
+        self.model_dir = model_dir
+        self.tokenizer_dir = tokenizer_dir or model_dir
+        self.max_length = max_length
+
+    @abstractmethod
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        """
+        以單次 padded batch 推論。
+
+        Returns:
+            np.ndarray: 形狀為 (len(texts), 類別數) 的機率矩陣
+        """
+        pass
+
+    def predict(self, texts: List[str]) -> List[tuple]:
+        """回傳每則文字的 (標籤, 可信度)"""
+        probs = self.predict_proba(texts)
+        preds = probs.argmax(axis=1)
+        return [(LABELS[int(pred)], float(probs[i, pred])) for i, pred in enumerate(preds)]
+
+    def predict_conversation(self, text: str, rule: str = RULE_MAX, max_windows: Optional[int] = None,
+                             last_k: int = 3, overlap: int = 1) -> tuple:
+        """
+        長對話分窗推論：依訊息邊界切成不超過 max_length 的視窗，一次 batch 推論後彙整。
+
+        Args:
+            text: 單則訊息或整段對話匯出
+            rule: 彙整規則 max、mean 或 last_k
+            max_windows: 視窗數上限（保留最新的視窗），限制推論延遲
+            last_k: last_k 規則使用的視窗數
+            overlap: 相鄰視窗重疊的訊息數
+
+        Returns:
+            tuple: (標籤, 可信度, 視窗數)
+        """
+        windows = split_windows(text, self.max_length, max_windows, overlap)
+        probs = aggregate(self.predict_proba(windows), rule, last_k)
+        pred = int(probs.argmax())
+        return LABELS[pred], float(probs[pred]), len(windows)
+
+
+class TorchClassifierBackend(ClassifierBackend):
+    """PyTorch 全精度後端"""
+
+    name = BACKEND_TORCH
+
+    def __init__(self, model_dir: str, tokenizer_dir: Optional[str] = None, max_length: int = MAX_LENGTH):
+        super().__init__(model_dir, tokenizer_dir, max_length)
+        import torch
+
+        self._torch = torch
+        self.tokenizer = model_registry.get_tokenizer(self.tokenizer_dir)
+        self.model = model_registry.get_sequence_classifier(model_dir)
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, return_tensors="pt", truncation=True, padding=True, max_length=self.max_length)
+        with self._torch.no_grad():
+            logits = self.model(**inputs).logits
+            return self._torch.softmax(logits, dim=1).numpy()
+
+
+class OnnxClassifierBackend(ClassifierBackend):
+    """ONNX Runtime 後端（支援 INT8 動態量化模型）"""
+
+    name = BACKEND_ONNX
+
+    def __init__(self, model_dir: str, tokenizer_dir: Optional[str] = None, max_length: int = MAX_LENGTH,
+                 onnx_path: Optional[str] = None, intra_op_threads: Optional[int] = None):
+        """
+        Args:
+            onnx_path: ONNX 檔案路徑，預設為 model_dir/onnx/model.int8.onnx（不存在則用 model.onnx）
+            intra_op_threads: ONNX Runtime 單一運算的執行緒數，None 使用 OMP_NUM_THREADS 或預設值
+        """
+        super().__init__(model_dir, tokenizer_dir, max_length)
+        self.onnx_path = onnx_path or default_onnx_path(model_dir)
+        if not os.path.exists(self.onnx_path):
+            raise FileNotFoundError(f"找不到 ONNX 模型: {self.onnx_path}，請先執行 export_onnx.py")
+
+        # 未指定時沿用 OMP_NUM_THREADS（pre-fork 部署由 gunicorn.conf.py 依 worker 數分配）
+        self.intra_op_threads = intra_op_threads or int(os.getenv("OMP_NUM_THREADS", 0)) or None
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._tokenizer = self._load_tokenizer()
+
+    @property
+    def session(self):
+        """目前行程的 InferenceSession（fork 後的 worker 第一次使用時重新建立）"""
+        return model_registry.get_onnx_session(self.onnx_path, self.intra_op_threads)
+
+    def _load_tokenizer(self):
+        """
+        優先以 tokenizers 套件直接載入 tokenizer.json，不匯入 torch/transformers，
+        讓 onnx 後端的常駐記憶體只包含 ONNX Runtime；找不到時退回 transformers。
+        """
+        try:
+            return model_registry.get_fast_tokenizer(self.tokenizer_dir, self.max_length)
+        except Exception:
+            return model_registry.get_tokenizer(self.tokenizer_dir)
+
+    def _encode(self, texts: List[str]) -> dict:
+        if hasattr(self._tokenizer, "encode_batch"):
+            encodings = self._tokenizer.encode_batch(texts)
+            encoded = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+        else:
+            encoded = self._tokenizer(texts, return_tensors="np", truncation=True, padding=True,
+                                      max_length=self.max_length)
+        return {name: np.asarray(encoded[name], dtype=np.int64) for name in self._input_names if name in encoded}
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        logits = self.session.run(["logits"], self._encode(texts))[0]
+        return _softmax(logits)
+
+
+def default_onnx_path(model_dir: str) -> str:
+    """優先使用 INT8 量化模型，否則使用 FP32 ONNX 模型"""
+    onnx_dir = os.path.join(model_dir, ONNX_DIRNAME)
+    int8_path = os.path.join(onnx_dir, ONNX_INT8_FILENAME)
+    return int8_path if os.path.exists(int8_path) else os.path.join(onnx_dir, ONNX_FP32_FILENAME)
+
+
+def load_classifier_backend(model_dir: str, backend: Optional[str] = None,
+                            tokenizer_dir: Optional[str] = None,
+                            onnx_path: Optional[str] = None,
+                            max_length: int = MAX_LENGTH) -> ClassifierBackend:
+    """
+    依設定建立分類器後端。
+
+    Args:
+        model_dir: finetuned_classifier 資料夾
+        backend: torch 或 onnx，預設讀取 CLASSIFIER_BACKEND 環境變數（預設 torch）
+        tokenizer_dir: tokenizer 資料夾
+        onnx_path: ONNX 檔案路徑，預設讀取 CLASSIFIER_ONNX_PATH 環境變數
+        max_length: 截斷長度
+
+    Returns:
+        ClassifierBackend: 推論後端
+    """
+    backend = (backend or os.getenv("CLASSIFIER_BACKEND", BACKEND_TORCH)).lower()
+    if backend == BACKEND_TORCH:
+        loader = lambda: TorchClassifierBackend(model_dir, tokenizer_dir, max_length)
+    elif backend == BACKEND_ONNX:
+        onnx_path = onnx_path or os.getenv("CLASSIFIER_ONNX_PATH") or None
+        loader = lambda: OnnxClassifierBackend(model_dir, tokenizer_dir, max_length, onnx_path=onnx_path)
+    else:
+        raise ValueError(f"不支援的分類器後端: {backend}")
+    key = ("classifier_backend", backend, model_registry.normalize_path(model_dir),
+           model_registry.normalize_path(tokenizer_dir or model_dir), onnx_path, max_length)
+    return model_registry.get_or_load(key, loader)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
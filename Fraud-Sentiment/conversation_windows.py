@@ -0,0 +1,103 @@
+"""
+長對話分窗推論工具
+
+BERT 分類器只看得到前 max_length 個 token，貼上整段 LINE 對話匯出時後面的訊息會被截掉。
+此模組將對話依訊息邊界切成不超過 token 上限的視窗，所有視窗以一次 padded batch 推論後，
+再以 max / mean / last_k 規則彙整成整段對話的判定。
+
+token 數以字元數估計：bert-base-chinese 的中文每字一個 token，英數字元數不少於其 WordPiece 數，
+因此估計值不會低於實際 token 數。
+"""
+
+from typing import List, Optional, Union
+
+import numpy as np
+
+from line_export import DATE_LINE_REGEX, LineExport
+
+RULE_MAX = "max"
+RULE_MEAN = "mean"
+RULE_LAST_K = "last_k"
+RULES = (RULE_MAX, RULE_MEAN, RULE_LAST_K)
+
+# [CLS] 與 [SEP] 佔用的 token 數
+SPECIAL_TOKENS = 2
+
+
+def split_messages(text: Union[str, LineExport]) -> List[str]:
+    """將對話切成訊息列表，略過空行與日期分隔行；已解析的 LineExport 直接逐則輸出，不再切行"""
+    if isinstance(text, LineExport):
+        return [text.render(message) for message in text.messages]
+    messages = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not DATE_LINE_REGEX.match(line):
+            messages.append(line)
+    return messages
+
+
+def split_windows(text: Union[str, LineExport], max_length: int, max_windows: Optional[int] = None,
+                  overlap: int = 1) -> List[str]:
+    """
+    依訊息邊界將對話切成視窗。
+
+    Args:
+        text: 單則訊息或整段對話，或已解析的 LINE 匯出
+        max_length: 模型的 token 上限（含特殊 token）
+        max_windows: 視窗數上限，超過時保留最後（最新）的視窗；None 表示不限制
+        overlap: 相鄰視窗重疊的訊息數，保留跨視窗的上下文
+
+    Returns:
+        List[str]: 視窗文字列表，至少包含一個元素
+    """
+    budget = max(1, max_length - SPECIAL_TOKENS)
+    messages = []
+    for message in split_messages(text):
+        # 單則訊息超過上限時依字元切段
+        messages.extend(message[i:i + budget] for i in range(0, len(message), budget))
+    if not messages:
+        return [text.to_text() if isinstance(text, LineExport) else text.strip()]
+
+    windows = []
+    start = 0
+    while start < len(messages):
+        end = start
+        length = 0
+        while end < len(messages):
+            # 訊息之間以換行連接，換行不產生 token
+            if end > start and length + len(messages[end]) > budget:
+                break
+            length += len(messages[end])
+            end += 1
+        windows.append("\n".join(messages[start:end]))
+        if end >= len(messages):
+            break
+        start = max(start + 1, end - overlap)
+
+    if max_windows and len(windows) > max_windows:
+        windows = windows[-max_windows:]
+    return windows
+
+
+def aggregate(probs: np.ndarray, rule: str = RULE_MAX, last_k: int = 3) -> np.ndarray:
+    """
+    將各視窗的類別機率彙整成整段對話的機率。
+
+    Args:
+        probs: 形狀為 (視窗數, 類別數) 的機率矩陣，類別依風險由低到高排列
+        rule: max 取風險最高的視窗；mean 取所有視窗平均；last_k 取最後 k 個視窗平均
+        last_k: last_k 規則使用的視窗數
+
+    Returns:
+        np.ndarray: 形狀為 (類別數,) 的機率向量
+    """
+    if rule == RULE_MAX:
+        # 依預測類別的風險排序，同風險取可信度較高的視窗
+        preds = probs.argmax(axis=1)
+        best = max(range(len(probs)), key=lambda i: (preds[i], probs[i, preds[i]]))
+        return probs[best]
+    if rule == RULE_MEAN:
+        return probs.mean(axis=0)
+    if rule == RULE_LAST_K:
+        return probs[-max(1, last_k):].mean(axis=0)
+    raise ValueError(f"不支援的彙整規則: {rule}（可用 {', '.join(RULES)}）")
@@ -0,0 +1,80 @@
+"""
+將 finetuned_classifier 匯出為 ONNX，並以動態 INT8 量化產生 CPU 推論用模型。
+
+用法：
+    python export_onnx.py --model-dir finetuned_classifier
+    python export_onnx.py --model-dir ../models/finetuned_classifier --no-quantize
+
+輸出（預設於 <model-dir>/onnx/）：
+    model.onnx        FP32 ONNX 模型（batch 與序列長度為動態維度）
+    model.int8.onnx   動態 INT8 量化模型（MatMul/Gemm 權重量化）
+"""
+
+import argparse
+import inspect
+import os
+
+import torch
+from transformers import AutoTokenizer, BertForSequenceClassification
+
+from classifier_backend import MAX_LENGTH, ONNX_DIRNAME, ONNX_FP32_FILENAME, ONNX_INT8_FILENAME
+
+
+def export_onnx(model_dir: str, output_dir: str, opset: int = 14) -> str:
+    """匯出 FP32 ONNX 模型，回傳檔案路徑"""
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = BertForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+
+    sample = tokenizer(["範例輸入", "另一則較長的範例輸入文字"], return_tensors="pt",
+                       truncation=True, padding=True, max_length=MAX_LENGTH)
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, ONNX_FP32_FILENAME)
+    # 新版 torch 預設使用需要 onnxscript 的 dynamo 匯出器，這裡固定使用 TorchScript 匯出器
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            output_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+            **extra,
+        )
+    return output_path
+
+
+def quantize_int8(onnx_path: str, output_path: str) -> str:
+    """以 ONNX Runtime 動態量化為 INT8，回傳檔案路徑"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="匯出 finetuned_classifier 為 ONNX / INT8")
+    parser.add_argument("--model-dir", default="finetuned_classifier", help="finetuned_classifier 資料夾")
+    parser.add_argument("--output-dir", default=None, help=f"輸出資料夾（預設 <model-dir>/{ONNX_DIRNAME}）")
+    parser.add_argument("--opset", type=int, default=14, help="ONNX opset 版本")
+    parser.add_argument("--no-quantize", action="store_true", help="只匯出 FP32 模型")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.join(args.model_dir, ONNX_DIRNAME)
+    fp32_path = export_onnx(args.model_dir, output_dir, args.opset)
+    print(f"FP32 ONNX 模型：{fp32_path}（{os.path.getsize(fp32_path) / 1e6:.1f} MB）")
+
+    if not args.no_quantize:
+        int8_path = quantize_int8(fp32_path, os.path.join(output_dir, ONNX_INT8_FILENAME))
+        print(f"INT8 量化模型：{int8_path}（{os.path.getsize(int8_path) / 1e6:.1f} MB）")
+
+
+if __name__ == "__main__":
+    main()
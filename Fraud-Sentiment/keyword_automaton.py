@@ -0,0 +1,255 @@
+import json
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import model_registry
+from theory_stage_classifier import STAGE_MAPPING
+
+# 關鍵字來源標籤
+TAG_SCAM = "scam"          # data/scam_data.json 的詐騙關鍵詞
+TAG_LEXICON = "lexicon"    # pipeline 的關鍵字詞庫
+TAG_STAGE = "stage"        # 理論階段規則（STAGE_MAPPING）
+
+# pipeline 與評估腳本共用的關鍵字詞庫
+LEXICON: FrozenSet[str] = frozenset({
+    "匯款", "帳戶", "金額", "投資", "虛擬貨幣", "穩賺不賠", "寶貝", "很急", "快點", "轉帳", "款項", "單身", "我只信你"
+})
+
+# 主專案的詐騙關鍵詞資料
+SCAM_DATA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "scam_data.json"))
+
+
+@dataclass(frozen=True)
+class KeywordHit:
+    """一次關鍵字命中：text[start:end] == keyword"""
+    start: int
+    end: int
+    keyword: str
+
+
+@dataclass
+class KeywordScan:
+    """單次掃描的彙整結果"""
+    hits: List[KeywordHit]
+    keywords: List[str]           # 依首次出現順序排列、不重複
+    counts: Dict[str, int]
+    stage_ids: List[int]          # 命中的 STAGE_MAPPING 索引，由小到大
+
+    def keywords_with_tag(self, automaton: "KeywordAutomaton", tag: str) -> List[str]:
+        """只保留帶有指定來源標籤的命中關鍵字"""
+        return [kw for kw in self.keywords if tag in automaton.tags_of(kw)]
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick 多模式比對自動機。
+
+    建立後以單次線性掃描找出文字中所有關鍵字（含重疊命中），
+    時間複雜度 O(文字長度 + 命中數)，與關鍵字數量無關，適用於數 MB 的 LINE 匯出。
+    英文字母大小寫不敏感；純英數關鍵字要求前後不是英數字（等同 \\b），
+    中文關鍵字則直接比對，不依賴空白斷詞。
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每個狀態的輸出：以該狀態結尾的關鍵字（沿失敗鏈合併）
+        self._output: List[Tuple[str, ...]] = [()]
+        self._tags: Dict[str, Set[str]] = {}
+        self._stages: Dict[str, Set[int]] = {}
+        # 正規化鍵對應第一次加入時的原始寫法
+        self._display: Dict[str, str] = {}
+        self._built = False
+
+    def add(self, keyword: str, tag: Optional[str] = None, stage_id: Optional[int] = None) -> None:
+        """
+        加入關鍵字。
+
+        Args:
+            keyword: 關鍵字
+            tag: 來源標籤
+            stage_id: 對應的 STAGE_MAPPING 索引
+        """
+        keyword = keyword.strip()
+        if not keyword:
+            return
+        key = _fold(keyword)
+        if key not in self._tags:
+            state = 0
+            for ch in key:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = nxt
+            self._output[state] = (key,)
+            self._tags[key] = set()
+            self._stages[key] = set()
+            self._display[key] = keyword
+            self._built = False
+        if tag:
+            self._tags[key].add(tag)
+        if stage_id is not None:
+            self._stages[key].add(stage_id)
+
+    def build(self) -> "KeywordAutomaton":
+        """以 BFS 建立失敗連結與合併輸出"""
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    def __contains__(self, keyword: str) -> bool:
+        return _fold(keyword) in self._tags
+
+    def tags_of(self, keyword: str) -> FrozenSet[str]:
+        return frozenset(self._tags.get(_fold(keyword), ()))
+
+    def stages_of(self, keyword: str) -> FrozenSet[int]:
+        return frozenset(self._stages.get(_fold(keyword), ()))
+
+    def iter_hits(self, text: str) -> Iterable[KeywordHit]:
+        """
+        單次掃描文字，依結束位置產生所有命中。
+
+        Args:
+            text: 要掃描的文字
+
+        Yields:
+            KeywordHit: 命中位置（對應原始文字索引）與關鍵字
+        """
+        if not self._built:
+            self.build()
+        goto, fail, output = self._goto, self._fail, self._output
+        folded = text.lower()
+        if len(folded) != len(text):
+            folded = _fold(text)
+        state = 0
+        for i, ch in enumerate(folded):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for key in output[state]:
+                start = i - len(key) + 1
+                if _is_ascii_word(key) and not _at_word_boundary(text, start, i + 1):
+                    continue
+                yield KeywordHit(start, i + 1, self._display[key])
+
+    def scan(self, text: str) -> KeywordScan:
+        """
+        掃描文字並彙整命中關鍵字、次數與詐騙階段。
+
+        Args:
+            text: 要掃描的文字
+
+        Returns:
+            KeywordScan: 掃描結果
+        """
+        hits = list(self.iter_hits(text))
+        counts: Dict[str, int] = {}
+        stage_ids: Set[int] = set()
+        for hit in hits:
+            if hit.keyword not in counts:
+                counts[hit.keyword] = 0
+                stage_ids.update(self._stages[_fold(hit.keyword)])
+            counts[hit.keyword] += 1
+        return KeywordScan(hits=hits, keywords=list(counts), counts=counts, stage_ids=sorted(stage_ids))
+
+
+def build_keyword_automaton(scam_keywords: Iterable[str] = (),
+                            lexicon: Iterable[str] = (),
+                            stage_mapping: List[Dict] = STAGE_MAPPING) -> KeywordAutomaton:
+    """
+    由詐騙關鍵詞、pipeline 詞庫與理論階段規則建立共用自動機。
+
+    Args:
+        scam_keywords: 詐騙關鍵詞（例如 data/scam_data.json 的 keywords）
+        lexicon: pipeline 的關鍵字詞庫
+        stage_mapping: 理論階段規則，索引即為 stage_id
+
+    Returns:
+        KeywordAutomaton: 已建立完成的自動機
+    """
+    automaton = KeywordAutomaton()
+    for keyword in scam_keywords:
+        automaton.add(keyword, tag=TAG_SCAM)
+    for keyword in lexicon:
+        automaton.add(keyword, tag=TAG_LEXICON)
+    for stage_id, stage_info in enumerate(stage_mapping):
+        for keyword in stage_info["keywords"]:
+            automaton.add(keyword, tag=TAG_STAGE, stage_id=stage_id)
+    return automaton.build()
+
+
+def load_scam_keywords(path: str = SCAM_DATA_PATH) -> List[str]:
+    """讀取 scam_data.json 的 keywords；檔案不存在或格式錯誤時回傳空列表"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return list(json.load(f).get("keywords", []))
+    except (OSError, ValueError, AttributeError):
+        return []
+
+
+def get_default_automaton(scam_data_path: str = SCAM_DATA_PATH) -> KeywordAutomaton:
+    """
+    行程共用的預設自動機：scam_data.json 的詐騙關鍵詞、LEXICON 與 STAGE_MAPPING。
+
+    第一次呼叫時建立並登錄於 model_registry，之後回傳同一個實例；
+    建立完成後只做唯讀掃描，可跨執行緒共用，preload 時由 worker 以 copy-on-write 共用。
+
+    Args:
+        scam_data_path: 詐騙關鍵詞資料檔
+
+    Returns:
+        KeywordAutomaton: 已建立完成的共用自動機
+    """
+    path = os.path.abspath(scam_data_path)
+    return model_registry.get_or_load(
+        ("keyword_automaton", path),
+        lambda: build_keyword_automaton(scam_keywords=load_scam_keywords(path), lexicon=LEXICON)
+    )
+
+
+def _fold_char(ch: str) -> str:
+    # 僅在轉小寫後仍為單一字元時轉換，確保命中位置與原始文字一致
+    lower = ch.lower()
+    return lower if len(lower) == 1 else ch
+
+
+def _fold(text: str) -> str:
+    return "".join(_fold_char(ch) for ch in text)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and (ch.isalnum() or ch == "_")
+
+
+def _is_ascii_word(keyword: str) -> bool:
+    return _is_word_char(keyword[0]) or _is_word_char(keyword[-1])
+
+
+def _at_word_boundary(text: str, start: int, end: int) -> bool:
+    if start > 0 and _is_word_char(text[start]) and _is_word_char(text[start - 1]):
+        return False
+    if end < len(text) and _is_word_char(text[end - 1]) and _is_word_char(text[end]):
+        return False
+    return True
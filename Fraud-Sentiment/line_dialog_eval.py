@@ -2,13 +2,12 @@ import logging
 from typing import List, Set, Dict
 from pathlib import Path
 from ckip_transformers.nlp import CkipWordSegmenter
-import re
+from keyword_automaton import LEXICON
+from line_export import KIND_TEXT, LineExportParser
 from theory_stage_classifier import classify_stage
 
 # 關鍵字清單
-KEYWORDS: Set[str] = {
-    "匯款", "帳戶", "金額", "投資", "虛擬貨幣", "穩賺不賠", "寶貝", "很急", "快點", "轉帳", "款項", "單身", "我只信你"
-}
+KEYWORDS: Set[str] = set(LEXICON)
 
 # 對話檔案路徑
 DIALOG_FILES = [
@@ -17,24 +16,9 @@ DIALOG_FILES = [
 ]
 
 def extract_dialog_lines(filepath: Path) -> List[str]:
-    """讀取 txt 對話檔案，僅保留用戶訊息內容。"""
-    lines = []
-    with filepath.open(encoding="utf-8") as f:
-        for line in f:
-            # 跳過空行與日期行
-            if not line.strip() or re.match(r"^\d{4}/\d{2}/\d{2}", line):
-                continue
-            # 只取冒號後的訊息內容
-            if ":" in line:
-                msg = line.split(" ", 1)[-1]
-                if "\t" in msg:
-                    msg = msg.split("\t", 1)[-1]
-                if " " in msg:
-                    msg = msg.split(" ", 1)[-1]
-                msg = msg.strip()
-                if msg:
-                    lines.append(msg)
-    return lines
+    """讀取 txt 對話檔案，僅保留用戶的文字訊息內容（略過日期行、系統訊息與貼圖/照片）。"""
+    with filepath.open(encoding="utf-8-sig") as f:
+        return [m.content for m in LineExportParser().parse(f) if m.kind == KIND_TEXT]
 
 def segment_sentences(sentences: List[str]) -> List[List[str]]:
     ws_driver = CkipWordSegmenter(model="bert-base", device=-1)
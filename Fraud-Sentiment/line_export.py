@@ -0,0 +1,236 @@
+"""
+LINE 對話匯出解析器
+
+單次走訪字串或檔案，逐行產生精簡的訊息紀錄（日期、時間、發送者 ID、內容、訊息類型），
+不先切成行列表，也不保留原文副本；格式驗證、關鍵詞掃描、對話壓縮與評估共用同一份解析結果。
+
+支援的格式：
+    [LINE] 與小明的聊天記錄          ← 匯出標頭
+    儲存日期：2025/04/22 10:00
+    2025/04/01(二)                  ← 日期行（亦接受 2025.04.01 星期二）
+    21:03 雅婷 哈囉～               ← 時間 發送者 內容（空白或 tab 分隔）
+    21:05 雅婷 [貼圖]               ← 媒體佔位
+    23:34 語音通話結束              ← 系統訊息
+    沒有時間前綴的行                ← 上一則訊息的後續行
+"""
+
+import io
+import os
+import re
+import sys
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Union
+
+# 訊息類型
+KIND_TEXT = "text"
+KIND_MEDIA = "media"      # 貼圖、照片等佔位訊息
+KIND_SYSTEM = "system"    # 通話、收回訊息、群組事件等系統訊息
+KINDS = (KIND_TEXT, KIND_MEDIA, KIND_SYSTEM)
+
+# 系統訊息沒有發送者時的 sender_id
+NO_SENDER = -1
+
+# 日期行（2025/04/01(二)、2025/04/01（二）、2025.04.01 星期二）
+DATE_LINE_REGEX = re.compile(r"^\d{4}[./-]\d{1,2}[./-]\d{1,2}\s*(\([^)]*\)|（[^）]*）|[一-龥]+)?$")
+# 訊息行：時間 發送者 內容
+MESSAGE_LINE_REGEX = re.compile(r"^(\d{1,2}:\d{2})[ \t]+(\S+)(?:[ \t]+(.*))?$")
+# 匯出檔標頭
+HEADER_REGEX = re.compile(r"^(\[LINE\]|儲存日期[:：])")
+# 系統訊息（可能出現在發送者欄位或內容中）
+SYSTEM_REGEX = re.compile(
+    r"(開始語音通話|開始視訊通話|語音通話結束|視訊通話結束|未接來電|取消通話|通話時間|"
+    r"已收回訊息|收回了訊息|加入群組|離開群組|已退出群組|邀請.+加入|變更了群組)"
+)
+# 整則內容為媒體佔位：[貼圖]、[照片]、（傳送海邊照片）、Stickers、Photos
+PLACEHOLDER_REGEX = re.compile(
+    r"^(\[[^\]]{1,12}\]|（[^）]{1,30}）|\([^)]{1,30}\)|Stickers?|Photos?|Videos?|Files?|Voice message)$",
+    re.IGNORECASE
+)
+
+Source = Union[str, os.PathLike, TextIO, Iterable[str]]
+
+
+class LineMessage(NamedTuple):
+    """一則訊息"""
+    date: Optional[str]   # 所屬日期行（同一天的訊息共用同一個字串物件）
+    time: str
+    sender_id: int        # LineExportParser.senders 的索引；系統訊息為 NO_SENDER
+    content: str
+    kind: str
+
+
+class LineExportParser:
+    """
+    串流解析器。
+
+    parse() 為產生器，逐則產生 LineMessage；發送者名稱只保存一份（senders），
+    訊息只記錄其索引。解析完成後的統計欄位可用於格式驗證。
+    """
+
+    def __init__(self):
+        self.senders: List[str] = []
+        self._sender_ids: Dict[str, int] = {}
+        self.date_lines = 0
+        self.header_lines = 0
+        self.message_lines = 0
+        self.continuation_lines = 0
+        self.unparsed_lines = 0      # 無法歸屬於任何訊息的行
+        self.lines = 0
+        # 跨行的解析狀態：目前日期與尚未結束的訊息（等待後續行）
+        self._date: Optional[str] = None
+        self._pending: Optional[LineMessage] = None
+        self._extra: List[str] = []
+
+    def sender_id(self, name: str) -> int:
+        """取得發送者 ID，第一次出現時登記"""
+        sender_id = self._sender_ids.get(name)
+        if sender_id is None:
+            sender_id = len(self.senders)
+            self.senders.append(sys.intern(name))
+            self._sender_ids[name] = sender_id
+        return sender_id
+
+    def sender_name(self, sender_id: int) -> str:
+        """發送者名稱；系統訊息為空字串"""
+        return self.senders[sender_id] if sender_id >= 0 else ""
+
+    def parse(self, source: Source) -> Iterator[LineMessage]:
+        """
+        解析 LINE 匯出。
+
+        Args:
+            source: 匯出文字、檔案路徑、已開啟的文字檔或行的可迭代物件
+
+        Yields:
+            LineMessage: 依出現順序的訊息（多行訊息已合併）
+        """
+        for raw in _iter_lines(source):
+            message = self.feed(raw)
+            if message is not None:
+                yield message
+        message = self.close()
+        if message is not None:
+            yield message
+
+    def feed(self, raw: str) -> Optional[LineMessage]:
+        """
+        推入一行（供串流下載等無法以迭代器提供來源的情境）。
+
+        Returns:
+            Optional[LineMessage]: 因這一行而確定結束的上一則訊息；尚未結束時為 None
+        """
+        self.lines += 1
+        line = raw.strip().lstrip("\ufeff")
+        if not line:
+            return None
+        if DATE_LINE_REGEX.match(line):
+            self.date_lines += 1
+            self._date = sys.intern(line)
+            return None
+
+        match = MESSAGE_LINE_REGEX.match(line)
+        if match is None:
+            if HEADER_REGEX.match(line):
+                self.header_lines += 1
+            elif SYSTEM_REGEX.search(line) or PLACEHOLDER_REGEX.match(line):
+                # 沒有時間前綴的系統訊息或媒體佔位
+                self.unparsed_lines += 1
+            elif self._pending is not None and self._pending.kind == KIND_TEXT:
+                # 多行訊息的後續行
+                self.continuation_lines += 1
+                self._extra.append(line)
+            else:
+                self.unparsed_lines += 1
+            return None
+
+        finished = self.close()
+        self.message_lines += 1
+        date = self._date
+        time, sender, content = match.group(1), match.group(2), (match.group(3) or "").strip()
+        if SYSTEM_REGEX.search(line) or not content:
+            # 「23:34 語音通話結束」的系統訊息沒有發送者
+            if content:
+                self._pending = LineMessage(date, time, self.sender_id(sender), content, KIND_SYSTEM)
+            else:
+                self._pending = LineMessage(date, time, NO_SENDER, sender, KIND_SYSTEM)
+        elif PLACEHOLDER_REGEX.match(content):
+            self._pending = LineMessage(date, time, self.sender_id(sender), content, KIND_MEDIA)
+        else:
+            self._pending = LineMessage(date, time, self.sender_id(sender), content, KIND_TEXT)
+        return finished
+
+    def close(self) -> Optional[LineMessage]:
+        """結束目前緩衝的訊息並回傳；沒有緩衝訊息時為 None"""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return None
+        if self._extra:
+            pending = pending._replace(content="\n".join([pending.content, *self._extra]))
+            self._extra = []
+        return pending
+
+    @property
+    def is_valid(self) -> bool:
+        """是否具備 LINE 匯出的基本特徵：多行、至少一個日期行與一則訊息"""
+        return self.lines > 1 and self.date_lines > 0 and self.message_lines > 0
+
+
+class LineExport(NamedTuple):
+    """完整解析結果"""
+    messages: List[LineMessage]
+    senders: List[str]
+    parser: LineExportParser
+
+    def sender_name(self, message: LineMessage) -> str:
+        return self.parser.sender_name(message.sender_id)
+
+    def render(self, message: LineMessage) -> str:
+        """以「時間 發送者 內容」格式輸出單則訊息"""
+        if message.sender_id == NO_SENDER:
+            return f"{message.time} {message.content}"
+        return f"{message.time} {self.parser.sender_name(message.sender_id)} {message.content}"
+
+    def texts(self) -> List[str]:
+        """只保留文字訊息的內容"""
+        return [m.content for m in self.messages if m.kind == KIND_TEXT]
+
+    def iter_lines(self) -> Iterator[str]:
+        """逐行產生標準格式（日期行 + 「時間 發送者 內容」），略過標頭與無法歸屬的行"""
+        date = None
+        for message in self.messages:
+            if message.date is not None and message.date != date:
+                date = message.date
+                yield date
+            yield self.render(message)
+
+    def to_text(self) -> str:
+        """
+        以標準格式輸出（見 iter_lines）。
+        輸出可再次以 parse_line_export 解析出相同的訊息。
+        """
+        return "\n".join(self.iter_lines())
+
+
+def parse_line_export(source: Source) -> LineExport:
+    """
+    解析整份 LINE 匯出。
+
+    Args:
+        source: 匯出文字、檔案路徑、已開啟的文字檔或行的可迭代物件
+
+    Returns:
+        LineExport: 訊息列表、發送者名稱與解析統計
+    """
+    parser = LineExportParser()
+    messages = list(parser.parse(source))
+    return LineExport(messages, parser.senders, parser)
+
+
+def _iter_lines(source: Source) -> Iterator[str]:
+    """逐行走訪來源；字串以 StringIO 走訪，不先切成行列表"""
+    if isinstance(source, str):
+        yield from io.StringIO(source)
+    elif isinstance(source, os.PathLike):
+        with open(source, encoding="utf-8-sig") as f:
+            yield from f
+    else:
+        yield from source
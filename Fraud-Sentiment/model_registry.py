@@ -0,0 +1,133 @@
+"""
+行程共用的模型登錄表
+
+同一個行程內，相同路徑的模型、tokenizer 與 ONNX Runtime session 只載入一次，
+供 classifier_backend（FraudSentimentDetectionStrategy、ClassifierModule）與
+predict_classifier 共用。torch / transformers / onnxruntime 皆在第一次載入時才匯入。
+
+以 gunicorn preload 模式部署時，master 載入的 torch 模型權重由 worker 以 copy-on-write 共用；
+ONNX Runtime session 的執行緒池無法跨 fork 使用，因此每個行程各自建立。
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+_registry: Dict[Hashable, Any] = {}
+_lock = threading.Lock()
+# 每個鍵各自的載入鎖，避免不同模型互相阻塞、同一模型重複載入
+_key_locks: Dict[Hashable, threading.Lock] = {}
+
+
+def get_or_load(key: Hashable, loader: Callable[[], Any]) -> Any:
+    """
+    取得已載入的物件，未載入時呼叫 loader 載入並登錄。
+
+    Args:
+        key: 登錄鍵
+        loader: 載入函數
+
+    Returns:
+        Any: 已登錄的物件
+    """
+    value = _registry.get(key)
+    if value is not None:
+        return value
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        value = _registry.get(key)
+        if value is None:
+            value = loader()
+            _registry[key] = value
+    return value
+
+
+def normalize_path(path: str) -> str:
+    # 本機路徑正規化為絕對路徑；Hugging Face Hub 名稱（如 bert-base-chinese）維持原樣
+    return os.path.abspath(path) if os.path.exists(path) else path
+
+
+def get_tokenizer(path: str) -> Any:
+    """transformers AutoTokenizer（fast 版本優先）"""
+    path = normalize_path(path)
+
+    def load():
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(path)
+
+    return get_or_load(("tokenizer", path), load)
+
+
+def get_fast_tokenizer(path: str, max_length: int) -> Any:
+    """
+    tokenizers 套件的 Tokenizer（不匯入 torch/transformers），已設定截斷與 padding。
+
+    Raises:
+        Exception: 找不到 tokenizer.json 且無法從 Hub 取得時
+    """
+    path = normalize_path(path)
+
+    def load():
+        from tokenizers import Tokenizer
+        file_path = os.path.join(path, "tokenizer.json")
+        tokenizer = Tokenizer.from_file(file_path) if os.path.exists(file_path) else Tokenizer.from_pretrained(path)
+        tokenizer.enable_truncation(max_length=max_length)
+        tokenizer.enable_padding()
+        return tokenizer
+
+    return get_or_load(("fast_tokenizer", path, max_length), load)
+
+
+def get_sequence_classifier(model_dir: str) -> Any:
+    """BertForSequenceClassification（eval 模式）"""
+    model_dir = normalize_path(model_dir)
+
+    def load():
+        from transformers import BertForSequenceClassification
+        model = BertForSequenceClassification.from_pretrained(model_dir)
+        model.eval()
+        return model
+
+    return get_or_load(("sequence_classifier", model_dir), load)
+
+
+def get_onnx_session(onnx_path: str, intra_op_threads: Optional[int] = None) -> Any:
+    """ONNX Runtime InferenceSession（CPU），每個行程各自建立"""
+    onnx_path = os.path.abspath(onnx_path)
+
+    def load():
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("使用 onnx 後端需要安裝 onnxruntime（pip install onnxruntime）") from e
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        return ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    return get_or_load(("onnx_session", onnx_path, intra_op_threads, os.getpid()), load)
+
+
+def loaded_keys() -> List[Hashable]:
+    """目前已登錄的鍵（診斷用）"""
+    return list(_registry)
+
+
+def freeze() -> None:
+    """
+    凍結已載入的 torch 模型（關閉梯度追蹤），於 fork 前呼叫，
+    讓 worker 只讀取權重而不寫入共用頁面。
+    """
+    for key, value in list(_registry.items()):
+        if key[0] == "sequence_classifier":
+            value.eval()
+            value.requires_grad_(False)
+
+
+def clear() -> None:
+    """清空登錄表（測試或重新載入模型時使用）"""
+    with _lock:
+        _registry.clear()
+        _key_locks.clear()
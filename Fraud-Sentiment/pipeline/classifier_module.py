@@ -1,24 +1,23 @@
 from typing import Any, List, Dict, Optional
-from transformers import BertTokenizer, BertForSequenceClassification
-import torch
+from classifier_backend import load_classifier_backend
+from conversation_windows import RULE_MAX
 
 class ClassifierModule:
     """
     三階段分類模組，包裝你現有的 BERT/transformer 分類器
     """
-    def __init__(self, model_dir: str = "finetuned_classifier"):
-        self.tokenizer = BertTokenizer.from_pretrained("bert-base-chinese")
-        self.model = BertForSequenceClassification.from_pretrained(model_dir)
-        self.model.eval()
+    def __init__(self, model_dir: str = "finetuned_classifier", backend: Optional[str] = None,
+                 tokenizer_dir: str = "bert-base-chinese", window_rule: str = RULE_MAX,
+                 max_windows: int = 16):
+        # backend 為 torch 或 onnx，未指定時讀取 CLASSIFIER_BACKEND 環境變數
+        self.backend = load_classifier_backend(model_dir, backend=backend, tokenizer_dir=tokenizer_dir)
+        # 長對話依訊息切窗後彙整（max、mean 或 last_k），視窗數上限限制推論延遲
+        self.window_rule = window_rule
+        self.max_windows = max_windows
 
     def predict(self, text: str, keywords: List[str], sentiment: Dict[str, float], chat_history: Optional[List[str]]) -> str:
         """
         回傳三階段分類標籤
         """
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=64)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            pred = torch.argmax(outputs.logits, dim=-1).item()
-        # 你現有的 label 對應
-        id2label = {0: "安全或初期探索", 1: "情感連結強化疑慮", 2: "高風險詐騙徵兆"}
-        return id2label.get(pred, "未知")
\ No newline at end of file
+        label, _, _ = self.backend.predict_conversation(text, self.window_rule, self.max_windows)
+        return label
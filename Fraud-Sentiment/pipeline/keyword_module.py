@@ -1,14 +1,27 @@
-from typing import List, Set
+from typing import Iterable, List, Optional
+from keyword_automaton import LEXICON, KeywordAutomaton, build_keyword_automaton, get_default_automaton
 
 class KeywordModule:
     """
     關鍵字標註模組
     """
-    def __init__(self, keywords: Set[str]):
-        self.keywords = keywords
+    def __init__(self, keywords: Optional[Iterable[str]] = None, automaton: Optional[KeywordAutomaton] = None):
+        self.keywords = set(LEXICON if keywords is None else keywords)
+        if automaton is None:
+            # 詞庫都在共用自動機中時直接共用，否則以本模組詞庫建立
+            automaton = get_default_automaton()
+            if not all(kw in automaton for kw in self.keywords):
+                automaton = build_keyword_automaton(lexicon=self.keywords, stage_mapping=[])
+        self.automaton = automaton
 
     def match(self, words: List[str]) -> List[str]:
         """
         回傳斷詞結果中命中的關鍵字
         """
-        return [w for w in words if w in self.keywords]
\ No newline at end of file
+        return [w for w in words if w in self.keywords]
+
+    def match_text(self, text: str) -> List[str]:
+        """
+        不經斷詞，直接以自動機單次掃描原文，回傳命中的詞庫關鍵字（依首次出現順序）
+        """
+        return [kw for kw in self.automaton.scan(text).keywords if kw in self.keywords]
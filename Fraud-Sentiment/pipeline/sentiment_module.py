@@ -1,22 +1,31 @@
 from typing import Dict
 from transformers import BertTokenizer, BertForSequenceClassification
 import torch
+from conversation_windows import RULE_MEAN, aggregate, split_windows
 
 class SentimentModule:
     """
     中文情感分析模組，預設用 IDEA-CCNL/Erlangshen-Roberta-330M-Sentiment
     """
-    def __init__(self, model_name: str = 'IDEA-CCNL/Erlangshen-Roberta-330M-Sentiment'):
+    def __init__(self, model_name: str = 'IDEA-CCNL/Erlangshen-Roberta-330M-Sentiment',
+                 max_length: int = 512, max_windows: int = 16, window_rule: str = RULE_MEAN):
         self.tokenizer = BertTokenizer.from_pretrained(model_name)
         self.model = BertForSequenceClassification.from_pretrained(model_name)
         self.model.eval()
+        # 超過 max_length 的長對話依訊息切窗，一次 batch 推論後以 window_rule 彙整
+        self.max_length = max_length
+        self.max_windows = max_windows
+        self.window_rule = window_rule
 
     def predict(self, text: str) -> Dict[str, float]:
         """
         回傳情感分數（positive/negative）
         """
-        inputs = self.tokenizer(text, return_tensors="pt")
+        windows = split_windows(text, self.max_length, self.max_windows)
+        inputs = self.tokenizer(windows, return_tensors="pt", truncation=True, padding=True,
+                                max_length=self.max_length)
         with torch.no_grad():
             outputs = self.model(**inputs)
-            probs = torch.nn.functional.softmax(outputs.logits, dim=-1).squeeze().tolist()
-        return {"negative": probs[0], "positive": probs[1]}
\ No newline at end of file
+            probs = torch.nn.functional.softmax(outputs.logits, dim=-1).numpy()
+        probs = aggregate(probs, self.window_rule).tolist()
+        return {"negative": probs[0], "positive": probs[1]}
@@ -1,18 +1,10 @@
-from transformers import BertTokenizerFast, BertForSequenceClassification
-import torch
 import sys
+from classifier_backend import LABELS, load_classifier_backend
 
-LABELS = ["安全或初期探索", "情感連結強化疑慮", "高風險詐騙徵兆"]
-
-def predict(text: str):
-    tokenizer = BertTokenizerFast.from_pretrained("finetuned_classifier")
-    model = BertForSequenceClassification.from_pretrained("finetuned_classifier")
-    model.eval()
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=64)
-    with torch.no_grad():
-        outputs = model(**inputs)
-        pred = torch.argmax(outputs.logits, dim=1).item()
-    return LABELS[pred]
+def predict(text: str, model_dir: str = "finetuned_classifier"):
+    # 模型經由 model_registry 共用，重複呼叫不會重新載入
+    label, _ = load_classifier_backend(model_dir).predict([text])[0]
+    return label
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
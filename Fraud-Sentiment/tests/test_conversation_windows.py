@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pytest
+from conversation_windows import aggregate, split_messages, split_windows
+
+DIALOG = Path(__file__).resolve().parents[1] / "data" / "complex_dialog.txt"
+
+def test_windows_are_message_aligned_and_within_budget():
+    text = DIALOG.read_text(encoding="utf-8")
+    messages = split_messages(text)
+    windows = split_windows(text, max_length=64, overlap=1)
+    assert len(windows) > 1
+    for window in windows:
+        assert len(window.replace("\n", "")) <= 62
+        for line in window.split("\n"):
+            assert line in messages
+    # 第一則與最後一則訊息都有被涵蓋，日期行被略過
+    assert windows[0].startswith(messages[0])
+    assert windows[-1].endswith(messages[-1])
+    assert not any(line.startswith("2025/") for w in windows for line in w.split("\n"))
+
+def test_long_message_is_split_and_window_cap_keeps_latest():
+    text = "甲" * 150 + "\n" + "最後一句"
+    windows = split_windows(text, max_length=64, overlap=0)
+    assert [len(w.replace("\n", "")) for w in windows] == [62, 62, 30]
+    assert split_windows(text, max_length=64, max_windows=1, overlap=0) == [windows[-1]]
+    assert split_windows("短訊息", max_length=64) == ["短訊息"]
+
+def test_aggregation_rules():
+    probs = np.array([[0.9, 0.05, 0.05], [0.2, 0.2, 0.6], [0.7, 0.2, 0.1]])
+    assert aggregate(probs, "max").tolist() == [0.2, 0.2, 0.6]
+    assert np.allclose(aggregate(probs, "mean"), probs.mean(axis=0))
+    assert np.allclose(aggregate(probs, "last_k", last_k=2), probs[1:].mean(axis=0))
+    with pytest.raises(ValueError):
+        aggregate(probs, "median")
+
+def test_windows_from_parsed_export_skip_headers_and_keep_messages_whole():
+    from line_export import parse_line_export
+    text = "[LINE] 與小明的聊天記錄\n2025/04/01(二)\n21:03 小明 第一行\n第二行\n21:05 雅婷 好"
+    export = parse_line_export(text)
+    assert split_messages(export) == ["21:03 小明 第一行\n第二行", "21:05 雅婷 好"]
+    assert split_windows(export, max_length=64) == ["21:03 小明 第一行\n第二行\n21:05 雅婷 好"]
@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import re
+from keyword_automaton import (
+    LEXICON, KeywordAutomaton, build_keyword_automaton, get_default_automaton, TAG_LEXICON, TAG_SCAM, TAG_STAGE
+)
+from theory_stage_classifier import classify_stage, classify_stage_ids
+
+def test_overlapping_hits_match_brute_force():
+    keywords = ["匯款", "再匯一次", "匯一次", "款項", "一次"]
+    automaton = KeywordAutomaton()
+    for kw in keywords:
+        automaton.add(kw)
+    text = "請你再匯一次款項，匯款後通知我，再匯一次就好"
+    got = sorted((hit.start, hit.keyword) for hit in automaton.iter_hits(text))
+    expected = sorted((m.start(), kw) for kw in keywords for m in re.finditer(f"(?={kw})", text))
+    assert got == expected
+    for hit in automaton.iter_hits(text):
+        assert text[hit.start:hit.end] == hit.keyword
+
+def test_cjk_without_spaces_and_ascii_word_boundary():
+    automaton = build_keyword_automaton(scam_keywords=["投資", "usdt", "eth"])
+    scan = automaton.scan("寶貝我們一起投資USDT吧，不是ethics也不是eth2，是ETH")
+    assert scan.keywords_with_tag(automaton, TAG_SCAM) == ["投資", "usdt", "eth"]
+    assert scan.counts["eth"] == 1
+
+def test_stage_ids_agree_with_classify_stage():
+    automaton = build_keyword_automaton()
+    text = "寶貝我很想你，可以幫忙匯款嗎？還有保證金要付"
+    scan = automaton.scan(text)
+    stage_keywords = set(scan.keywords_with_tag(automaton, TAG_STAGE))
+    assert stage_keywords == {"寶貝", "想你", "很想你", "幫忙匯款", "匯款", "保證金"}
+    assert classify_stage_ids(scan.stage_ids) == classify_stage(stage_keywords)
+    assert classify_stage_ids([]) == "未明確分類"
+
+def test_default_automaton_is_shared_and_merges_all_sources():
+    automaton = get_default_automaton()
+    assert get_default_automaton() is automaton
+    assert all(TAG_LEXICON in automaton.tags_of(kw) for kw in LEXICON)
+    assert TAG_STAGE in automaton.tags_of("保證金")
+    assert any(TAG_SCAM in automaton.tags_of(kw) for kw in LEXICON | {"保證", "獲利"})
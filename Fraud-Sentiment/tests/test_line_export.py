@@ -0,0 +1,60 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from line_export import KIND_MEDIA, KIND_SYSTEM, KIND_TEXT, NO_SENDER, LineExportParser, parse_line_export
+
+DIALOG = Path(__file__).resolve().parents[1] / "data" / "complex_dialog.txt"
+
+def test_records_carry_date_kind_and_interned_sender():
+    with DIALOG.open(encoding="utf-8") as f:
+        export = parse_line_export(f)
+    assert export.parser.is_valid
+    assert export.senders == ["雅婷", "安杰"]
+    first = export.messages[0]
+    assert (first.date, first.time, export.sender_name(first)) == ("2025/04/01(二)", "21:03", "雅婷")
+
+    by_content = {m.content: m for m in export.messages}
+    assert by_content["（傳送海邊照片）"].kind == KIND_MEDIA
+    assert by_content["開始語音通話"].kind == KIND_SYSTEM
+    assert by_content["語音通話結束"].sender_id == NO_SENDER
+    assert all(not m.content.startswith("2025/") for m in export.messages)
+    assert "（傳送海邊照片）" not in export.texts() and "開始語音通話" not in export.texts()
+
+def test_string_source_merges_continuations_and_counts_non_message_lines():
+    text = "\n".join([
+        "[LINE] 與小明的聊天記錄",
+        "儲存日期：2025/04/22 10:00",
+        "",
+        "2025.04.21 星期一",
+        "10:00\t小明\t第一行",
+        "第二行",
+        "10:01 小明 [貼圖]",
+        "不屬於任何訊息",
+        "10:02 小華 好",
+    ])
+    parser = LineExportParser()
+    messages = list(parser.parse(text))
+    assert [m.content for m in messages] == ["第一行\n第二行", "[貼圖]", "好"]
+    assert [m.kind for m in messages] == [KIND_TEXT, KIND_MEDIA, KIND_TEXT]
+    assert messages[0].date == "2025.04.21 星期一"
+    assert (parser.header_lines, parser.unparsed_lines, parser.continuation_lines) == (2, 1, 1)
+    assert parser.senders == ["小明", "小華"]
+
+def test_single_line_or_missing_date_is_not_a_valid_export():
+    for text in ("10:00 小明 哈囉", "10:00 小明 哈囉\n10:01 小華 嗨", "2025/04/01(二)\n沒有時間的內容"):
+        parser = LineExportParser()
+        list(parser.parse(text))
+        assert not parser.is_valid
+
+def test_feed_matches_parse_and_text_round_trips():
+    text = DIALOG.read_text(encoding="utf-8")
+    export = parse_line_export(text)
+    parser = LineExportParser()
+    fed = [m for m in map(parser.feed, text.split("\n")) if m is not None]
+    fed.append(parser.close())
+    assert fed == export.messages
+    assert parser.close() is None
+
+    again = parse_line_export(export.to_text())
+    assert again.messages == export.messages and again.senders == export.senders
@@ -0,0 +1,58 @@
+import sys
+import os
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("onnxruntime")
+
+from classifier_backend import (
+    ONNX_DIRNAME, ONNX_FP32_FILENAME, ONNX_INT8_FILENAME,
+    TorchClassifierBackend, OnnxClassifierBackend,
+)
+
+ROOT = Path(__file__).resolve().parents[1]
+MODEL_DIR = Path(os.getenv("CLASSIFIER_MODEL_DIR", ROOT / "finetuned_classifier"))
+
+# (ONNX 檔名, 標籤一致率下限, 可信度最大漂移)
+TOLERANCES = [
+    (ONNX_FP32_FILENAME, 1.0, 1e-3),
+    (ONNX_INT8_FILENAME, 0.95, 0.05),
+]
+
+def _sample_texts():
+    texts = []
+    for name in ("simple_dialog.txt", "complex_dialog.txt"):
+        with open(ROOT / "data" / name, encoding="utf-8") as f:
+            texts.extend(line.strip() for line in f if line.strip())
+    return texts
+
+@pytest.fixture(scope="module")
+def torch_predictions():
+    if not MODEL_DIR.exists():
+        pytest.skip(f"找不到模型資料夾 {MODEL_DIR}")
+    texts = _sample_texts()
+    backend = TorchClassifierBackend(str(MODEL_DIR))
+    return texts, backend.predict_proba(texts)
+
+@pytest.mark.parametrize("filename,min_agreement,max_drift", TOLERANCES)
+def test_onnx_matches_torch(torch_predictions, filename, min_agreement, max_drift):
+    onnx_path = MODEL_DIR / ONNX_DIRNAME / filename
+    if not onnx_path.exists():
+        pytest.skip(f"找不到 {onnx_path}，請先執行 export_onnx.py")
+    texts, expected = torch_predictions
+    actual = OnnxClassifierBackend(str(MODEL_DIR), onnx_path=str(onnx_path)).predict_proba(texts)
+
+    expected_labels = expected.argmax(axis=1)
+    agreement = (actual.argmax(axis=1) == expected_labels).mean()
+    # 以 PyTorch 預測標籤的機率比較可信度漂移
+    rows = np.arange(len(texts))
+    drift = abs(actual[rows, expected_labels] - expected[rows, expected_labels]).max()
+
+    print(f"{filename}: 標籤一致率 {agreement:.3f}，可信度最大漂移 {drift:.4f}")
+    assert agreement >= min_agreement
+    assert drift <= max_drift
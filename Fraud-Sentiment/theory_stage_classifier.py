@@ -1,4 +1,4 @@
-from typing import Set, Dict, List
+from typing import Set, Dict, List, Iterable
 
 # 七階段/五階段詐騙理論對應表
 STAGE_MAPPING: List[Dict] = [
@@ -44,6 +44,16 @@ def classify_stage(keywords: Set[str]) -> str:
             break
     return matched_stage or "未明確分類"
 
+def classify_stage_ids(stage_ids: Iterable[int]) -> str:
+    """
+    根據命中的 STAGE_MAPPING 索引判斷詐騙階段（取最進階者）。
+    供關鍵字自動機（keyword_automaton）掃描結果使用，結果與 classify_stage 一致。
+    """
+    stage_ids = list(stage_ids)
+    if not stage_ids:
+        return "未明確分類"
+    return STAGE_MAPPING[max(stage_ids)]["stage"]
+
 if __name__ == "__main__":
     # 測試範例
     test_keywords = {"匯款", "帳戶", "金額"}
@@ -3,6 +3,7 @@ import os
 from typing import List, Set, Dict
 
 from ckip_transformers.nlp import CkipWordSegmenter
+from keyword_automaton import LEXICON
 
 # 設定 logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,9 +18,7 @@ TEST_SENTENCES: List[str] = [
     "我只信你，除了你我沒別人了。"
 ]
 
-KEYWORDS: Set[str] = {
-    "匯款", "帳戶", "金額", "投資", "虛擬貨幣", "穩賺不賠", "寶貝", "很急", "快點", "轉帳", "款項", "單身", "我只信你"
-}
+KEYWORDS: Set[str] = set(LEXICON)
 
 def segment_sentences(sentences: List[str]) -> List[List[str]]:
     """使用 CKIP 斷詞模型對句子列表進行斷詞。"""
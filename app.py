@@ -3,38 +3,30 @@ print("👉 This is integratescambot-main version")
 from flask import Flask, jsonify
 from config import Config
 from utils.logger import app_logger as logger
-from utils.error_handler import AppError, ConfigError
-from services.conversation_service import ConversationService
-from services.domain.detection.detection_service import DetectionService
-from clients.line_client import LineClient
-from clients.analysis_api import AnalysisApiClient
-from bot.line_webhook import line_webhook, LineWebhookHandler
+from utils.error_handler import AppError
+from utils.metrics import metrics
+from bootstrap import load_config, build_webhook_handler
+from bot.line_webhook import line_webhook
+from bot.event_dispatcher import EventDispatcher
 
 def create_app():
     app = Flask(__name__)
 
-    # 載入 .env
-    from dotenv import load_dotenv
-    load_dotenv()
+    # 載入 .env 並驗證設定
+    load_config()
 
-    # 驗證設定
-    try:
-        Config.validate()
-    except ValueError as e:
-        raise ConfigError(f"配置錯誤: {str(e)}", original_error=e)
-
-    # 初始化 line client
-    line_client = LineClient(Config.LINE_CHANNEL_ACCESS_TOKEN)
+    # 初始化 client、service 與 handler
+    webhook_handler = build_webhook_handler()
 
-    # 初始化分析 API client（可選）
-    analysis_client = None
-    if Config.ANALYSIS_API_URL:
-        analysis_client = AnalysisApiClient(Config.ANALYSIS_API_URL)
-
-    # 初始化 service 與 handler
-    detection_service = DetectionService(analysis_client)
-    conversation_service = ConversationService(detection_service=detection_service, line_client=line_client)
-    webhook_handler = LineWebhookHandler(conversation_service=conversation_service, channel_secret=Config.LINE_CHANNEL_SECRET)
+    # 非同步模式：事件放入有界佇列，由工作執行緒池處理
+    if Config.WEBHOOK_ASYNC_MODE:
+        webhook_handler.dispatcher = EventDispatcher(
+            process_fn=webhook_handler.process_events,
+            num_workers=Config.WEBHOOK_WORKERS,
+            max_queue_size=Config.WEBHOOK_QUEUE_SIZE,
+            overflow_policy=Config.WEBHOOK_OVERFLOW_POLICY
+        )
+        logger.info("Webhook 以非同步佇列模式運行")
 
     # 將 handler 設定到藍圖
     line_webhook.webhook_handler = webhook_handler
@@ -64,6 +56,11 @@ def create_app():
             }
         })
 
+    # 執行期指標（佇列深度、等待時間等）
+    @app.route("/metrics")
+    def metrics_snapshot():
+        return jsonify(metrics.snapshot())
+
     return app
 
 # 啟動 Flask
@@ -0,0 +1,89 @@
+"""
+ASGI 入口
+
+以 FastAPI 提供與 app.py 相同的端點，但 webhook、對話服務、LINE 客戶端、
+分析 API 客戶端與 agent 皆以非同步方式執行，單一行程即可同時持有大量
+進行中的 LLM / LINE 呼叫，不需每個請求佔用一個執行緒。
+
+啟動：
+    uvicorn asgi:app --host 0.0.0.0 --port 10000
+"""
+
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from config import Config
+from utils.logger import app_logger as logger
+from utils.error_handler import AppError
+from utils.metrics import metrics
+from bootstrap import load_config, build_webhook_handler
+from bot.line_webhook_asgi import line_webhook_router
+from clients.http_transport import get_shared_transport
+
+
+def create_asgi_app() -> FastAPI:
+    # 載入 .env 並驗證設定
+    load_config()
+
+    # 初始化 client、service 與 handler
+    webhook_handler = build_webhook_handler()
+
+    # 非同步模式：排程背景協程後立即回應，上限沿用佇列大小設定
+    if Config.WEBHOOK_ASYNC_MODE:
+        webhook_handler.max_background_tasks = Config.WEBHOOK_QUEUE_SIZE
+        logger.info("Webhook 以背景協程模式運行")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        # 關閉共用的非同步 HTTP 連線池
+        await get_shared_transport().aclose()
+
+    app = FastAPI(lifespan=lifespan)
+
+    # 將 handler 設定到路由
+    line_webhook_router.webhook_handler = webhook_handler
+    app.include_router(line_webhook_router)
+
+    # 錯誤處理器
+    @app.exception_handler(AppError)
+    async def handle_app_error(request: Request, error: AppError):
+        return JSONResponse(error.to_dict(), status_code=error.status_code)
+
+    # 健康檢查
+    @app.get("/")
+    async def index():
+        return PlainTextResponse("詐騙檢測機器人正在執行中!")
+
+    @app.get("/health")
+    async def health_check():
+        return {
+            "status": "ok",
+            "services": {
+                "line_client": "ok",
+                "detection_service": "ok"
+            }
+        }
+
+    # 執行期指標
+    @app.get("/metrics")
+    async def metrics_snapshot():
+        return metrics.snapshot()
+
+    return app
+
+
+# 啟動 ASGI
+try:
+    app = create_asgi_app()
+except Exception as e:
+    logger.critical(f"無法創建 ASGI 應用程式: {str(e)}")
+    raise
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = Config.PORT
+    logger.info(f"詐騙檢測機器人（ASGI）啟動於埠口 {port}")
+    uvicorn.run(app, host="0.0.0.0", port=port)
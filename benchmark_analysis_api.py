@@ -0,0 +1,91 @@
+"""
+比較分析 API 單筆請求與批次請求在並行負載下的吞吐量與延遲。
+
+以本地替身伺服器（clients/analysis_stub_server.py）模擬外部分析 API，
+多個執行緒同時經由 ApiDetectionStrategy 送出訊息。
+
+用法：
+    python benchmark_analysis_api.py
+    python benchmark_analysis_api.py --concurrency 32 --messages 2000 --overhead-ms 20 --server-workers 4 --linger-ms 5
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from clients.analysis_api import AnalysisApiClient
+from clients.analysis_stub_server import ANALYZE_PATH, BATCH_PATH, start_stub_server
+from clients.http_transport import HttpTransport
+from services.domain.detection.api_detection import ApiDetectionStrategy
+
+SAMPLE_MESSAGES = [
+    "寶貝，你現在方便匯款嗎？",
+    "最近我對投資有點興趣，你可以教我嗎",
+    "你好呀！今天過得如何？",
+    "這個平台保證獲利，先入金就能提領",
+]
+
+
+def run(base_url: str, server, batched: bool, args) -> Dict:
+    """以指定模式送出所有訊息並統計結果"""
+    transport = HttpTransport(pool_maxsize=max(args.concurrency, 10))
+    client = AnalysisApiClient(
+        base_url + ANALYZE_PATH,
+        transport=transport,
+        batch_url=base_url + BATCH_PATH if batched else None,
+        batch_max_size=args.batch_size,
+        batch_linger_ms=args.linger_ms
+    )
+    strategy = ApiDetectionStrategy(client, fallback="none")
+    stats = server.app.config["STUB_STATS"]
+    requests_before = stats["requests"]
+
+    def call(i: int) -> float:
+        start = time.perf_counter()
+        strategy.analyze(SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)], user_id=f"U{i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies: List[float] = sorted(pool.map(call, range(args.messages)))
+    elapsed = time.perf_counter() - start
+    if client.batcher is not None:
+        client.batcher.close()
+    transport.close()
+
+    return {
+        "mode": "batch" if batched else "single",
+        "throughput": args.messages / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "http_requests": stats["requests"] - requests_before,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="分析 API 單筆與批次請求比較")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--linger-ms", type=float, default=5.0)
+    parser.add_argument("--overhead-ms", type=float, default=20.0, help="替身伺服器每次請求的固定開銷")
+    parser.add_argument("--per-item-ms", type=float, default=1.0, help="替身伺服器每則訊息的處理時間")
+    parser.add_argument("--server-workers", type=int, default=4, help="替身伺服器同時處理的請求數")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(
+        overhead_ms=args.overhead_ms, per_item_ms=args.per_item_ms, workers=args.server_workers
+    )
+    try:
+        print(f"{'mode':<8}{'msg/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'HTTP 請求':>12}")
+        for batched in (False, True):
+            r = run(base_url, server, batched, args)
+            print(f"{r['mode']:<8}{r['throughput']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['http_requests']:>12}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+應用程式組裝模組
+
+建立 LINE 客戶端、檢測服務、對話服務與 webhook 處理器，
+供 Flask（app.py）與 ASGI（asgi.py）兩種入口共用。
+"""
+
+from config import Config
+from utils.error_handler import ConfigError
+from services.conversation_service import ConversationService
+from services.profile_service import ProfileService
+from services.export_file_service import ExportFileService
+from services.domain.detection.detection_service import DetectionService
+from services.domain.conversation_state import ConversationStateStore
+from clients.line_client import LineClient
+from clients.analysis_api import AnalysisApiClient
+from utils.circuit_breaker import CircuitBreaker
+from utils.fraud_sentiment import get_default_automaton
+from bot.line_webhook import LineWebhookHandler
+from bot.dedupe_store import create_dedupe_store
+
+
+def load_config() -> None:
+    """
+    載入 .env 並驗證設定。
+
+    Raises:
+        ConfigError: 如果必要設定缺失
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    try:
+        Config.validate()
+    except ValueError as e:
+        raise ConfigError(f"配置錯誤: {str(e)}", original_error=e)
+
+
+def build_webhook_handler() -> LineWebhookHandler:
+    """
+    建立 webhook 處理器及其依賴的客戶端與服務。
+
+    Returns:
+        LineWebhookHandler: 已組裝完成的處理器
+    """
+    # 行程共用的關鍵字自動機：啟動時建立一次，各檢測策略與對話狀態共用
+    keyword_automaton = get_default_automaton()
+
+    # 初始化 line client
+    line_client = LineClient(Config.LINE_CHANNEL_ACCESS_TOKEN)
+
+    # 初始化分析 API client（可選）
+    analysis_client = None
+    if Config.ANALYSIS_API_URL:
+        breaker = None
+        if Config.ANALYSIS_API_BREAKER:
+            breaker = CircuitBreaker(
+                "analysis_api",
+                window_seconds=Config.ANALYSIS_API_BREAKER_WINDOW,
+                min_calls=Config.ANALYSIS_API_BREAKER_MIN_CALLS,
+                error_rate_threshold=Config.ANALYSIS_API_BREAKER_ERROR_RATE,
+                slow_call_seconds=Config.ANALYSIS_API_BREAKER_SLOW_SECONDS or None,
+                slow_rate_threshold=Config.ANALYSIS_API_BREAKER_SLOW_RATE,
+                open_seconds=Config.ANALYSIS_API_BREAKER_OPEN_SECONDS
+            )
+        analysis_client = AnalysisApiClient(
+            Config.ANALYSIS_API_URL,
+            breaker=breaker,
+            hedge=Config.ANALYSIS_API_HEDGE,
+            hedge_min_samples=Config.ANALYSIS_API_HEDGE_MIN_SAMPLES,
+            batch_url=Config.ANALYSIS_API_BATCH_URL or None,
+            batch_max_size=Config.ANALYSIS_API_BATCH_MAX_SIZE,
+            batch_linger_ms=Config.ANALYSIS_API_BATCH_LINGER_MS,
+            batch_timeout=Config.ANALYSIS_API_BATCH_TIMEOUT
+        )
+
+    # 使用者對話狀態（可停用）
+    conversation_states = None
+    if Config.CONVERSATION_STATE_USERS > 0:
+        conversation_states = ConversationStateStore(
+            max_users=Config.CONVERSATION_STATE_USERS,
+            ttl=Config.CONVERSATION_STATE_TTL,
+            history_size=Config.CONVERSATION_HISTORY_SIZE,
+            half_life=Config.CONVERSATION_RISK_HALF_LIFE,
+            alpha=Config.CONVERSATION_RISK_ALPHA,
+            alert_threshold=Config.CONVERSATION_ALERT_THRESHOLD,
+            automaton=keyword_automaton
+        )
+
+    # 初始化 service 與 handler
+    detection_service = DetectionService(
+        analysis_client,
+        cache_size=Config.DETECTION_CACHE_SIZE,
+        cache_ttl=Config.DETECTION_CACHE_TTL,
+        cache_path=Config.DETECTION_CACHE_PATH or None,
+        cache_disk_size=Config.DETECTION_CACHE_DISK_SIZE,
+        conversation_states=conversation_states
+    )
+    profile_service = ProfileService(
+        line_client,
+        max_size=Config.PROFILE_CACHE_SIZE,
+        ttl=Config.PROFILE_CACHE_TTL,
+        negative_ttl=Config.PROFILE_CACHE_NEGATIVE_TTL
+    )
+    export_file_service = ExportFileService(
+        line_client,
+        max_bytes=Config.EXPORT_FILE_MAX_BYTES,
+        chunk_size=Config.EXPORT_FILE_CHUNK_BYTES
+    )
+    conversation_service = ConversationService(
+        detection_service=detection_service,
+        line_client=line_client,
+        profile_service=profile_service,
+        export_file_service=export_file_service,
+        reply_deadline=Config.REPLY_DEADLINE_SECONDS,
+        detection_workers=Config.DETECTION_WORKERS
+    )
+    dedupe_store = create_dedupe_store(
+        backend=Config.EVENT_DEDUPE_BACKEND,
+        path=Config.EVENT_DEDUPE_PATH,
+        max_size=Config.EVENT_DEDUPE_MAX_SIZE,
+        ttl=Config.EVENT_DEDUPE_TTL
+    )
+    return LineWebhookHandler(
+        conversation_service=conversation_service,
+        channel_secret=Config.LINE_CHANNEL_SECRET,
+        dedupe_store=dedupe_store,
+        max_concurrency=Config.WEBHOOK_EVENT_CONCURRENCY
+    )
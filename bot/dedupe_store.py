@@ -0,0 +1,182 @@
+"""
+Webhook 事件去重儲存
+
+此模組記錄已處理的 webhookEventId，避免 LINE 重新傳送的事件被重複分析。
+
+後端：
+- memory: 行程內 LRU/TTL 快取，依插入順序淘汰
+- sqlite: SQLite（WAL 模式）檔案，可跨 gunicorn worker 共用並在重啟後保留
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from utils.cache import TTLCache
+from utils.logger import get_api_logger
+from utils.error_handler import ConfigError
+
+# 取得模組特定的日誌記錄器
+logger = get_api_logger("dedupe_store")
+
+
+class DedupeStore(ABC):
+    """事件去重儲存介面"""
+
+    @abstractmethod
+    def check_and_add(self, event_id: str) -> bool:
+        """
+        檢查事件 ID 是否已處理，若未處理則記錄之（原子操作）。
+
+        Args:
+            event_id: webhookEventId
+
+        Returns:
+            bool: 首次出現則為 True，已處理過則為 False
+        """
+
+    @abstractmethod
+    def __contains__(self, event_id: str) -> bool:
+        """事件 ID 是否已記錄"""
+
+
+class InMemoryDedupeStore(DedupeStore):
+    """行程內去重儲存，依插入順序與 TTL 淘汰"""
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = 86400):
+        """
+        Args:
+            max_size: 最多記錄的事件數
+            ttl: 事件 ID 保留秒數
+        """
+        self._cache = TTLCache(max_size=max_size, ttl=ttl, refresh_on_get=False)
+
+    def check_and_add(self, event_id: str) -> bool:
+        return self._cache.add(event_id)
+
+    def __contains__(self, event_id: str) -> bool:
+        return event_id in self._cache
+
+
+class SQLiteDedupeStore(DedupeStore):
+    """
+    以 SQLite WAL 檔案實作的跨行程去重儲存。
+
+    每個執行緒使用各自的連線；INSERT ... ON CONFLICT 讓檢查與寫入在
+    單一陳述式中完成，多個 worker 同時收到同一事件時只有一個會成功。
+    """
+
+    # 每寫入多少筆清理一次過期與超量資料
+    PURGE_INTERVAL = 500
+
+    def __init__(self, path: str, max_size: int = 100000, ttl: Optional[float] = 86400):
+        """
+        Args:
+            path: SQLite 檔案路徑
+            max_size: 最多保留的事件數
+            ttl: 事件 ID 保留秒數
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed_events ("
+            "event_id TEXT PRIMARY KEY, created_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_processed_events_created_at "
+            "ON processed_events(created_at)"
+        )
+        logger.info(f"事件去重儲存使用 SQLite: {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """取得目前執行緒（與行程）專用的連線"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expired_before(self, now: float) -> float:
+        return now - self.ttl if self.ttl is not None else float("-inf")
+
+    def check_and_add(self, event_id: str) -> bool:
+        now = time.time()
+        conn = self._connect()
+        # 不存在則插入；已存在但過期則視為新事件並更新時間
+        cursor = conn.execute(
+            "INSERT INTO processed_events (event_id, created_at) VALUES (?, ?) "
+            "ON CONFLICT(event_id) DO UPDATE SET created_at = excluded.created_at "
+            "WHERE processed_events.created_at < ?",
+            (event_id, now, self._expired_before(now))
+        )
+        is_new = cursor.rowcount == 1
+        if is_new:
+            self._maybe_purge(conn, now)
+        return is_new
+
+    def __contains__(self, event_id: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM processed_events WHERE event_id = ? AND created_at >= ?",
+            (event_id, self._expired_before(time.time()))
+        ).fetchone()
+        return row is not None
+
+    def _maybe_purge(self, conn: sqlite3.Connection, now: float) -> None:
+        """定期移除過期資料，並依插入時間淘汰超出上限的最舊資料"""
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.PURGE_INTERVAL:
+                return
+        try:
+            conn.execute("DELETE FROM processed_events WHERE created_at < ?",
+                         (self._expired_before(now),))
+            conn.execute(
+                "DELETE FROM processed_events WHERE event_id IN ("
+                "SELECT event_id FROM processed_events ORDER BY created_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"清理事件去重資料時發生錯誤: {str(e)}")
+
+
+def create_dedupe_store(backend: str = "memory", path: Optional[str] = None,
+                        max_size: int = 10000, ttl: Optional[float] = 86400) -> DedupeStore:
+    """
+    依設定建立去重儲存。
+
+    Args:
+        backend: memory 或 sqlite
+        path: SQLite 檔案路徑（backend 為 sqlite 時必要）
+        max_size: 最多記錄的事件數
+        ttl: 事件 ID 保留秒數
+
+    Returns:
+        DedupeStore: 去重儲存實例
+
+    Raises:
+        ConfigError: 如果後端設定無效
+    """
+    backend = (backend or "memory").lower()
+    if backend == "memory":
+        return InMemoryDedupeStore(max_size=max_size, ttl=ttl)
+    if backend == "sqlite":
+        if not path:
+            raise ConfigError("使用 sqlite 去重儲存時，EVENT_DEDUPE_PATH 是必要的")
+        return SQLiteDedupeStore(path, max_size=max_size, ttl=ttl)
+    raise ConfigError(f"不支援的事件去重後端: {backend}")
@@ -0,0 +1,180 @@
+"""
+Webhook 事件派送器
+
+此模組提供有界的行程內佇列與工作執行緒池。
+/callback 驗證簽名後只需將事件放入佇列並立即回應 200，
+由背景工作執行緒負責檢測與回覆，避免 LLM 呼叫佔住 HTTP 工作者。
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from utils.logger import get_api_logger
+from utils.metrics import metrics
+
+# 取得模組特定的日誌記錄器
+logger = get_api_logger("event_dispatcher")
+
+# 佇列已滿時的處理策略
+OVERFLOW_REJECT = "reject"            # 拒絕新事件，由呼叫端回應 503 讓 LINE 重新傳送
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # 丟棄佇列中最舊的事件，接受新事件
+OVERFLOW_DROP_NEWEST = "drop_newest"  # 丟棄新事件，仍回應 200
+OVERFLOW_POLICIES = (OVERFLOW_REJECT, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+# 停止工作執行緒用的哨兵
+_STOP = object()
+
+
+class EventDispatcher:
+    """有界佇列 + 工作執行緒池，非同步處理 webhook 事件"""
+
+    def __init__(self,
+                 process_fn: Callable[[List[Dict[str, Any]]], None],
+                 num_workers: int = 4,
+                 max_queue_size: int = 100,
+                 overflow_policy: str = OVERFLOW_REJECT):
+        """
+        初始化事件派送器。
+
+        Args:
+            process_fn: 處理一批事件的函數（通常為 LineWebhookHandler.process_events）
+            num_workers: 工作執行緒數量
+            max_queue_size: 佇列最大長度
+            overflow_policy: 佇列已滿時的策略（reject / drop_oldest / drop_newest）
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"不支援的佇列溢出策略: {overflow_policy}")
+
+        self.process_fn = process_fn
+        self.num_workers = max(1, num_workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self.overflow_policy = overflow_policy
+
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._owner_pid = None
+
+        self._depth = metrics.gauge("webhook.queue.depth")
+        self._wait_time = metrics.histogram("webhook.queue.wait_seconds")
+        self._process_time = metrics.histogram("webhook.queue.process_seconds")
+        self._enqueued = metrics.counter("webhook.queue.enqueued")
+        self._rejected = metrics.counter("webhook.queue.rejected")
+        self._dropped = metrics.counter("webhook.queue.dropped")
+        self._failed = metrics.counter("webhook.queue.failed")
+
+    def start(self) -> None:
+        """
+        啟動工作執行緒。
+
+        執行緒在 fork 後不會被繼承，因此會記錄擁有者 PID，
+        在子行程（例如 gunicorn worker）第一次提交時重新啟動。
+        """
+        with self._lock:
+            if self._owner_pid == os.getpid() and self._workers:
+                return
+            self._owner_pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._workers = []
+            for i in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"webhook-worker-{i}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+            logger.info(
+                f"事件派送器已啟動：{self.num_workers} 個工作執行緒，"
+                f"佇列上限 {self.max_queue_size}，溢出策略 {self.overflow_policy}"
+            )
+
+    def submit(self, events: List[Dict[str, Any]]) -> bool:
+        """
+        將一批事件放入佇列。
+
+        Args:
+            events: 同一次 webhook 傳遞中的事件列表
+
+        Returns:
+            bool: 事件被接受（或依策略丟棄）則為 True；策略為 reject 且佇列已滿時為 False
+        """
+        self.start()
+        item = (time.monotonic(), events)
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow_policy == OVERFLOW_REJECT:
+                self._rejected.inc()
+                logger.warning(f"事件佇列已滿（{self.max_queue_size}），拒絕 {len(events)} 個事件")
+                return False
+
+            if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+                self._dropped.inc(len(events))
+                logger.warning(f"事件佇列已滿，丟棄新進的 {len(events)} 個事件")
+                return True
+
+            # drop_oldest：移出最舊的一筆再放入新事件
+            try:
+                _, dropped_events = self._queue.get_nowait()
+                self._queue.task_done()
+                self._dropped.inc(len(dropped_events))
+                logger.warning(f"事件佇列已滿，丟棄最舊的 {len(dropped_events)} 個事件")
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._dropped.inc(len(events))
+                logger.warning(f"事件佇列仍滿，丟棄新進的 {len(events)} 個事件")
+                return True
+
+        self._enqueued.inc(len(events))
+        self._depth.set(self._queue.qsize())
+        return True
+
+    def queue_depth(self) -> int:
+        """目前佇列中等待處理的批次數量"""
+        return self._queue.qsize()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        停止工作執行緒，等待佇列中已接受的事件處理完畢。
+
+        Args:
+            timeout: 每個工作執行緒的最長等待秒數
+        """
+        with self._lock:
+            workers = self._workers
+            self._workers = []
+        for _ in workers:
+            self._queue.put(_STOP)
+        for worker in workers:
+            worker.join(timeout)
+        logger.info("事件派送器已停止")
+
+    def _worker_loop(self) -> None:
+        """工作執行緒主迴圈：取出事件並呼叫處理函數"""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                enqueued_at, events = item
+                self._depth.set(self._queue.qsize())
+                self._wait_time.observe(time.monotonic() - enqueued_at)
+
+                start = time.perf_counter()
+                try:
+                    self.process_fn(events)
+                except Exception as e:
+                    self._failed.inc()
+                    logger.error(f"背景處理 webhook 事件時發生錯誤: {str(e)}")
+                finally:
+                    self._process_time.observe(time.perf_counter() - start)
+            finally:
+                self._queue.task_done()
@@ -12,8 +12,14 @@ from typing import Dict, List, Any, Optional
 from flask import Blueprint, request, abort, jsonify
 import json
 from utils.logger import get_api_logger
-from utils.error_handler import AppError, LineError, with_error_handling
+from utils.error_handler import AppError, LineError, with_error_handling, with_async_error_handling
 from services.conversation_service import ConversationService
+from bot.event_dispatcher import EventDispatcher
+from bot.dedupe_store import DedupeStore, InMemoryDedupeStore
+from utils.metrics import metrics
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
 import hashlib
 import hmac
 import base64
@@ -27,6 +33,9 @@ line_webhook = Blueprint('line_webhook', __name__)
 # 對藍圖添加處理器屬性
 line_webhook.webhook_handler = None 
 
+# 使用者鎖分段數量，同一使用者的事件會取得同一把鎖以維持順序
+USER_LOCK_STRIPES = 64
+
 # === API 端點定義 ===
 @line_webhook.route("/callback", methods=["POST"])
 def callback():
@@ -66,19 +75,36 @@ def callback():
 class LineWebhookHandler:
     """LINE webhook 事件的處理器。"""
 
-    # 用於儲存已處理的事件ID，避免重複處理
-    _processed_event_ids = set()
-    
-    def __init__(self, conversation_service: ConversationService, channel_secret: str):
+    def __init__(self, conversation_service: ConversationService, channel_secret: str,
+                 dispatcher: Optional[EventDispatcher] = None,
+                 dedupe_store: Optional[DedupeStore] = None,
+                 max_concurrency: int = 8,
+                 max_background_tasks: Optional[int] = None):
         """
         初始化 webhook 處理器。
         
         Args:
             conversation_service: 處理對話的服務
             channel_secret: LINE 渠道密鑰用於請求驗證
+            dispatcher: 可選的事件派送器；設定後事件改為放入佇列非同步處理
+            dedupe_store: 記錄已處理事件ID的儲存，避免重複處理；預設為行程內儲存
+            max_concurrency: 同時處理不同使用者事件的最大執行緒數
+            max_background_tasks: ASGI 模式下背景處理的最大批次數；設定後
+                handle_webhook_async 會排程背景協程並立即回應
         """
         self.conversation_service = conversation_service
         self.channel_secret = channel_secret
+        self.dispatcher = dispatcher
+        self.dedupe_store = dedupe_store or InMemoryDedupeStore()
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(USER_LOCK_STRIPES)]
+        self.max_background_tasks = max_background_tasks
+        self._async_semaphore = None
+        self._async_user_locks = None
+        self._background_tasks = set()
+        self._inflight = metrics.gauge("webhook.background.inflight")
     
     @with_error_handling(reraise=True)
     def handle_webhook(self, request_data: str) -> str:
@@ -92,7 +118,7 @@ class LineWebhookHandler:
             str: 如果成功則返回 'OK'
             
         Raises:
-            LineError: 如果處理過程中發生錯誤
+            LineError: 如果處理過程中發生錯誤，或非同步模式下佇列已滿（503）
         """
         try:
             # 解析 JSON 請求正文
@@ -106,11 +132,18 @@ class LineWebhookHandler:
             if not events:
                 logger.warning("收到的 webhook 不包含事件")
                 return "OK"
-            for event in events:
-                self._process_event(event)
-                
+
+            # 非同步模式：放入佇列後立即回應
+            if self.dispatcher is not None:
+                if not self.dispatcher.submit(events):
+                    raise LineError("事件佇列已滿，請稍後重新傳送", status_code=503)
+                return "OK"
+
+            self.process_events(events)
             return "OK"
             
+        except LineError:
+            raise
         except json.JSONDecodeError as e:
             error_msg = f"無效的 JSON 格式: {str(e)}"
             logger.error(error_msg)
@@ -120,6 +153,147 @@ class LineWebhookHandler:
             logger.error(error_msg)
             raise LineError(error_msg, original_error=e)
     
+    def process_events(self, events: List[Dict[str, Any]]) -> None:
+        """
+        處理同一次 webhook 傳遞中的事件。
+
+        不同使用者的事件並行處理，同一使用者的事件維持原始順序，
+        且連續的文字訊息會合併為一次檢測與一則回覆。
+
+        Args:
+            events: 來自 LINE 的事件列表
+
+        Raises:
+            LineError: 任一使用者的事件處理失敗時（其他使用者仍會處理完畢）
+        """
+        events = self._filter_new_events(events)
+        groups = self._group_events_by_user(events)
+        if not groups:
+            return
+
+        if len(groups) == 1:
+            user_id, user_events = groups[0]
+            self._process_user_events(user_id, user_events)
+            return
+
+        logger.info(f"並行處理 {len(groups)} 位使用者的事件")
+        executor = self._get_executor()
+        futures = [
+            executor.submit(self._process_user_events, user_id, user_events)
+            for user_id, user_events in groups
+        ]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def _filter_new_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        過濾已處理過的事件，並記錄新事件的 ID。
+
+        Args:
+            events: 來自 LINE 的事件列表
+
+        Returns:
+            List[Dict[str, Any]]: 尚未處理過的事件
+        """
+        new_events = []
+        for event in events:
+            event_id = event.get("webhookEventId")
+            # 檢查與記錄為同一原子操作，多個 worker 同時收到同一事件時只有一個會處理
+            if event_id and not self.dedupe_store.check_and_add(event_id):
+                logger.info(f"跳過已處理的事件: {event_id}")
+                continue
+            new_events.append(event)
+        return new_events
+
+    @staticmethod
+    def _group_events_by_user(events: List[Dict[str, Any]]) -> List[tuple]:
+        """
+        依來源使用者分組事件，組內保持原始順序。
+
+        Returns:
+            List[tuple]: (user_id, 事件列表) 依使用者首次出現的順序排列
+        """
+        groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for event in events:
+            user_id = event.get("source", {}).get("userId")
+            groups.setdefault(user_id, []).append(event)
+        return list(groups.items())
+
+    @staticmethod
+    def _is_mergeable_text_event(event: Dict[str, Any]) -> bool:
+        """可與相鄰事件合併的一般文字訊息事件"""
+        return (
+            event.get("type") == "message"
+            and event.get("message", {}).get("type") == "text"
+            and "text" in event.get("message", {})
+            and "replyToken" in event
+            and not event.get("deliveryContext", {}).get("isRedelivery", False)
+        )
+
+    def _coalesce_text_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        將同一使用者連續的文字訊息合併為單一事件。
+
+        合併後的事件使用第一則訊息的回覆令牌（最早過期），文字以換行串接。
+
+        Args:
+            events: 同一使用者的事件列表
+
+        Returns:
+            List[Dict[str, Any]]: 合併後的事件列表
+        """
+        coalesced: List[Dict[str, Any]] = []
+        run: List[Dict[str, Any]] = []
+
+        def flush():
+            if len(run) == 1:
+                coalesced.append(run[0])
+            elif run:
+                first = run[0]
+                merged = dict(first)
+                merged["message"] = dict(first["message"])
+                merged["message"]["text"] = "\n".join(e["message"]["text"] for e in run)
+                logger.info(f"合併 {len(run)} 則來自同一使用者的連續文字訊息")
+                coalesced.append(merged)
+            run.clear()
+
+        for event in events:
+            if self._is_mergeable_text_event(event):
+                run.append(event)
+            else:
+                flush()
+                coalesced.append(event)
+        flush()
+        return coalesced
+
+    def _process_user_events(self, user_id: Optional[str], events: List[Dict[str, Any]]) -> None:
+        """
+        依序處理單一使用者的事件。
+
+        持有該使用者的鎖，確保不同 webhook 傳遞中同一使用者的事件不會交錯處理。
+        """
+        lock = self._user_locks[hash(user_id) % USER_LOCK_STRIPES]
+        with lock:
+            for event in self._coalesce_text_events(events):
+                self._process_event(event)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """延遲建立執行緒池（避免在 fork 前建立執行緒）"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency,
+                        thread_name_prefix="webhook-user"
+                    )
+        return self._executor
+
     @with_error_handling(reraise=True)
     def _process_event(self, event: Dict[str, Any]) -> None:
         """
@@ -132,42 +306,44 @@ class LineWebhookHandler:
             LineError: 如果處理過程中發生錯誤
         """
         try:
-            # 檢查事件是否為重新傳送且已處理
-            event_id = event.get("webhookEventId")
-            is_redelivery = event.get("deliveryContext", {}).get("isRedelivery", False)
-            
-            if event_id and event_id in self._processed_event_ids:
-                logger.info(f"跳過已處理的事件: {event_id}")
+            extracted = self._extract_message_event(event)
+            if extracted is None:
                 return
+            user_id, reply_token, message = extracted
+
+            # 將整個事件轉發到對話服務，由服務層處理不同類型的訊息
+            self.conversation_service.process_event(
+                user_id=user_id,
+                reply_token=reply_token,
+                event_type="message",
+                message=message
+            )
                 
-            # 對於重新傳送的事件，記錄但不回應
-            if is_redelivery:
-                logger.warning(f"收到重新傳送的事件 ID: {event_id}，將僅記錄不回應")
-                # 將事件ID添加到已處理集合
-                if event_id:
-                    self._processed_event_ids.add(event_id)
-                    # 維護集合大小，避免無限增長
-                    if len(self._processed_event_ids) > 1000:
-                        self._processed_event_ids.pop()  # 移除最舊的事件ID
-                
-                # 確認事件格式
-                if "type" not in event:
-                    raise LineError("事件缺少 'type' 字段", status_code=400)
-                    
-                # 只處理訊息事件，其它類型的事件記錄但不處理
-                if event["type"] == "message":
-                    # 基本驗證
-                    if "userId" not in event.get("source", {}):
-                        raise LineError("事件來源缺少 'userId' 字段", status_code=400)
-                    
-                    # 取出基本訊息
-                    user_id = event["source"]["userId"]
-                    message = event["message"]
-                    
-                    # 只記錄訊息，不進行回應
-                    logger.info(f"記錄重新傳送的訊息，來自 {user_id} 的 {message['type']} 類型訊息")
-                    
-                return
+        except Exception as e:
+            error_msg = f"處理事件時發生錯誤: {str(e)}"
+            logger.error(error_msg)
+            raise LineError(error_msg, original_error=e)
+
+    def _extract_message_event(self, event: Dict[str, Any]) -> Optional[tuple]:
+        """
+        驗證事件格式並取出需要回應的訊息。
+
+        Args:
+            event: 來自 LINE 的事件數據
+
+        Returns:
+            Optional[tuple]: (user_id, reply_token, message)；不需回應的事件則為 None
+
+        Raises:
+            LineError: 如果事件格式無效
+        """
+        # 檢查事件是否為重新傳送（已處理的事件已在 _filter_new_events 過濾）
+        event_id = event.get("webhookEventId")
+        is_redelivery = event.get("deliveryContext", {}).get("isRedelivery", False)
+            
+        # 對於重新傳送的事件，記錄但不回應
+        if is_redelivery:
+            logger.warning(f"收到重新傳送的事件 ID: {event_id}，將僅記錄不回應")
             
             # 確認事件格式
             if "type" not in event:
@@ -176,44 +352,178 @@ class LineWebhookHandler:
             # 只處理訊息事件，其它類型的事件記錄但不處理
             if event["type"] == "message":
                 # 基本驗證
-                if "replyToken" not in event:
-                    raise LineError("訊息事件缺少 'replyToken' 字段", status_code=400)
                 if "userId" not in event.get("source", {}):
                     raise LineError("事件來源缺少 'userId' 字段", status_code=400)
                 
                 # 取出基本訊息
                 user_id = event["source"]["userId"]
-                reply_token = event["replyToken"]
                 message = event["message"]
                 
-                # 記錄事件
-                logger.info(f"收到來自 {user_id} 的 {message['type']} 類型訊息")
-                
-                # 將事件ID添加到已處理集合
-                if event_id:
-                    self._processed_event_ids.add(event_id)
-                    # 維護集合大小，避免無限增長
-                    if len(self._processed_event_ids) > 1000:
-                        self._processed_event_ids.pop()  # 移除最舊的事件ID
-                
-                # 將整個事件轉發到對話服務，由服務層處理不同類型的訊息
-                self.conversation_service.process_event(
-                    user_id=user_id,
-                    reply_token=reply_token,
-                    event_type="message",
-                    message=message
-                )
-            else:
-                logger.info(f"收到不支援的事件類型: {event.get('type')}")
+                # 只記錄訊息，不進行回應
+                logger.info(f"記錄重新傳送的訊息，來自 {user_id} 的 {message['type']} 類型訊息")
                 
+            return None
+        
+        # 確認事件格式
+        if "type" not in event:
+            raise LineError("事件缺少 'type' 字段", status_code=400)
+            
+        # 只處理訊息事件，其它類型的事件記錄但不處理
+        if event["type"] != "message":
+            logger.info(f"收到不支援的事件類型: {event.get('type')}")
+            return None
+
+        # 基本驗證
+        if "replyToken" not in event:
+            raise LineError("訊息事件缺少 'replyToken' 字段", status_code=400)
+        if "userId" not in event.get("source", {}):
+            raise LineError("事件來源缺少 'userId' 字段", status_code=400)
+        
+        # 取出基本訊息
+        user_id = event["source"]["userId"]
+        reply_token = event["replyToken"]
+        message = event["message"]
+        
+        # 記錄事件
+        logger.info(f"收到來自 {user_id} 的 {message['type']} 類型訊息")
+        return user_id, reply_token, message
+
+    # === 非同步版本（ASGI 入口使用） ===
+    @with_async_error_handling(reraise=True)
+    async def handle_webhook_async(self, request_data: str) -> str:
+        """
+        handle_webhook 的非同步版本，於事件迴圈中處理所有事件。
+
+        Args:
+            request_data: 請求正文（文本格式）
+
+        Returns:
+            str: 如果成功則返回 'OK'
+
+        Raises:
+            LineError: 如果處理過程中發生錯誤
+        """
+        try:
+            json_data = json.loads(request_data)
+            logger.info("接收到的 webhook 資料: %s", json.dumps(json_data, indent=2))
+
+            events = json_data.get("events", [])
+            if not events:
+                logger.warning("收到的 webhook 不包含事件")
+                return "OK"
+
+            # 背景模式：排程協程後立即回應，超過上限時回應 503 讓 LINE 重新傳送
+            if self.max_background_tasks:
+                if len(self._background_tasks) >= self.max_background_tasks:
+                    raise LineError("事件佇列已滿，請稍後重新傳送", status_code=503)
+                task = asyncio.create_task(self._run_background_events(events))
+                self._background_tasks.add(task)
+                self._inflight.set(len(self._background_tasks))
+                task.add_done_callback(self._on_background_done)
+                return "OK"
+
+            await self.process_events_async(events)
+            return "OK"
+
+        except LineError:
+            raise
+        except json.JSONDecodeError as e:
+            error_msg = f"無效的 JSON 格式: {str(e)}"
+            logger.error(error_msg)
+            raise LineError(error_msg, status_code=400, original_error=e)
+        except Exception as e:
+            error_msg = f"處理 webhook 時發生錯誤: {str(e)}"
+            logger.error(error_msg)
+            raise LineError(error_msg, original_error=e)
+
+    async def process_events_async(self, events: List[Dict[str, Any]]) -> None:
+        """
+        process_events 的非同步版本。
+
+        不同使用者的事件以協程並行處理（上限為 max_concurrency），
+        同一使用者的事件依序處理，連續文字訊息同樣會合併。
+
+        Args:
+            events: 來自 LINE 的事件列表
+
+        Raises:
+            LineError: 任一使用者的事件處理失敗時（其他使用者仍會處理完畢）
+        """
+        events = self._filter_new_events(events)
+        groups = self._group_events_by_user(events)
+        if not groups:
+            return
+
+        semaphore = self._get_async_semaphore()
+
+        async def run_group(user_id, user_events):
+            async with semaphore, self._get_async_user_lock(user_id):
+                for event in self._coalesce_text_events(user_events):
+                    await self._process_event_async(event)
+
+        results = await asyncio.gather(
+            *(run_group(user_id, user_events) for user_id, user_events in groups),
+            return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+
+    async def _run_background_events(self, events: List[Dict[str, Any]]) -> None:
+        """背景處理事件，錯誤只記錄不拋出"""
+        try:
+            await self.process_events_async(events)
+        except Exception as e:
+            logger.error(f"背景處理 webhook 事件時發生錯誤: {str(e)}")
+
+    def _on_background_done(self, task: asyncio.Task) -> None:
+        self._background_tasks.discard(task)
+        self._inflight.set(len(self._background_tasks))
+
+    @with_async_error_handling(reraise=True)
+    async def _process_event_async(self, event: Dict[str, Any]) -> None:
+        """_process_event 的非同步版本"""
+        try:
+            extracted = self._extract_message_event(event)
+            if extracted is None:
+                return
+            user_id, reply_token, message = extracted
+
+            await self.conversation_service.process_event_async(
+                user_id=user_id,
+                reply_token=reply_token,
+                event_type="message",
+                message=message
+            )
+
         except Exception as e:
             error_msg = f"處理事件時發生錯誤: {str(e)}"
             logger.error(error_msg)
             raise LineError(error_msg, original_error=e)
-        
+
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        """延遲建立協程並行上限（需在事件迴圈中建立）"""
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_semaphore
+
+    def _get_async_user_lock(self, user_id: Optional[str]) -> asyncio.Lock:
+        """取得使用者對應的協程鎖（分段共用）"""
+        if self._async_user_locks is None:
+            self._async_user_locks = [asyncio.Lock() for _ in range(USER_LOCK_STRIPES)]
+        return self._async_user_locks[hash(user_id) % USER_LOCK_STRIPES]
+
     def validate_signature(self, body: str, signature: str) -> bool:
-        hash = hmac.new(self.channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
-        expected_signature = base64.b64encode(hash).decode()
-        print("🔐 預期簽名：", expected_signature)
-        print("📦  LINE 傳來簽名：", signature)
-        return hmac.compare_digest(expected_signature, signature)
\ No newline at end of file
+        """
+        驗證 X-Line-Signature。預期簽名可用來偽造請求，不可寫入日誌或輸出。
+
+        Args:
+            body: 請求內容
+            signature: LINE 傳來的簽名
+
+        Returns:
+            bool: 簽名相符則為 True
+        """
+        digest = hmac.new(self.channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+        expected_signature = base64.b64encode(digest).decode()
+        return hmac.compare_digest(expected_signature, signature or "")
\ No newline at end of file
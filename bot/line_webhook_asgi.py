@@ -0,0 +1,61 @@
+"""
+LINE Webhook ASGI 路由
+
+此模組為 ASGI（FastAPI）入口提供 /callback 端點，
+與 Flask 藍圖共用 LineWebhookHandler 的驗證與事件處理邏輯，
+但所有 I/O 皆以非同步方式進行。
+
+端點：
+- POST /callback: 接收 LINE 平台的 webhook 事件
+"""
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from utils.logger import get_api_logger
+from utils.error_handler import AppError
+
+# 取得模組特定的日誌記錄器
+logger = get_api_logger("line_webhook_asgi")
+
+# 為 LINE webhook 創建 FastAPI 路由
+line_webhook_router = APIRouter()
+
+# 對路由添加處理器屬性
+line_webhook_router.webhook_handler = None
+
+
+# === API 端點定義 ===
+@line_webhook_router.post("/callback")
+async def callback(request: Request):
+    """
+    LINE webhook 的 ASGI 路由處理器。
+
+    端點: POST /callback
+    """
+    try:
+        handler = line_webhook_router.webhook_handler  # type: LineWebhookHandler
+
+        if handler is None:
+            logger.error("Webhook handler 尚未設定")
+            error = AppError("Webhook handler 尚未設定")
+            return JSONResponse(error.to_dict(), status_code=500)
+
+        signature = request.headers.get("X-Line-Signature", "")
+        body = (await request.body()).decode("utf-8")
+
+        # 驗證簽名
+        if not handler.validate_signature(body, signature):
+            logger.warning("X-Line-Signature 驗證失敗")
+            error = AppError("X-Line-Signature 驗證失敗", status_code=403)
+            return JSONResponse(error.to_dict(), status_code=403)
+
+        result = await handler.handle_webhook_async(body)
+        return PlainTextResponse(result)
+
+    except AppError as e:
+        logger.error(f"處理 webhook 時發生應用錯誤: {str(e)}")
+        return JSONResponse(e.to_dict(), status_code=e.status_code)
+    except Exception as e:
+        logger.error(f"處理 webhook 時發生未捕獲錯誤: {str(e)}")
+        error = AppError(f"處理 webhook 時發生錯誤: {str(e)}", original_error=e)
+        return JSONResponse(error.to_dict(), status_code=500)
@@ -3,12 +3,36 @@
 
 此模組提供與外部詐騙分析 API 互動的客戶端。
 它處理發送訊息資料進行分析並處理回應。
+
+請求經由共用的 HttpTransport 發送（連線池、逾時與重試）；
+analyze_text 為同步版本，analyze_text_async 供 ASGI 入口使用。
+
+可選擇以斷路器保護：遠端持續失敗或變慢時直接拒絕呼叫（CircuitOpenError），
+由呼叫端改用後備策略；啟用 hedging 時，請求超過近期 p95 延遲仍未回應會再送出一次，
+採用先完成的回應。
+
+設定批次端點（batch_url）時，並行的 analyze_text 呼叫經由微批次處理器在
+batch_linger_ms 內合併成一次批次請求，各呼叫者仍取回各自的結果；
+斷路器以批次請求為單位回報，整批失敗只計一次。
+批次端點協定：POST {"items": [資料, ...]}，回應 {"results": [結果, ...]}（順序相同），
+無法分析的項目回傳 {"error": 訊息, "status_code": 狀態碼}。
 """
 
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait
+from typing import Any, Dict, List, Optional
+
 import requests
+import httpx
 import json
 from utils.logger import get_client_logger
-from utils.error_handler import ApiError, with_error_handling
+from utils.metrics import metrics
+from utils.error_handler import ApiError, with_error_handling, with_async_error_handling
+from utils.circuit_breaker import CircuitBreaker
+from utils.micro_batcher import MicroBatcher
+from clients.http_transport import HttpTransport, get_shared_transport
 
 # 取得模組特定的日誌記錄器
 logger = get_client_logger("analysis_api")
@@ -16,9 +40,44 @@ logger = get_client_logger("analysis_api")
 class AnalysisApiClient:
     """與外部詐騙分析 API 互動的客戶端"""
     
-    def __init__(self, api_url=None):
+    def __init__(self, api_url=None, transport: HttpTransport = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedge: bool = False, hedge_min_samples: int = 20,
+                 batch_url: Optional[str] = None, batch_max_size: int = 16,
+                 batch_linger_ms: float = 5.0, batch_timeout: float = 30.0):
+        """
+        Args:
+            api_url: 分析 API 網址
+            transport: HTTP 傳輸層，預設使用行程共用的傳輸層
+            breaker: 斷路器，None 表示不保護
+            hedge: 是否在超過近期 p95 延遲後送出第二次請求（批次模式下不使用）
+            hedge_min_samples: 累積至少此數量的延遲樣本後才啟用 hedging
+            batch_url: 批次分析端點，None 表示每則訊息單獨請求
+            batch_max_size: 單次批次請求的訊息數上限，1 表示停用批次
+            batch_linger_ms: 第一則訊息到達後最多等待湊批的毫秒數
+            batch_timeout: 同步呼叫等待批次結果的秒數上限
+        """
         self.api_url = api_url
         self.headers = {"Content-Type": "application/json"}
+        self.transport = transport or get_shared_transport()
+        self.breaker = breaker
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self._latency = metrics.histogram("analysis_api.latency_seconds")
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        self.batch_url = batch_url
+        self.batch_max_size = max(1, batch_max_size)
+        self.batch_timeout = batch_timeout
+        self.batcher = None
+        if batch_url and self.batch_max_size > 1:
+            self.batcher = MicroBatcher(
+                self._send_batch,
+                max_batch_size=self.batch_max_size,
+                max_wait_ms=batch_linger_ms,
+                name="analysis_api.batch"
+            )
     
     @with_error_handling(reraise=True)
     def analyze_text(self, data):
@@ -33,30 +92,57 @@ class AnalysisApiClient:
             
         Raises:
             ApiError: 如果 API 未配置或返回錯誤
+            CircuitOpenError: 如果斷路器開啟
         """
         if not self.api_url:
             logger.error("API URL 未配置")
             raise ApiError("API URL 未配置", status_code=400)
-        
+
+        if self.breaker is not None:
+            self.breaker.check()
+        if self.batcher is not None:
+            # 斷路器由批次函數每批回報一次
+            future = self.batcher.submit(data)
+            try:
+                return self._unwrap(future.result(self.batch_timeout))
+            except FuturesTimeoutError:
+                future.cancel()
+                self._release_skipped(future)
+                error_msg = f"批次分析請求超過 {self.batch_timeout} 秒未完成"
+                logger.error(error_msg)
+                raise ApiError(error_msg, status_code=504)
+        start = time.perf_counter()
+        try:
+            hedge_delay = self._hedge_delay()
+            result = self._post(data) if hedge_delay is None else self._post_hedged(data, hedge_delay)
+        except Exception as e:
+            self._record_failure(e, start)
+            raise
+        except BaseException:
+            # 取消（asyncio.CancelledError）等不代表遠端故障，只歸還試探名額
+            self._release()
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success(time.perf_counter() - start)
+        return result
+
+    def _post(self, data):
+        """送出單次分析請求（含傳輸層重試）"""
         try:
+            start = time.perf_counter()
             logger.info(f"發送資料到分析 API: {self.api_url}")
-            response = requests.post(
-                self.api_url,
+            response = self.transport.request(
+                "POST", self.api_url,
+                endpoint="analysis.analyze",
                 headers=self.headers,
-                data=json.dumps(data),
-                timeout=5
+                data=json.dumps(data)
             )
-            
-            if response.status_code == 200:
-                logger.info("成功從 API 獲取分析結果")
-                return response.json()
-            else:
-                error_msg = f"API 回應錯誤：{response.status_code}"
-                logger.error(error_msg)
-                if response.text:
-                    logger.error(f"API 回應內容：{response.text}")
-                raise ApiError(error_msg, status_code=response.status_code)
+            result = self._parse_response(response)
+            self._latency.observe(time.perf_counter() - start)
+            return result
                 
+        except ApiError:
+            raise
         except requests.RequestException as e:
             error_msg = f"API 請求異常：{str(e)}"
             logger.error(error_msg)
@@ -70,6 +156,296 @@ class AnalysisApiClient:
             logger.error(error_msg)
             raise ApiError(error_msg, original_error=e)
     
+    @with_async_error_handling(reraise=True)
+    async def analyze_text_async(self, data):
+        """
+        analyze_text 的非同步版本。
+
+        Args:
+            data: 包含訊息和上下文資料的字典
+
+        Returns:
+            dict: 包含標籤、可信度和回覆的分析結果
+
+        Raises:
+            ApiError: 如果 API 未配置或返回錯誤
+            CircuitOpenError: 如果斷路器開啟
+        """
+        if not self.api_url:
+            logger.error("API URL 未配置")
+            raise ApiError("API URL 未配置", status_code=400)
+
+        if self.breaker is not None:
+            self.breaker.check()
+        if self.batcher is not None:
+            # 斷路器由批次函數每批回報一次；尚未送出就被取消的項目由此歸還放行名額
+            future = self.batcher.submit(data)
+            try:
+                return self._unwrap(await asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                future.cancel()
+                self._release_skipped(future)
+                raise
+        start = time.perf_counter()
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is None:
+                result = await self._apost(data)
+            else:
+                result = await self._apost_hedged(data, hedge_delay)
+        except Exception as e:
+            self._record_failure(e, start)
+            raise
+        except BaseException:
+            # 取消（asyncio.CancelledError）等不代表遠端故障，只歸還試探名額
+            self._release()
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success(time.perf_counter() - start)
+        return result
+
+    async def _apost(self, data):
+        """_post 的非同步版本"""
+        try:
+            start = time.perf_counter()
+            logger.info(f"發送資料到分析 API: {self.api_url}")
+            response = await self.transport.arequest(
+                "POST", self.api_url,
+                endpoint="analysis.analyze",
+                headers=self.headers,
+                data=json.dumps(data)
+            )
+            result = self._parse_response(response)
+            self._latency.observe(time.perf_counter() - start)
+            return result
+
+        except ApiError:
+            raise
+        except httpx.HTTPError as e:
+            error_msg = f"API 請求異常：{str(e)}"
+            logger.error(error_msg)
+            raise ApiError(error_msg, original_error=e)
+        except json.JSONDecodeError as e:
+            error_msg = f"API 回應解析失敗：{str(e)}"
+            logger.error(error_msg)
+            raise ApiError(error_msg, original_error=e)
+        except Exception as e:
+            error_msg = f"發送資料到 API 時發生未知錯誤：{str(e)}"
+            logger.error(error_msg)
+            raise ApiError(error_msg, original_error=e)
+
+    # === 批次請求 ===
+
+    @with_error_handling(reraise=True)
+    def analyze_batch(self, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        以批次端點一次分析多則訊息，超過 batch_max_size 時分成多次請求。
+
+        Args:
+            items: 每則訊息的分析資料（與 analyze_text 的 data 相同）
+
+        Returns:
+            List: 與 items 順序相同的分析結果；伺服器無法分析的項目為 ApiError 實例
+                （同 asyncio.gather(return_exceptions=True)）
+
+        Raises:
+            ApiError: 如果未設定批次端點或整批請求失敗
+            CircuitOpenError: 如果斷路器開啟
+        """
+        if not self.batch_url:
+            logger.error("批次 API URL 未配置")
+            raise ApiError("批次 API URL 未配置", status_code=400)
+
+        results: List[Any] = []
+        for offset in range(0, len(items), self.batch_max_size):
+            chunk = items[offset:offset + self.batch_max_size]
+            if self.breaker is not None:
+                self.breaker.check()
+            start = time.perf_counter()
+            try:
+                results.extend(self._post_batch(chunk))
+            except Exception as e:
+                self._record_failure(e, start)
+                raise
+            except BaseException:
+                self._release()
+                raise
+            if self.breaker is not None:
+                self.breaker.record_success(time.perf_counter() - start)
+        return results
+
+    def _send_batch(self, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        微批次處理器的批次函數；只有一則時改用單筆端點，不增加批次協定的開銷。
+
+        每位呼叫者在 check() 時各取得一個放行名額，整批結果只回報斷路器一次，
+        其餘名額在此歸還；失敗的項目由各呼叫者取回，不另外計入斷路器。
+        """
+        start = time.perf_counter()
+        try:
+            results = [self._post(items[0])] if len(items) == 1 else self._post_batch(items)
+        except Exception as e:
+            self._release(len(items) - 1)
+            self._record_failure(e, start)
+            raise
+        except BaseException:
+            self._release(len(items))
+            raise
+        self._release(len(items) - 1)
+        if self.breaker is not None:
+            self.breaker.record_success(time.perf_counter() - start)
+        return results
+
+    def _post_batch(self, items: List[Dict[str, Any]]) -> List[Any]:
+        """送出單次批次請求，回傳與 items 等長的結果（失敗項目為 ApiError）"""
+        try:
+            start = time.perf_counter()
+            logger.info(f"發送 {len(items)} 則資料到批次分析 API: {self.batch_url}")
+            response = self.transport.request(
+                "POST", self.batch_url,
+                endpoint="analysis.batch",
+                headers=self.headers,
+                data=json.dumps({"items": items})
+            )
+            payload = self._parse_response(response)
+        except ApiError:
+            raise
+        except requests.RequestException as e:
+            error_msg = f"批次 API 請求異常：{str(e)}"
+            logger.error(error_msg)
+            raise ApiError(error_msg, original_error=e)
+        except json.JSONDecodeError as e:
+            error_msg = f"批次 API 回應解析失敗：{str(e)}"
+            logger.error(error_msg)
+            raise ApiError(error_msg, original_error=e)
+        except Exception as e:
+            error_msg = f"發送資料到批次 API 時發生未知錯誤：{str(e)}"
+            logger.error(error_msg)
+            raise ApiError(error_msg, original_error=e)
+
+        results = payload.get("results") if isinstance(payload, dict) else None
+        if not isinstance(results, list) or len(results) != len(items):
+            error_msg = f"批次 API 回應格式錯誤：預期 {len(items)} 筆 results"
+            logger.error(error_msg)
+            raise ApiError(error_msg, status_code=502)
+        self._latency.observe(time.perf_counter() - start)
+        metrics.histogram("analysis_api.batch_size").observe(len(items))
+        return [
+            ApiError(f"批次項目分析失敗：{result['error']}", status_code=result.get("status_code", 500))
+            if isinstance(result, dict) and "error" in result else result
+            for result in results
+        ]
+
+    @staticmethod
+    def _unwrap(result):
+        """批次結果中的失敗項目以例外拋給該項目的呼叫者"""
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    # === Hedging 與斷路器 ===
+
+    def _hedge_delay(self) -> Optional[float]:
+        """啟用 hedging 且樣本足夠時，回傳近期成功請求的 p95 延遲"""
+        if not self.hedge or self._latency.count < self.hedge_min_samples:
+            return None
+        return self._latency.percentile(95)
+
+    def _post_hedged(self, data, delay: float):
+        """第一次請求超過 delay 秒仍未完成時再送出一次，採用先成功的回應"""
+        executor = self._get_executor()
+        first = executor.submit(self._post, data)
+        try:
+            return first.result(timeout=delay)
+        except FuturesTimeoutError:
+            pass
+
+        metrics.counter("analysis_api.hedged").inc()
+        logger.info(f"分析 API 超過 p95 {delay:.2f} 秒未回應，送出 hedged 請求")
+        second = executor.submit(self._post, data)
+        pending = {first, second}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if future is second:
+                    metrics.counter("analysis_api.hedge_wins").inc()
+                # 較慢的請求在背景完成，不再等待
+                return result
+        raise last_error
+
+    async def _apost_hedged(self, data, delay: float):
+        """_post_hedged 的非同步版本，較慢的請求會被取消"""
+        first = asyncio.ensure_future(self._apost(data))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        metrics.counter("analysis_api.hedged").inc()
+        logger.info(f"分析 API 超過 p95 {delay:.2f} 秒未回應，送出 hedged 請求")
+        second = asyncio.ensure_future(self._apost(data))
+        pending = {first, second}
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    last_error = task.exception()
+                    continue
+                if task is second:
+                    metrics.counter("analysis_api.hedge_wins").inc()
+                for other in pending:
+                    other.cancel()
+                return task.result()
+        raise last_error
+
+    def _record_failure(self, error: Exception, start: float) -> None:
+        """回報斷路器；4xx 用戶端錯誤不代表遠端故障，不計入錯誤率"""
+        if self.breaker is None:
+            return
+        status_code = getattr(error, "status_code", 500)
+        if isinstance(error, ApiError) and 400 <= status_code < 500 and status_code != 429:
+            self.breaker.record_success(time.perf_counter() - start)
+        else:
+            self.breaker.record_failure(time.perf_counter() - start)
+
+    def _release(self, count: int = 1) -> None:
+        """呼叫未完成（例如被取消）時歸還斷路器的試探名額"""
+        if self.breaker is not None:
+            for _ in range(count):
+                self.breaker.release()
+
+    def _release_skipped(self, future: Future) -> None:
+        """批次項目在送出前被取消時（不會由批次函數回報），歸還呼叫者的放行名額"""
+        if future.cancelled():
+            self._release()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """延遲建立 hedging 用的執行緒池（避免在 fork 前建立執行緒）"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="analysis-hedge")
+        return self._executor
+
+    @staticmethod
+    def _parse_response(response):
+        """檢查回應狀態並解析 JSON，失敗時拋出 ApiError"""
+        if response.status_code == 200:
+            logger.info("成功從 API 獲取分析結果")
+            return response.json()
+        else:
+            error_msg = f"API 回應錯誤：{response.status_code}"
+            logger.error(error_msg)
+            if response.text:
+                logger.error(f"API 回應內容：{response.text}")
+            raise ApiError(error_msg, status_code=response.status_code)
+
     def is_configured(self):
         is_configured = self.api_url is not None and self.api_url.strip() != ""
         logger.info(f"API 客戶端配置狀態: {'已配置' if is_configured else '未配置'}")
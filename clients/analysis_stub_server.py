@@ -0,0 +1,114 @@
+"""
+分析 API 的本地替身伺服器
+
+實作與外部分析 API 相同的單筆路由（/analyze）與批次路由（/analyze/batch），
+以關鍵詞檢測產生結果，並模擬每次請求的固定開銷與每則訊息的處理時間。
+供 AnalysisApiClient 的測試與 benchmark_analysis_api.py 使用，不用於正式環境。
+
+用法：
+    python -m clients.analysis_stub_server --port 8765 --overhead-ms 20 --per-item-ms 1 --workers 4
+"""
+
+import argparse
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+ANALYZE_PATH = "/analyze"
+BATCH_PATH = "/analyze/batch"
+
+
+def create_stub_app(overhead_ms: float = 20.0, per_item_ms: float = 1.0, workers: int = 4) -> Flask:
+    """
+    建立替身伺服器的 Flask 應用程式。
+
+    Args:
+        overhead_ms: 每次請求的固定開銷（毫秒）
+        per_item_ms: 每則訊息的處理時間（毫秒）
+        workers: 同時處理的請求數上限（模擬遠端的 worker 數），其餘請求排隊
+
+    Returns:
+        Flask: 應用程式，app.config["STUB_STATS"] 記錄請求數與訊息數
+    """
+    from services.domain.detection.keyword_detection import KeywordDetectionStrategy
+
+    app = Flask(__name__)
+    detector = KeywordDetectionStrategy()
+    stats = {"requests": 0, "items": 0}
+    stats_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max(1, workers))
+    app.config["STUB_STATS"] = stats
+
+    def record(items: int) -> None:
+        with stats_lock:
+            stats["requests"] += 1
+            stats["items"] += items
+
+    def analyze_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        message = item.get("message") if isinstance(item, dict) else None
+        if not message or not isinstance(message, str):
+            return {"error": "message 必須是非空字串", "status_code": 400}
+        result = detector.analyze(message)
+        return {"label": result["label"], "confidence": result["confidence"], "reply": result["reply"]}
+
+    @app.route(ANALYZE_PATH, methods=["POST"])
+    def analyze():
+        record(1)
+        with slots:
+            time.sleep((overhead_ms + per_item_ms) / 1000.0)
+        result = analyze_item(request.get_json(silent=True) or {})
+        if "error" in result:
+            return jsonify({"error": result["error"]}), result["status_code"]
+        return jsonify(result)
+
+    @app.route(BATCH_PATH, methods=["POST"])
+    def analyze_batch():
+        items = (request.get_json(silent=True) or {}).get("items")
+        if not isinstance(items, list):
+            return jsonify({"error": "items 必須是列表"}), 400
+        record(len(items))
+        with slots:
+            time.sleep((overhead_ms + per_item_ms * len(items)) / 1000.0)
+        return jsonify({"results": [analyze_item(item) for item in items]})
+
+    return app
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, **app_kwargs) -> Tuple[Any, str]:
+    """
+    在背景執行緒啟動替身伺服器。
+
+    Args:
+        host: 綁定位址
+        port: 連接埠，0 表示自動選擇
+        **app_kwargs: 傳給 create_stub_app 的參數
+
+    Returns:
+        Tuple: (伺服器物件，呼叫 shutdown() 停止；基底網址)
+    """
+    app = create_stub_app(**app_kwargs)
+    server = make_server(host, port, app, threaded=True)
+    server.app = app
+    threading.Thread(target=server.serve_forever, name="analysis-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="分析 API 本地替身伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--overhead-ms", type=float, default=20.0, help="每次請求的固定開銷（毫秒）")
+    parser.add_argument("--per-item-ms", type=float, default=1.0, help="每則訊息的處理時間（毫秒）")
+    parser.add_argument("--workers", type=int, default=4, help="同時處理的請求數上限")
+    args = parser.parse_args()
+
+    app = create_stub_app(args.overhead_ms, args.per_item_ms, args.workers)
+    print(f"分析 API 替身伺服器: http://{args.host}:{args.port}{ANALYZE_PATH}、{BATCH_PATH}")
+    make_server(args.host, args.port, app, threaded=True).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+共用 HTTP 傳輸層
+
+此模組為所有對外 HTTP 呼叫提供連線池化、keep-alive 的傳輸層：
+- 同步：requests.Session + HTTPAdapter 連線池
+- 非同步：httpx.AsyncClient 連線池
+- 依端點設定連線/讀取逾時
+- 遇到 429/5xx 或連線錯誤時以抖動指數退避重試，並遵守 Retry-After
+- 非冪等端點（如 line.reply，回覆令牌只能使用一次）僅在請求確定未送出時
+  （連線失敗/連線逾時）或 429 時重試，不對讀取逾時與 5xx 重試
+- 依主機記錄請求數、重試數、錯誤數與延遲
+"""
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from config import Config
+from utils.logger import get_client_logger
+from utils.metrics import metrics
+
+# 取得模組特定的日誌記錄器
+logger = get_client_logger("http_transport")
+
+# 預設的各端點 (連線逾時, 讀取逾時) 秒數
+DEFAULT_ENDPOINT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "line.reply": (3.05, 10.0),
+    "line.push": (3.05, 10.0),
+    "line.profile": (3.05, 5.0),
+    "line.content": (3.05, 30.0),
+    "analysis.analyze": (3.05, 5.0),
+    "analysis.batch": (3.05, 10.0),
+}
+DEFAULT_TIMEOUT: Tuple[float, float] = (3.05, 10.0)
+
+# 請求送出後不可重送的端點：回覆令牌只能使用一次，重送可能造成重複回覆或令牌失效
+NON_IDEMPOTENT_ENDPOINTS = frozenset({"line.reply"})
+
+
+def parse_endpoint_timeouts(spec: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    """
+    解析端點逾時設定字串。
+
+    Args:
+        spec: 形如 "line.reply=3:10,analysis.analyze=2:5" 的字串
+
+    Returns:
+        Dict[str, Tuple[float, float]]: 端點名稱對應 (連線逾時, 讀取逾時)
+    """
+    timeouts = {}
+    if not spec:
+        return timeouts
+    for item in spec.split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        try:
+            connect, read = value.split(":", 1)
+            timeouts[name.strip()] = (float(connect), float(read))
+        except ValueError:
+            logger.warning(f"忽略無效的逾時設定: {item}")
+    return timeouts
+
+
+class RetryPolicy:
+    """重試策略：抖動指數退避，遵守 Retry-After"""
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    # 伺服器明確表示未處理請求的狀態碼，非冪等請求也可安全重試
+    UNPROCESSED_STATUSES = frozenset({429})
+
+    def __init__(self, max_retries: int = 2, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, max_retry_after: float = 30.0):
+        """
+        Args:
+            max_retries: 最多重試次數（不含第一次請求）
+            backoff_base: 退避基準秒數
+            backoff_max: 單次退避上限秒數
+            max_retry_after: 可接受的 Retry-After 上限，超過則不重試
+        """
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+
+    def should_retry_status(self, status_code: int, retry_after_send: bool = True) -> bool:
+        if not retry_after_send:
+            return status_code in self.UNPROCESSED_STATUSES
+        return status_code in self.RETRY_STATUSES
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+        """
+        計算第 attempt 次重試前的等待秒數。
+
+        Args:
+            attempt: 已失敗的次數（從 0 開始）
+            retry_after: 伺服器回傳的 Retry-After 標頭
+
+        Returns:
+            Optional[float]: 等待秒數；Retry-After 超過上限時為 None（放棄重試）
+        """
+        server_delay = self._parse_retry_after(retry_after)
+        if server_delay is not None:
+            if server_delay > self.max_retry_after:
+                return None
+            return server_delay
+        # full jitter：在 [0, min(上限, 基準 * 2^attempt)] 間隨機
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class HttpTransport:
+    """連線池化的 HTTP 傳輸層，提供同步與非同步請求"""
+
+    def __init__(self,
+                 pool_connections: int = 10,
+                 pool_maxsize: int = 20,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 endpoint_timeouts: Optional[Dict[str, Tuple[float, float]]] = None):
+        """
+        初始化傳輸層。
+
+        Args:
+            pool_connections: 連線池快取的主機數
+            pool_maxsize: 每個主機的最大連線數
+            retry_policy: 重試策略
+            endpoint_timeouts: 端點名稱對應 (連線逾時, 讀取逾時)
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.endpoint_timeouts = dict(DEFAULT_ENDPOINT_TIMEOUTS)
+        self.endpoint_timeouts.update(endpoint_timeouts or {})
+
+        # 重試由本模組處理，adapter 不自行重試
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._async_client = None
+
+    def timeout_for(self, endpoint: Optional[str]) -> Tuple[float, float]:
+        """取得端點的 (連線逾時, 讀取逾時)"""
+        return self.endpoint_timeouts.get(endpoint, DEFAULT_TIMEOUT)
+
+    @staticmethod
+    def retry_after_send_for(endpoint: Optional[str]) -> bool:
+        """端點的請求在可能已送達後是否仍可重試"""
+        return endpoint not in NON_IDEMPOTENT_ENDPOINTS
+
+    # === 同步請求 ===
+    def request(self, method: str, url: str, endpoint: Optional[str] = None,
+                headers: Optional[Dict[str, str]] = None, data=None,
+                stream: bool = False, retry_after_send: Optional[bool] = None) -> requests.Response:
+        """
+        發送同步請求，依策略重試。
+
+        Args:
+            method: HTTP 方法
+            url: 請求網址
+            endpoint: 端點名稱，用於選擇逾時設定
+            headers: 請求標頭
+            data: 請求內容
+            stream: 是否串流讀取回應內容
+            retry_after_send: 請求可能已送達後（讀取逾時、5xx）是否重試；
+                None 時依端點決定，非冪等端點只重試連線失敗與 429
+
+        Returns:
+            requests.Response: 最後一次的回應
+
+        Raises:
+            requests.RequestException: 重試用盡後仍發生連線錯誤或逾時
+        """
+        host = urlparse(url).netloc
+        timeout = self.timeout_for(endpoint)
+        if retry_after_send is None:
+            retry_after_send = self.retry_after_send_for(endpoint)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=headers, data=data,
+                                                timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(host, start, error=True)
+                if not retry_after_send and not self._not_sent(e):
+                    raise
+                delay = self._next_delay(attempt, None)
+                if delay is None:
+                    raise
+                logger.warning(f"{host} 請求失敗（{type(e).__name__}），{delay:.2f} 秒後重試")
+            else:
+                failed = response.status_code >= 500 or response.status_code == 429
+                self._record(host, start, error=failed)
+                if not self.retry_policy.should_retry_status(response.status_code, retry_after_send):
+                    return response
+                delay = self._next_delay(attempt, response.headers.get("Retry-After"))
+                if delay is None:
+                    return response
+                logger.warning(f"{host} 回應 {response.status_code}，{delay:.2f} 秒後重試")
+                response.close()
+            metrics.counter(f"http.{host}.retries").inc()
+            time.sleep(delay)
+            attempt += 1
+
+    # === 非同步請求 ===
+    async def arequest(self, method: str, url: str, endpoint: Optional[str] = None,
+                       headers: Optional[Dict[str, str]] = None, data=None,
+                       stream: bool = False, retry_after_send: Optional[bool] = None) -> httpx.Response:
+        """
+        request 的非同步版本。
+
+        stream=True 時回應內容尚未讀取，呼叫端以 aiter_bytes() 讀取並負責 aclose()。
+
+        Raises:
+            httpx.HTTPError: 重試用盡後仍發生連線錯誤或逾時
+        """
+        host = urlparse(url).netloc
+        connect_timeout, read_timeout = self.timeout_for(endpoint)
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        if retry_after_send is None:
+            retry_after_send = self.retry_after_send_for(endpoint)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                client = self._get_async_client()
+                response = await client.send(
+                    client.build_request(method, url, headers=headers, content=data, timeout=timeout),
+                    stream=stream
+                )
+            except (httpx.ConnectError, httpx.TimeoutException) as e:
+                self._record(host, start, error=True)
+                if not retry_after_send and not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    raise
+                delay = self._next_delay(attempt, None)
+                if delay is None:
+                    raise
+                logger.warning(f"{host} 請求失敗（{type(e).__name__}），{delay:.2f} 秒後重試")
+            else:
+                failed = response.status_code >= 500 or response.status_code == 429
+                self._record(host, start, error=failed)
+                if not self.retry_policy.should_retry_status(response.status_code, retry_after_send):
+                    return response
+                delay = self._next_delay(attempt, response.headers.get("Retry-After"))
+                if delay is None:
+                    return response
+                logger.warning(f"{host} 回應 {response.status_code}，{delay:.2f} 秒後重試")
+                await response.aclose()
+            metrics.counter(f"http.{host}.retries").inc()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        """關閉非同步連線池"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self) -> None:
+        """關閉同步連線池"""
+        self.session.close()
+
+    # === 輔助方法 ===
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_connections * self.pool_maxsize,
+                    max_keepalive_connections=self.pool_maxsize
+                )
+            )
+        return self._async_client
+
+    @staticmethod
+    def _not_sent(error: requests.RequestException) -> bool:
+        """判斷同步請求錯誤是否發生在連線建立階段（請求確定未送出）"""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.Timeout):
+            return False
+        # 連線建立失敗時 urllib3 的 MaxRetryError.reason 為 NewConnectionError；
+        # 其他 ConnectionError（如連線中斷）可能發生在請求送出之後
+        cause = error.args[0] if error.args else None
+        return isinstance(getattr(cause, "reason", cause), NewConnectionError)
+
+    def _next_delay(self, attempt: int, retry_after: Optional[str]) -> Optional[float]:
+        if attempt >= self.retry_policy.max_retries:
+            return None
+        return self.retry_policy.delay(attempt, retry_after)
+
+    @staticmethod
+    def _record(host: str, start: float, error: bool) -> None:
+        metrics.histogram(f"http.{host}.latency_seconds").observe(time.perf_counter() - start)
+        metrics.counter(f"http.{host}.requests").inc()
+        if error:
+            metrics.counter(f"http.{host}.errors").inc()
+
+
+_shared_transport: Optional[HttpTransport] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_transport() -> HttpTransport:
+    """
+    取得行程共用的傳輸層（依 Config 建立）。
+
+    Returns:
+        HttpTransport: 共用傳輸層實例
+    """
+    global _shared_transport
+    if _shared_transport is None:
+        with _shared_lock:
+            if _shared_transport is None:
+                _shared_transport = HttpTransport(
+                    pool_connections=Config.HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+                    retry_policy=RetryPolicy(
+                        max_retries=Config.HTTP_MAX_RETRIES,
+                        backoff_base=Config.HTTP_BACKOFF_BASE,
+                        backoff_max=Config.HTTP_BACKOFF_MAX
+                    ),
+                    endpoint_timeouts=parse_endpoint_timeouts(Config.HTTP_ENDPOINT_TIMEOUTS)
+                )
+    return _shared_transport
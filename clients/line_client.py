@@ -3,113 +3,206 @@ LINE API 客戶端
 
 此模組提供與 LINE Messaging API 互動的客戶端。
 它處理發送訊息、獲取使用者資料和其他 LINE 特定功能。
+
+所有請求經由共用的 HttpTransport 發送（連線池、逾時與重試）；
+同步方法供 Flask 入口使用，以 _async 結尾的方法供 ASGI 入口使用。
 """
 
-import requests
 import json
+import uuid
 from utils.logger import get_client_logger
-from utils.error_handler import LineError, with_error_handling
+from utils.error_handler import LineError, with_error_handling, with_async_error_handling
+from clients.http_transport import HttpTransport, get_shared_transport
 
 # 取得模組特定的日誌記錄器
 logger = get_client_logger("line")
 
+# LINE Messaging API 端點
+REPLY_URL = "https://api.line.me/v2/bot/message/reply"
+PUSH_URL = "https://api.line.me/v2/bot/message/push"
+PROFILE_URL = "https://api.line.me/v2/bot/profile/{user_id}"
+CONTENT_URL = "https://api-data.line.me/v2/bot/message/{message_id}/content"
+
 class LineClient:
     """與 LINE API 互動的客戶端"""
-    
-    def __init__(self, channel_access_token):
+
+    def __init__(self, channel_access_token, transport: HttpTransport = None):
         self.channel_access_token = channel_access_token
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {channel_access_token}"
         }
-    
+        self.transport = transport or get_shared_transport()
+
     @with_error_handling(reraise=True)
     def reply_message(self, reply_token, text):
         """
         使用 LINE Messaging API 回覆使用者訊息。
-        
+
         Args:
             reply_token: 來自 webhook 事件的回覆令牌
             text: 要發送的文字訊息
-            
+
         Returns:
             bool: 成功則為 True
-            
+
         Raises:
             LineError: 如果發送失敗
         """
-        url = "https://api.line.me/v2/bot/message/reply"
-        payload = {
-            "replyToken": reply_token,
-            "messages": [
-                {
-                    "type": "text",
-                    "text": text
-                }
-            ]
-        }
-        
         logger.info(f"回覆訊息: {text[:30]}...")
-        response = requests.post(
-            url, 
-            headers=self.headers, 
-            data=json.dumps(payload)
+        response = self.transport.request(
+            "POST", REPLY_URL,
+            endpoint="line.reply",
+            headers=self.headers,
+            data=json.dumps(self._reply_payload(reply_token, text))
         )
-        
-        if response.status_code == 200:
-            logger.info("訊息回覆成功")
-            return True
-        else:
-            error_msg = f"回覆訊息失敗，狀態碼：{response.status_code}"
-            if response.text:
-                error_msg += f", 回覆內容：{response.text}"
-            logger.error(error_msg)
-            raise LineError(error_msg, status_code=response.status_code)
-    
+        return self._check_send_response(response, "回覆訊息", "訊息回覆成功")
+
     @with_error_handling(reraise=True)
     def get_profile(self, user_id):
         """
         從 LINE 獲取使用者的資料。
-        
+
         Args:
             user_id: LINE 使用者 ID
-            
+
         Returns:
             dict: 使用者資料
-            
+
         Raises:
             LineError: 如果獲取失敗
         """
-        url = f"https://api.line.me/v2/bot/profile/{user_id}"
-        
         logger.info(f"獲取使用者 {user_id} 的資料")
-        response = requests.get(url, headers=self.headers)
-        
-        if response.status_code == 200:
-            logger.info("成功獲取使用者資料")
-            return response.json()
-        else:
-            error_msg = f"獲取使用者資料失敗，狀態碼：{response.status_code}"
-            logger.error(error_msg)
-            raise LineError(error_msg, status_code=response.status_code)
-    
+        response = self.transport.request(
+            "GET", PROFILE_URL.format(user_id=user_id),
+            endpoint="line.profile",
+            headers=self.headers
+        )
+        return self._check_profile_response(response)
+
     @with_error_handling(reraise=True)
     def push_message(self, user_id, text):
         """
         向使用者推送訊息，無需回覆令牌。
-        
+
         Args:
             user_id: 要發送訊息的 LINE 使用者 ID
             text: 要發送的文字訊息
-            
+
         Returns:
             bool: 成功則為 True
-            
+
         Raises:
             LineError: 如果發送失敗
         """
-        url = "https://api.line.me/v2/bot/message/push"
-        payload = {
+        logger.info(f"向使用者 {user_id} 推送訊息")
+        response = self.transport.request(
+            "POST", PUSH_URL,
+            endpoint="line.push",
+            headers=self._push_headers(),
+            data=json.dumps(self._push_payload(user_id, text))
+        )
+        return self._check_send_response(response, "推送訊息", "訊息推送成功")
+
+    @with_error_handling(reraise=True)
+    def get_message_content(self, message_id):
+        """
+        以串流方式取得使用者上傳的檔案內容。
+
+        Args:
+            message_id: 檔案訊息的 ID
+
+        Returns:
+            requests.Response: 尚未讀取內容的回應，呼叫端以 iter_content() 讀取並負責 close()
+
+        Raises:
+            LineError: 如果取得失敗
+        """
+        logger.info(f"下載訊息 {message_id} 的檔案內容")
+        response = self.transport.request(
+            "GET", CONTENT_URL.format(message_id=message_id),
+            endpoint="line.content",
+            headers=self.headers,
+            stream=True
+        )
+        if response.status_code != 200:
+            response.close()
+            self._raise_content_error(response.status_code)
+        return response
+
+    # === 非同步方法（ASGI 入口使用） ===
+    @with_async_error_handling(reraise=True)
+    async def reply_message_async(self, reply_token, text):
+        """reply_message 的非同步版本"""
+        logger.info(f"回覆訊息: {text[:30]}...")
+        response = await self.transport.arequest(
+            "POST", REPLY_URL,
+            endpoint="line.reply",
+            headers=self.headers,
+            data=json.dumps(self._reply_payload(reply_token, text))
+        )
+        return self._check_send_response(response, "回覆訊息", "訊息回覆成功")
+
+    @with_async_error_handling(reraise=True)
+    async def get_profile_async(self, user_id):
+        """get_profile 的非同步版本"""
+        logger.info(f"獲取使用者 {user_id} 的資料")
+        response = await self.transport.arequest(
+            "GET", PROFILE_URL.format(user_id=user_id),
+            endpoint="line.profile",
+            headers=self.headers
+        )
+        return self._check_profile_response(response)
+
+    @with_async_error_handling(reraise=True)
+    async def push_message_async(self, user_id, text):
+        """push_message 的非同步版本"""
+        logger.info(f"向使用者 {user_id} 推送訊息")
+        response = await self.transport.arequest(
+            "POST", PUSH_URL,
+            endpoint="line.push",
+            headers=self._push_headers(),
+            data=json.dumps(self._push_payload(user_id, text))
+        )
+        return self._check_send_response(response, "推送訊息", "訊息推送成功")
+
+    @with_async_error_handling(reraise=True)
+    async def get_message_content_async(self, message_id):
+        """get_message_content 的非同步版本；呼叫端以 aiter_bytes() 讀取並負責 aclose()"""
+        logger.info(f"下載訊息 {message_id} 的檔案內容")
+        response = await self.transport.arequest(
+            "GET", CONTENT_URL.format(message_id=message_id),
+            endpoint="line.content",
+            headers=self.headers,
+            stream=True
+        )
+        if response.status_code != 200:
+            await response.aclose()
+            self._raise_content_error(response.status_code)
+        return response
+
+    # === 輔助方法 ===
+    def _push_headers(self):
+        """推送請求加上 X-Line-Retry-Key，讓傳輸層重試時 LINE 不會重複送出"""
+        headers = dict(self.headers)
+        headers["X-Line-Retry-Key"] = str(uuid.uuid4())
+        return headers
+
+    @staticmethod
+    def _reply_payload(reply_token, text):
+        return {
+            "replyToken": reply_token,
+            "messages": [
+                {
+                    "type": "text",
+                    "text": text
+                }
+            ]
+        }
+
+    @staticmethod
+    def _push_payload(user_id, text):
+        return {
             "to": user_id,
             "messages": [
                 {
@@ -118,20 +211,34 @@ class LineClient:
                 }
             ]
         }
-        
-        logger.info(f"向使用者 {user_id} 推送訊息")
-        response = requests.post(
-            url, 
-            headers=self.headers, 
-            data=json.dumps(payload)
-        )
-        
+
+    @staticmethod
+    def _check_send_response(response, action, success_msg):
+        """檢查回覆/推送的回應狀態，失敗時拋出 LineError"""
         if response.status_code == 200:
-            logger.info("訊息推送成功")
+            logger.info(success_msg)
             return True
         else:
-            error_msg = f"推送訊息失敗，狀態碼：{response.status_code}"
+            error_msg = f"{action}失敗，狀態碼：{response.status_code}"
             if response.text:
                 error_msg += f", 回覆內容：{response.text}"
             logger.error(error_msg)
             raise LineError(error_msg, status_code=response.status_code)
+
+    @staticmethod
+    def _check_profile_response(response):
+        """檢查使用者資料的回應狀態，失敗時拋出 LineError"""
+        if response.status_code == 200:
+            logger.info("成功獲取使用者資料")
+            return response.json()
+        else:
+            error_msg = f"獲取使用者資料失敗，狀態碼：{response.status_code}"
+            logger.error(error_msg)
+            raise LineError(error_msg, status_code=response.status_code)
+
+    @staticmethod
+    def _raise_content_error(status_code):
+        """取得檔案內容失敗時拋出 LineError"""
+        error_msg = f"下載檔案內容失敗，狀態碼：{status_code}"
+        logger.error(error_msg)
+        raise LineError(error_msg, status_code=status_code)
@@ -19,6 +19,22 @@ class Config:
     
     # 外部 API 配置
     ANALYSIS_API_URL = os.getenv("ANALYSIS_API_URL")
+    # 分析 API 斷路器：WINDOW 秒內呼叫數達 MIN_CALLS 且錯誤率或慢呼叫比例超過門檻時開啟 OPEN_SECONDS 秒
+    ANALYSIS_API_BREAKER = os.getenv("ANALYSIS_API_BREAKER", "True").lower() in ("true", "t", "1")
+    ANALYSIS_API_BREAKER_WINDOW = float(os.getenv("ANALYSIS_API_BREAKER_WINDOW", 30))
+    ANALYSIS_API_BREAKER_MIN_CALLS = int(os.getenv("ANALYSIS_API_BREAKER_MIN_CALLS", 10))
+    ANALYSIS_API_BREAKER_ERROR_RATE = float(os.getenv("ANALYSIS_API_BREAKER_ERROR_RATE", 0.5))
+    ANALYSIS_API_BREAKER_SLOW_SECONDS = float(os.getenv("ANALYSIS_API_BREAKER_SLOW_SECONDS", 3))
+    ANALYSIS_API_BREAKER_SLOW_RATE = float(os.getenv("ANALYSIS_API_BREAKER_SLOW_RATE", 0.8))
+    ANALYSIS_API_BREAKER_OPEN_SECONDS = float(os.getenv("ANALYSIS_API_BREAKER_OPEN_SECONDS", 30))
+    # 請求超過近期 p95 延遲仍未回應時再送出一次（累積 MIN_SAMPLES 個樣本後啟用）
+    ANALYSIS_API_HEDGE = os.getenv("ANALYSIS_API_HEDGE", "False").lower() in ("true", "t", "1")
+    ANALYSIS_API_HEDGE_MIN_SAMPLES = int(os.getenv("ANALYSIS_API_HEDGE_MIN_SAMPLES", 20))
+    # 批次端點：並行請求在 LINGER_MS 內合併成一次請求（最多 MAX_SIZE 則）；留空則每則單獨請求
+    ANALYSIS_API_BATCH_URL = os.getenv("ANALYSIS_API_BATCH_URL", "")
+    ANALYSIS_API_BATCH_MAX_SIZE = int(os.getenv("ANALYSIS_API_BATCH_MAX_SIZE", 16))
+    ANALYSIS_API_BATCH_LINGER_MS = float(os.getenv("ANALYSIS_API_BATCH_LINGER_MS", 5))
+    ANALYSIS_API_BATCH_TIMEOUT = float(os.getenv("ANALYSIS_API_BATCH_TIMEOUT", 30))
     
     # LLM API 金鑰配置
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -29,10 +45,88 @@ class Config:
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
     LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-pro-exp-03-25")
     
+    # LLM 代理會話（每個代理共用一個 Runner；使用者會話以 LRU 保存，閒置 TTL 秒後淘汰）
+    AGENT_SESSION_MAX = int(os.getenv("AGENT_SESSION_MAX", 1000))
+    AGENT_SESSION_TTL = float(os.getenv("AGENT_SESSION_TTL", 1800))
+    # 單一會話累積的對話輪數上限，達到時改用新會話
+    AGENT_SESSION_MAX_TURNS = int(os.getenv("AGENT_SESSION_MAX_TURNS", 20))
+    # LLM 代理回應快取（相同對話直接回傳先前回應；SIZE 為 0 表示停用，PATH 留空則不使用磁碟快取）
+    AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", 1024))
+    AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", 86400))
+    AGENT_CACHE_PATH = os.getenv("AGENT_CACHE_PATH", "")
+    AGENT_CACHE_DISK_SIZE = int(os.getenv("AGENT_CACHE_DISK_SIZE", 10000))
+    # 送給代理前的對話壓縮：token 預算（0 表示只移除非內容行）、優先保留的最近訊息數、關鍵詞命中前後保留的訊息數
+    AGENT_TOKEN_BUDGET = int(os.getenv("AGENT_TOKEN_BUDGET", 2000))
+    AGENT_RECENT_MESSAGES = int(os.getenv("AGENT_RECENT_MESSAGES", 20))
+    AGENT_KEYWORD_CONTEXT = int(os.getenv("AGENT_KEYWORD_CONTEXT", 2))
+    # 代理呼叫的 provider 並行上限與單次逾時秒數（含排隊時間；0 表示不限時）
+    AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", 8))
+    AGENT_TIMEOUT_SECONDS = float(os.getenv("AGENT_TIMEOUT_SECONDS", 30))
+    
+    # 對外 HTTP 連線配置（連線池、重試與逾時）
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 20))
+    HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+    HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))
+    HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 8))
+    # 各端點逾時，格式: 端點=連線秒數:讀取秒數，以逗號分隔（例如 line.reply=3:10,analysis.analyze=2:5）
+    HTTP_ENDPOINT_TIMEOUTS = os.getenv("HTTP_ENDPOINT_TIMEOUTS", "")
+    
+    # LINE 使用者資料快取配置
+    PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 1000))
+    PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 3600))
+    PROFILE_CACHE_NEGATIVE_TTL = float(os.getenv("PROFILE_CACHE_NEGATIVE_TTL", 60))
+    
+    # 上傳的 LINE 匯出檔（.txt）串流下載配置：大小上限與讀取區塊大小（位元組）
+    EXPORT_FILE_MAX_BYTES = int(os.getenv("EXPORT_FILE_MAX_BYTES", 5 * 1024 * 1024))
+    EXPORT_FILE_CHUNK_BYTES = int(os.getenv("EXPORT_FILE_CHUNK_BYTES", 64 * 1024))
+    
+    # 檢測結果快取配置（SIZE 為 0 表示停用；PATH 留空則不使用磁碟快取）
+    DETECTION_CACHE_SIZE = int(os.getenv("DETECTION_CACHE_SIZE", 2048))
+    DETECTION_CACHE_TTL = float(os.getenv("DETECTION_CACHE_TTL", 86400))
+    DETECTION_CACHE_PATH = os.getenv("DETECTION_CACHE_PATH", "")
+    DETECTION_CACHE_DISK_SIZE = int(os.getenv("DETECTION_CACHE_DISK_SIZE", 100000))
+    
+    # 使用者對話狀態（增量累積詐騙階段與衰減風險分數；USERS 為 0 表示停用）
+    CONVERSATION_STATE_USERS = int(os.getenv("CONVERSATION_STATE_USERS", 10000))
+    CONVERSATION_STATE_TTL = float(os.getenv("CONVERSATION_STATE_TTL", 86400))
+    CONVERSATION_HISTORY_SIZE = int(os.getenv("CONVERSATION_HISTORY_SIZE", 20))
+    CONVERSATION_RISK_HALF_LIFE = float(os.getenv("CONVERSATION_RISK_HALF_LIFE", 3600))
+    CONVERSATION_RISK_ALPHA = float(os.getenv("CONVERSATION_RISK_ALPHA", 0.3))
+    CONVERSATION_ALERT_THRESHOLD = float(os.getenv("CONVERSATION_ALERT_THRESHOLD", 0.7))
+    
+    # 回覆延遲預算（秒）：檢測超過此時間先回覆處理中訊息，結果改以推送傳送；0 表示停用
+    REPLY_DEADLINE_SECONDS = float(os.getenv("REPLY_DEADLINE_SECONDS", 20))
+    DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", 8))
+    
     # 伺服器配置
     PORT = int(os.getenv("PORT", 10000))
     DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "t", "1")
     
+    # gunicorn pre-fork 部署配置（gunicorn.conf.py）
+    # worker 行程數與每個 worker 的請求執行緒數
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 2))
+    WEB_THREADS = int(os.getenv("WEB_THREADS", 8))
+    # 在 master 載入模型後再 fork，worker 以 copy-on-write 共用權重
+    PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "True").lower() in ("true", "t", "1")
+    # 每個 worker 的推論執行緒數（torch/OpenMP/ONNX Runtime），0 表示以核心數 / worker 數自動分配
+    INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 0))
+    
+    # Webhook 非同步處理配置（啟用後 /callback 放入佇列即回應 200）
+    WEBHOOK_ASYNC_MODE = os.getenv("WEBHOOK_ASYNC_MODE", "False").lower() in ("true", "t", "1")
+    WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+    WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 100))
+    # 佇列已滿時的策略 (reject, drop_oldest, drop_newest)
+    WEBHOOK_OVERFLOW_POLICY = os.getenv("WEBHOOK_OVERFLOW_POLICY", "reject").lower()
+    # 同一次 webhook 中同時處理不同使用者事件的最大數量
+    WEBHOOK_EVENT_CONCURRENCY = int(os.getenv("WEBHOOK_EVENT_CONCURRENCY", 8))
+    
+    # Webhook 事件去重配置 (memory, sqlite)
+    EVENT_DEDUPE_BACKEND = os.getenv("EVENT_DEDUPE_BACKEND", "memory").lower()
+    EVENT_DEDUPE_PATH = os.getenv("EVENT_DEDUPE_PATH", "data/runtime/processed_events.sqlite3")
+    EVENT_DEDUPE_MAX_SIZE = int(os.getenv("EVENT_DEDUPE_MAX_SIZE", 10000))
+    EVENT_DEDUPE_TTL = float(os.getenv("EVENT_DEDUPE_TTL", 86400))
+    
     @classmethod
     def validate(cls):
         """
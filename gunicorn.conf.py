@@ -0,0 +1,39 @@
+"""
+gunicorn 設定（pre-fork 部署）
+
+用法：
+    gunicorn -c gunicorn.conf.py app:app
+
+- PRELOAD_MODELS=True 時 master 先建立應用程式並載入模型，凍結後再 fork worker，
+  權重頁面由各 worker 以 copy-on-write 共用
+- 每個 worker 的推論執行緒數依「可用核心數 / worker 數」分配（可用 INFERENCE_THREADS 覆寫），
+  環境變數在匯入 torch 之前設定
+"""
+
+from config import Config
+from utils import prefork
+
+bind = f"0.0.0.0:{Config.PORT}"
+workers = Config.WEB_CONCURRENCY
+worker_class = "gthread"
+threads = Config.WEB_THREADS
+preload_app = Config.PRELOAD_MODELS
+# 檢測可能超過回覆延遲預算，逾時需大於 REPLY_DEADLINE_SECONDS
+timeout = max(60, int(Config.REPLY_DEADLINE_SECONDS * 2))
+
+budget = prefork.plan_thread_budget(workers, inference_threads=Config.INFERENCE_THREADS)
+# 須在 preload 匯入 app（進而匯入 torch）之前設定
+prefork.apply_thread_env(budget)
+
+
+def when_ready(server):
+    """master 就緒、fork worker 之前：凍結模型並輸出配置"""
+    if preload_app:
+        prefork.freeze_loaded_models()
+    prefork.log_master_layout(budget, preload_app, threads)
+
+
+def post_fork(server, worker):
+    """worker fork 後：套用推論執行緒數"""
+    prefork.apply_thread_budget(budget)
+    prefork.log_worker_layout(budget)
@@ -5,31 +5,70 @@
 它負責編排詐騙檢測和生成適當的回應。
 """
 
-from typing import Dict, Any
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, Any, Optional
 from utils.logger import get_service_logger
-from utils.error_handler import AppError, ValidationError, with_error_handling
+from utils.metrics import metrics
+from utils.error_handler import AppError, ValidationError, with_error_handling, with_async_error_handling
 from services.domain.detection.detection_service import DetectionService
 from clients.line_client import LineClient
+from services.profile_service import ProfileService
+from services.export_file_service import FILE_TOO_LARGE_STATUS, ExportFileService
+from utils.fraud_sentiment import LineExport
 
 # 取得模組特定的日誌記錄器
 logger = get_service_logger("conversation")
 
+# === 固定回覆文字 ===
+IMAGE_NOT_SUPPORTED_REPLY = "我已收到您的圖片，但目前還無法分析圖片內容。請以文字方式提供您想要檢測的訊息。"
+FILE_NOT_SUPPORTED_REPLY = "我已收到您的檔案 {file_name}，但目前只能分析由 LINE 聊天室匯出的 .txt 聊天記錄檔。"
+FILE_TOO_LARGE_REPLY = "您的檔案 {file_name} 超過 {max_mb:g} MB 的上限，請匯出較短期間的聊天記錄後再試。"
+UNSUPPORTED_MESSAGE_REPLY = "很抱歉，我無法處理這種類型的訊息。請以文字方式提供您想要檢測的訊息。"
+PROCESSING_ERROR_REPLY = "很抱歉，處理您的訊息時發生問題。請稍後再試。"
+INVALID_FORMAT_REPLY = "輸入格式無效。請提供 LINE 對話響錄格式的內容，例如由 LINE 對話室匯出的消息歷史。"
+DETECTION_PENDING_REPLY = "我已收到您的訊息，正在進行詐騙分析，完成後會立即傳送結果給您。"
+CONVERSATION_RISK_NOTE = "\n\n⚠️ 綜合您近期傳送的 {count} 則訊息，這段對話的風險仍偏高（目前階段：{stage}），請提高警覺。"
+DETECTION_FAILED_RESULT = {
+    "label": "unknown",
+    "confidence": 0.0,
+    "reply": "很抱歉，我暫時無法處理您的訊息。請稍後再試。"
+}
+
 # === 主要接口和方法 ===
 class ConversationService:
     """應用服務，管理對話流程，協調檢測和回應生成"""
     
     def __init__(self,
                  detection_service: DetectionService,
-                 line_client: LineClient):
+                 line_client: LineClient,
+                 profile_service: Optional[ProfileService] = None,
+                 export_file_service: Optional[ExportFileService] = None,
+                 reply_deadline: Optional[float] = None,
+                 detection_workers: int = 8):
         """
         初始化對話服務及其依賴項。
 
         Args:
             detection_service: 檢測訊息中詐騙的服務
             line_client: 與 LINE API 互動的客戶端
+            profile_service: 提供快取的使用者資料服務；預設以 line_client 建立
+            export_file_service: 下載並解析上傳的 LINE 匯出檔；預設以 line_client 建立
+            reply_deadline: 直接回覆的延遲預算（秒）；超過則先回覆處理中訊息、
+                結果改以推送傳送。None 或 0 表示一律等待檢測完成
+            detection_workers: 延遲預算模式下執行檢測的執行緒數
         """
         self.detection_service = detection_service
         self.line_client = line_client
+        self.profile_service = profile_service or ProfileService(line_client)
+        self.export_file_service = export_file_service or ExportFileService(line_client)
+        self.reply_deadline = reply_deadline
+        self.detection_workers = max(1, detection_workers)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._deferred_tasks = set()
 
     @with_error_handling(reraise=True)
     def process_event(self, 
@@ -75,7 +114,7 @@ class ConversationService:
                 
                 # TODO: 實現圖片處理邏輯
                 # 暫時回覆用戶圖片已收到但尚未實現分析功能
-                response = "我已收到您的圖片，但目前還無法分析圖片內容。請以文字方式提供您想要檢測的訊息。"
+                response = IMAGE_NOT_SUPPORTED_REPLY
                 self.line_client.reply_message(reply_token, response)
                 
             elif message_type == "file":
@@ -86,15 +125,12 @@ class ConversationService:
                 
                 logger.info(f"處理來自 {user_id} 的檔案: {file_name} ({file_size} bytes), ID: {file_id}")
                 
-                # TODO: 實現檔案處理邏輯
-                # 暫時回覆用戶檔案已收到但尚未實現分析功能
-                response = f"我已收到您的檔案 {file_name}，但檔案處理功能尚未實現。請以文字方式提供您想要檢測的訊息。"
-                self.line_client.reply_message(reply_token, response)
+                self.process_file(user_id, file_id, file_name, file_size, reply_token)
                 
             else:
                 # 其他未支援的訊息類型
                 logger.info(f"收到不支援的訊息類型: {message_type}")
-                response = "很抱歉，我無法處理這種類型的訊息。請以文字方式提供您想要檢測的訊息。"
+                response = UNSUPPORTED_MESSAGE_REPLY
                 self.line_client.reply_message(reply_token, response)
                 
         except Exception as e:
@@ -103,7 +139,7 @@ class ConversationService:
             
             # 嘗試發送錯誤訊息給使用者
             try:
-                error_response = "很抱歉，處理您的訊息時發生問題。請稍後再試。"
+                error_response = PROCESSING_ERROR_REPLY
                 self.line_client.reply_message(reply_token, error_response)
             except Exception as reply_error:
                 logger.error(f"無法發送錯誤回應: {str(reply_error)}")
@@ -112,60 +148,329 @@ class ConversationService:
             raise AppError(error_msg, original_error=e)
             
     @with_error_handling(reraise=True)
-    def process_message(self, user_id: str, message_text: str, reply_token: str) -> None:
+    def process_message(self, user_id: str, message_text: Optional[str], reply_token: str,
+                        export: Optional[LineExport] = None) -> None:
         """
         處理來自使用者的文字訊息。
+
+        檢測在延遲預算（reply_deadline）內完成時直接回覆結果；
+        否則先以回覆令牌送出處理中訊息，待檢測完成後以推送訊息傳送結果，
+        避免回覆令牌過期。
         
         Args:
             user_id: 發送訊息的使用者 ID
-            message_text: 訊息的文字內容
+            message_text: 訊息的文字內容；提供 export 時可為 None
             reply_token: 用於回覆此訊息的令牌
+            export: 上傳檔案解析出的 LINE 匯出，直接交給檢測服務
             
         Raises:
             AppError: 如果處理過程中發生錯誤
         """
         try:
-            # 如果需要，獲取使用者資料
-            user_profile = self.line_client.get_profile(user_id)
+            start = time.perf_counter()
+
+            # 僅在檢測策略需要時才獲取使用者資料（經由快取）
+            user_profile = None
+            if self.detection_service.needs_user_profile:
+                user_profile = self.profile_service.get_profile(user_id)
 
             # 對訊息進行詐騙檢測分析
             logger.info(f"分析來自 {user_id} 的訊息")
 
-            try:
-                detection_result = self.detection_service.analyze_message(
-                    message_text,
-                    user_id=user_id,
-                    user_profile=user_profile
+            if not self.reply_deadline:
+                response = self._detect_and_respond(message_text, user_id, user_profile, export)
+            else:
+                future = self._get_executor().submit(
+                    self._detect_and_respond, message_text, user_id, user_profile, export
                 )
-            except ValidationError as ve:
-                # 如果是驗證錯誤，向用戶致歉並提供指導
-                logger.warning(f"輸入驗證失敗: {str(ve)}")
-                error_response = "輸入格式無效。請提供 LINE 對話響錄格式的內容，例如由 LINE 對話室匯出的消息歷史。"
-                self.line_client.reply_message(reply_token, error_response)
-                # 直接返回，不繼續處理
-                return
-            except Exception as e:
-                # 如果檢測失敗，使用預設安全回應
-                logger.error(f"檢測失敗，使用預設回應: {str(e)}")
-                detection_result = {
-                    "label": "unknown",
-                    "confidence": 0.0,
-                    "reply": "很抱歉，我暫時無法處理您的訊息。請稍後再試。"
-                }
-            
-            # 根據檢測結果生成適當的回應
-            response = self._generate_response(detection_result)
+                try:
+                    response = future.result(timeout=self.reply_deadline)
+                except FuturesTimeoutError:
+                    # 超過延遲預算：先回覆處理中訊息，結果稍後推送；
+                    # 處理中訊息送出失敗時仍須推送結果
+                    try:
+                        self._reply_pending(user_id, reply_token, start)
+                    finally:
+                        future.add_done_callback(
+                            lambda f: self._push_deferred_result(user_id, f, start)
+                        )
+                    return
             
             # 將回應發送回使用者
             logger.info(f"回覆給 {user_id}")
             self.line_client.reply_message(reply_token, response)
+            metrics.histogram("conversation.reply.direct_seconds").observe(time.perf_counter() - start)
             
         except Exception as e:
             error_msg = f"處理文字訊息時發生錯誤: {str(e)}"
             logger.error(error_msg)
             raise AppError(error_msg, original_error=e)
 
+    @with_error_handling(reraise=True)
+    def process_file(self, user_id: str, file_id: Optional[str], file_name: str,
+                     file_size: int, reply_token: str) -> None:
+        """
+        處理使用者上傳的檔案：串流下載並解析 LINE 匯出檔後，將解析結果直接交給檢測服務，
+        不再組回文字重新解析。
+
+        Args:
+            user_id: 發送訊息的使用者 ID
+            file_id: 檔案訊息的 ID
+            file_name: 檔案名稱
+            file_size: 檔案大小（位元組）
+            reply_token: 用於回覆此訊息的令牌
+
+        Raises:
+            AppError: 如果下載或處理過程中發生錯誤
+        """
+        if not file_id:
+            raise AppError("檔案訊息缺少 'id' 字段")
+        if not self.export_file_service.is_supported(file_name):
+            self.line_client.reply_message(reply_token, FILE_NOT_SUPPORTED_REPLY.format(file_name=file_name))
+            return
+
+        try:
+            export = self.export_file_service.load(file_id, file_size)
+        except ValidationError as ve:
+            logger.warning(f"檔案 {file_name} 無法分析: {str(ve)}")
+            self.line_client.reply_message(reply_token, self._file_rejected_reply(ve, file_name))
+            return
+
+        self.process_message(user_id, None, reply_token, export=export)
+
+    def _detect_and_respond(self, message_text: Optional[str], user_id: str,
+                            user_profile: Optional[Dict[str, Any]],
+                            export: Optional[LineExport] = None) -> str:
+        """
+        執行檢測並產生回應文字。
+
+        Returns:
+            str: 要發送給使用者的回應；格式無效或檢測失敗時為對應的提示文字
+        """
+        try:
+            detection_result = self.detection_service.analyze_message(
+                message_text,
+                user_id=user_id,
+                user_profile=user_profile,
+                export=export
+            )
+        except ValidationError as ve:
+            # 如果是驗證錯誤，向用戶致歉並提供指導
+            logger.warning(f"輸入驗證失敗: {str(ve)}")
+            return INVALID_FORMAT_REPLY
+        except Exception as e:
+            # 如果檢測失敗，使用預設安全回應
+            logger.error(f"檢測失敗，使用預設回應: {str(e)}")
+            detection_result = dict(DETECTION_FAILED_RESULT)
+
+        # 根據檢測結果生成適當的回應
+        return self._generate_response(detection_result)
+
+    def _reply_pending(self, user_id: str, reply_token: str, start: float) -> None:
+        """以回覆令牌送出處理中訊息"""
+        logger.info(f"檢測超過 {self.reply_deadline} 秒，先回覆 {user_id} 處理中訊息")
+        metrics.counter("conversation.deferred").inc()
+        self.line_client.reply_message(reply_token, DETECTION_PENDING_REPLY)
+        metrics.histogram("conversation.reply.pending_seconds").observe(time.perf_counter() - start)
+
+    def _push_deferred_result(self, user_id: str, future, start: float) -> None:
+        """檢測完成後以推送訊息傳送結果"""
+        try:
+            response = future.result()
+            self.line_client.push_message(user_id, response)
+            metrics.histogram("conversation.push.deferred_seconds").observe(time.perf_counter() - start)
+            logger.info(f"已推送延遲的檢測結果給 {user_id}")
+        except Exception as e:
+            metrics.counter("conversation.push.failed").inc()
+            logger.error(f"推送延遲的檢測結果給 {user_id} 失敗: {str(e)}")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """延遲建立檢測執行緒池（避免在 fork 前建立執行緒）"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.detection_workers,
+                        thread_name_prefix="detection"
+                    )
+        return self._executor
+
+# === 非同步版本（ASGI 入口使用） ===
+    @with_async_error_handling(reraise=True)
+    async def process_event_async(self,
+                                  user_id: str,
+                                  reply_token: str,
+                                  event_type: str,
+                                  message: Dict[str, Any]) -> None:
+        """
+        process_event 的非同步版本，所有 LINE 呼叫皆使用非同步 HTTP。
+
+        Args:
+            user_id: 發送訊息的使用者 ID
+            reply_token: 用於回覆此訊息的令牌
+            event_type: 事件類型（例如："message"）
+            message: 完整的訊息物件
+
+        Raises:
+            AppError: 如果處理過程中發生錯誤
+        """
+        try:
+            message_type = message.get("type")
+
+            if message_type == "text":
+                if "text" not in message:
+                    raise AppError("文本訊息缺少 'text' 字段")
+
+                message_text = message["text"]
+                truncated_text = message_text[:100] + ("..." if len(message_text) > 100 else "")
+                logger.info(f"處理來自 {user_id} 的文字訊息: {truncated_text}")
+                await self.process_message_async(user_id, message_text, reply_token)
+
+            elif message_type == "image":
+                image_id = message.get("id")
+                if not image_id:
+                    raise AppError("圖片訊息缺少 'id' 字段")
+
+                logger.info(f"處理來自 {user_id} 的圖片，ID: {image_id}")
+                await self.line_client.reply_message_async(reply_token, IMAGE_NOT_SUPPORTED_REPLY)
+
+            elif message_type == "file":
+                file_id = message.get("id")
+                file_name = message.get("fileName", "未知檔案")
+                file_size = message.get("fileSize", 0)
+
+                logger.info(f"處理來自 {user_id} 的檔案: {file_name} ({file_size} bytes), ID: {file_id}")
+                await self.process_file_async(user_id, file_id, file_name, file_size, reply_token)
+
+            else:
+                logger.info(f"收到不支援的訊息類型: {message_type}")
+                await self.line_client.reply_message_async(reply_token, UNSUPPORTED_MESSAGE_REPLY)
+
+        except Exception as e:
+            error_msg = f"處理事件時發生錯誤: {str(e)}"
+            logger.error(error_msg)
+
+            try:
+                await self.line_client.reply_message_async(reply_token, PROCESSING_ERROR_REPLY)
+            except Exception as reply_error:
+                logger.error(f"無法發送錯誤回應: {str(reply_error)}")
+
+            raise AppError(error_msg, original_error=e)
+
+    @with_async_error_handling(reraise=True)
+    async def process_message_async(self, user_id: str, message_text: Optional[str], reply_token: str,
+                                    export: Optional[LineExport] = None) -> None:
+        """
+        process_message 的非同步版本，同樣依延遲預算決定直接回覆或延遲推送。
+
+        Args:
+            user_id: 發送訊息的使用者 ID
+            message_text: 訊息的文字內容；提供 export 時可為 None
+            reply_token: 用於回覆此訊息的令牌
+            export: 上傳檔案解析出的 LINE 匯出，直接交給檢測服務
+
+        Raises:
+            AppError: 如果處理過程中發生錯誤
+        """
+        try:
+            start = time.perf_counter()
+
+            user_profile = None
+            if self.detection_service.needs_user_profile:
+                user_profile = await self.profile_service.get_profile_async(user_id)
+
+            logger.info(f"分析來自 {user_id} 的訊息")
+
+            task = asyncio.ensure_future(
+                self._detect_and_respond_async(message_text, user_id, user_profile, export)
+            )
+            if not self.reply_deadline:
+                response = await task
+            else:
+                try:
+                    response = await asyncio.wait_for(asyncio.shield(task), self.reply_deadline)
+                except asyncio.TimeoutError:
+                    logger.info(f"檢測超過 {self.reply_deadline} 秒，先回覆 {user_id} 處理中訊息")
+                    metrics.counter("conversation.deferred").inc()
+                    try:
+                        await self.line_client.reply_message_async(reply_token, DETECTION_PENDING_REPLY)
+                        metrics.histogram("conversation.reply.pending_seconds").observe(time.perf_counter() - start)
+                    finally:
+                        # 處理中訊息送出失敗時仍須推送結果
+                        deferred = asyncio.ensure_future(self._push_deferred_result_async(user_id, task, start))
+                        self._deferred_tasks.add(deferred)
+                        deferred.add_done_callback(self._deferred_tasks.discard)
+                    return
+
+            logger.info(f"回覆給 {user_id}")
+            await self.line_client.reply_message_async(reply_token, response)
+            metrics.histogram("conversation.reply.direct_seconds").observe(time.perf_counter() - start)
+
+        except Exception as e:
+            error_msg = f"處理文字訊息時發生錯誤: {str(e)}"
+            logger.error(error_msg)
+            raise AppError(error_msg, original_error=e)
+
+    @with_async_error_handling(reraise=True)
+    async def process_file_async(self, user_id: str, file_id: Optional[str], file_name: str,
+                                 file_size: int, reply_token: str) -> None:
+        """process_file 的非同步版本"""
+        if not file_id:
+            raise AppError("檔案訊息缺少 'id' 字段")
+        if not self.export_file_service.is_supported(file_name):
+            await self.line_client.reply_message_async(
+                reply_token, FILE_NOT_SUPPORTED_REPLY.format(file_name=file_name)
+            )
+            return
+
+        try:
+            export = await self.export_file_service.load_async(file_id, file_size)
+        except ValidationError as ve:
+            logger.warning(f"檔案 {file_name} 無法分析: {str(ve)}")
+            await self.line_client.reply_message_async(reply_token, self._file_rejected_reply(ve, file_name))
+            return
+
+        await self.process_message_async(user_id, None, reply_token, export=export)
+
+    async def _detect_and_respond_async(self, message_text: Optional[str], user_id: str,
+                                        user_profile: Optional[Dict[str, Any]],
+                                        export: Optional[LineExport] = None) -> str:
+        """_detect_and_respond 的非同步版本"""
+        try:
+            detection_result = await self.detection_service.analyze_message_async(
+                message_text,
+                user_id=user_id,
+                user_profile=user_profile,
+                export=export
+            )
+        except ValidationError as ve:
+            logger.warning(f"輸入驗證失敗: {str(ve)}")
+            return INVALID_FORMAT_REPLY
+        except Exception as e:
+            logger.error(f"檢測失敗，使用預設回應: {str(e)}")
+            detection_result = dict(DETECTION_FAILED_RESULT)
+
+        return self._generate_response(detection_result)
+
+    async def _push_deferred_result_async(self, user_id: str, task: "asyncio.Future", start: float) -> None:
+        """_push_deferred_result 的非同步版本"""
+        try:
+            response = await task
+            await self.line_client.push_message_async(user_id, response)
+            metrics.histogram("conversation.push.deferred_seconds").observe(time.perf_counter() - start)
+            logger.info(f"已推送延遲的檢測結果給 {user_id}")
+        except Exception as e:
+            metrics.counter("conversation.push.failed").inc()
+            logger.error(f"推送延遲的檢測結果給 {user_id} 失敗: {str(e)}")
+
 # === 輔助方法 ===
+    def _file_rejected_reply(self, error: ValidationError, file_name: str) -> str:
+        """檔案過大或格式無效時的提示文字"""
+        if error.status_code == FILE_TOO_LARGE_STATUS:
+            max_mb = self.export_file_service.max_bytes / (1024 * 1024)
+            return FILE_TOO_LARGE_REPLY.format(file_name=file_name, max_mb=round(max_mb, 1))
+        return INVALID_FORMAT_REPLY
+
     def _generate_response(self, detection_result: Dict[str, Any]) -> str:
         """
         根據檢測結果生成回應。
@@ -185,6 +490,14 @@ class ConversationService:
              logger.warning(f"檢測結果中的 reply 不是字串: {reply}")
              reply = str(reply) # 嘗試轉換為字串
 
+        # 單則訊息看似無害、但累積的對話風險偏高時，附加提醒
+        conversation = detection_result.get("conversation")
+        if isinstance(conversation, dict) and conversation.get("alert"):
+            reply += CONVERSATION_RISK_NOTE.format(
+                count=conversation.get("message_count", 0),
+                stage=conversation.get("stage", "未明確分類")
+            )
+
         # 記錄最終要發送的回覆（截斷以防過長）
         truncated_reply = reply[:200] + ("..." if len(reply) > 200 else "")
         logger.info(f"最終生成的回應: {truncated_reply}")
@@ -0,0 +1,223 @@
+"""
+對話壓縮 - 領域服務層
+
+LINE 匯出送給 LLM 前先解析並壓縮，控制在 token 預算內：
+- 移除非內容行：匯出標頭、系統訊息（語音通話、收回訊息等）、貼圖/照片等佔位訊息
+- 合併同一發送者連續重複的訊息
+- 超過預算時保留最近的訊息，以及關鍵詞命中最密集的訊息及其前後文，
+  略過的區段以一行標記說明
+- 最新一則訊息本身就超過預算時截斷其內容，壓縮結果至少保留一則訊息
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Union
+
+from utils.agents.tokens import estimate_tokens
+from utils.fraud_sentiment import KIND_TEXT, LineExport, parse_line_export
+from utils.logger import get_service_logger
+
+# 取得模組特定的日誌記錄器
+logger = get_service_logger("conversation_compactor")
+
+# 略過區段的標記
+SKIP_MARKER = "…（略過 {count} 則訊息）"
+# 截斷訊息內容的結尾標記
+TRUNCATED_SUFFIX = "…"
+
+
+@dataclass
+class _Message:
+    date: Optional[str]
+    time: str
+    sender: str
+    content: str
+    repeat: int = 1
+    hits: int = 0
+
+    def render(self) -> str:
+        suffix = f" ×{self.repeat}" if self.repeat > 1 else ""
+        return f"{self.time} {self.sender} {self.content}{suffix}"
+
+
+@dataclass
+class CompactedConversation:
+    """壓縮結果"""
+    text: str
+    total_messages: int      # 移除非內容行並合併重複後的訊息數
+    kept_messages: int
+    dropped_lines: int       # 移除的非內容行數
+    collapsed: int           # 合併的重複訊息數
+    original_tokens: int
+    tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.original_tokens - self.tokens)
+
+    def summary(self) -> Dict[str, Any]:
+        """附加在檢測結果中的壓縮摘要"""
+        return {
+            "messages": self.kept_messages,
+            "total_messages": self.total_messages,
+            "dropped_lines": self.dropped_lines,
+            "collapsed": self.collapsed,
+            "original_tokens": self.original_tokens,
+            "tokens": self.tokens,
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+def parse_messages(source: Union[str, LineExport]):
+    """
+    將 LINE 匯出的訊息紀錄轉為待壓縮的訊息列表，移除非內容訊息並合併連續重複訊息。
+
+    Args:
+        source: LINE 匯出文字，或已解析的 LineExport（例如驗證時產生的結果）
+
+    Returns:
+        Tuple[List[_Message], int, int]: (訊息, 移除的非內容行數, 合併的重複訊息數)
+    """
+    export = parse_line_export(source) if isinstance(source, str) else source
+    messages: List[_Message] = []
+    dropped = export.parser.header_lines + export.parser.unparsed_lines
+    collapsed = 0
+    for record in export.messages:
+        if record.kind != KIND_TEXT:
+            # 系統訊息與貼圖/照片等佔位訊息
+            dropped += 1
+            continue
+        sender = export.sender_name(record)
+        previous = messages[-1] if messages else None
+        if previous is not None and previous.sender == sender and previous.content == record.content:
+            previous.repeat += 1
+            previous.time = record.time
+            collapsed += 1
+            continue
+        messages.append(_Message(record.date, record.time, sender, record.content))
+    return messages, dropped, collapsed
+
+
+def _render(messages: List[_Message], selected: List[int]) -> str:
+    """依原始順序輸出已選取的訊息，補上日期分隔行與略過標記"""
+    lines = []
+    date = None
+    previous = -1
+    for index in sorted(selected):
+        if index - previous > 1:
+            lines.append(SKIP_MARKER.format(count=index - previous - 1))
+        message = messages[index]
+        if message.date and message.date != date:
+            date = message.date
+            lines.append(date)
+        lines.append(message.render())
+        previous = index
+    if messages and previous < len(messages) - 1:
+        lines.append(SKIP_MARKER.format(count=len(messages) - 1 - previous))
+    return "\n".join(lines)
+
+
+def _truncate(messages: List[_Message], index: int, token_budget: int) -> None:
+    """截斷單則訊息的內容，使只輸出該則訊息時不超過預算（預算過小時只留截斷標記）"""
+    message = messages[index]
+    content = message.content
+    low, high = 0, len(content)
+    while low < high:
+        middle = (low + high + 1) // 2
+        message.content = content[:middle] + TRUNCATED_SUFFIX
+        if estimate_tokens(_render(messages, [index])) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    message.content = content[:low] + TRUNCATED_SUFFIX
+
+
+def compact_conversation(text: Optional[str], token_budget: int, automaton=None,
+                         recent_messages: int = 20, context: int = 2,
+                         export: Optional[LineExport] = None) -> CompactedConversation:
+    """
+    將 LINE 匯出壓縮到 token 預算內。
+
+    Args:
+        text: LINE 匯出文字；提供 export 時可為 None，原始 token 數改以 export 的各行估計
+        token_budget: 壓縮後的 token 上限（估計值），0 表示只移除非內容行與合併重複
+        automaton: 關鍵字自動機（KeywordAutomaton），用於找出關鍵詞密集的區段；None 則只保留最近訊息
+        recent_messages: 優先保留的最近訊息數
+        context: 關鍵詞命中訊息前後各保留的訊息數
+        export: text 已解析的結果，提供時不再重新解析
+
+    Returns:
+        CompactedConversation: 壓縮結果；無法解析出任何訊息時回傳原文
+    """
+    if text is None:
+        original_tokens = sum(estimate_tokens(line) for line in export.iter_lines())
+    else:
+        original_tokens = estimate_tokens(text)
+    messages, dropped, collapsed = parse_messages(export if export is not None else text)
+    if not messages:
+        return CompactedConversation(text if text is not None else export.to_text(), 0, 0, dropped, collapsed, original_tokens, original_tokens)
+
+    all_indices = list(range(len(messages)))
+    costs = [estimate_tokens(message.render()) for message in messages]
+    if token_budget <= 0 or sum(costs) <= token_budget:
+        compacted = _render(messages, all_indices)
+        return CompactedConversation(compacted, len(messages), len(messages), dropped, collapsed,
+                                     original_tokens, estimate_tokens(compacted))
+
+    # 依優先順序選取訊息：最近的訊息，接著是關鍵詞最密集的區段
+    priority: List[int] = []
+    chosen: Set[int] = set()
+    used = 0
+
+    def take(index: int) -> bool:
+        nonlocal used
+        if index in chosen:
+            return True
+        if used + costs[index] > token_budget:
+            return False
+        chosen.add(index)
+        priority.append(index)
+        used += costs[index]
+        return True
+
+    for index in range(len(messages) - 1, max(-1, len(messages) - 1 - recent_messages), -1):
+        if not take(index):
+            break
+
+    if not chosen:
+        # 最新一則訊息本身就超過預算：截斷後保留，避免回傳空的選取結果
+        last = len(messages) - 1
+        _truncate(messages, last, token_budget)
+        costs[last] = estimate_tokens(messages[last].render())
+        chosen.add(last)
+        priority.append(last)
+        used += costs[last]
+
+    if automaton is not None:
+        for message in messages:
+            message.hits = len(automaton.scan(message.content).hits)
+        hit_indices = [i for i, message in enumerate(messages) if message.hits]
+
+        def density(index: int) -> int:
+            return sum(messages[i].hits for i in range(max(0, index - context),
+                                                       min(len(messages), index + context + 1)))
+
+        # 密度高者優先，同密度時較新者優先
+        for index in sorted(hit_indices, key=lambda i: (density(i), i), reverse=True):
+            if not take(index):
+                continue
+            for distance in range(1, context + 1):
+                for neighbour in (index - distance, index + distance):
+                    if 0 <= neighbour < len(messages):
+                        take(neighbour)
+
+    # 日期行與略過標記也佔用 token，超出預算時依優先順序由後往前移除
+    compacted = _render(messages, priority)
+    tokens = estimate_tokens(compacted)
+    while tokens > token_budget and len(priority) > 1:
+        priority.pop()
+        compacted = _render(messages, priority)
+        tokens = estimate_tokens(compacted)
+
+    logger.debug(f"對話壓縮：{len(messages)} 則保留 {len(priority)} 則，約 {original_tokens} → {tokens} tokens")
+    return CompactedConversation(compacted, len(messages), len(priority), dropped, collapsed,
+                                 original_tokens, tokens)
@@ -0,0 +1,209 @@
+"""
+對話狀態 - 領域服務層
+
+為每位使用者維護有界的增量對話狀態，取代已棄用的 StorageService：
+- 最近訊息的環形緩衝區（固定長度，只保存截斷後的短摘要）
+- 依理論階段規則（theory_stage_classifier）累積的目前詐騙階段
+- 隨時間指數衰減的風險分數
+
+每則新訊息只掃描該訊息本身並以 O(1) 更新狀態，不重新處理歷史訊息；
+使用者狀態以 LRU/TTL 快取保存，閒置過久或超過上限時淘汰。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Union
+
+from utils.cache import TTLCache
+from utils.fraud_sentiment import (
+    CLASSIFIER_LABELS, KeywordAutomaton, LineExport, classify_stage_ids, get_default_automaton
+)
+from utils.logger import get_service_logger
+from utils.metrics import metrics
+
+# 取得模組特定的日誌記錄器
+logger = get_service_logger("conversation_state")
+
+# 無法由機率推得風險時，依標籤文字判斷的風險權重
+_HIGH_RISK_MARKERS = ("高風險", "詐騙", "scam", "fraud")
+_MEDIUM_RISK_MARKERS = ("疑慮", "可疑", "注意", "suspicious")
+
+# 環形緩衝區中每則訊息保存的最大字元數
+MAX_MESSAGE_CHARS = 200
+# 上傳 LINE 匯出時保存的摘要：訊息數與最後一則文字訊息
+EXPORT_SUMMARY = "[LINE 匯出 {count} 則訊息] {last}"
+
+
+def summarize_message(message: Union[str, LineExport]) -> str:
+    """
+    將訊息轉為環形緩衝區保存的短摘要，避免長訊息或整份匯出常駐記憶體。
+
+    Args:
+        message: 新訊息或上傳檔案解析出的 LINE 匯出
+
+    Returns:
+        str: 最多 MAX_MESSAGE_CHARS 字元的摘要
+    """
+    if isinstance(message, LineExport):
+        texts = message.texts()
+        message = EXPORT_SUMMARY.format(count=len(texts), last=texts[-1] if texts else "")
+    return message[:MAX_MESSAGE_CHARS]
+
+
+def result_risk(result: Dict[str, Any]) -> float:
+    """
+    由單則訊息的檢測結果估計風險分數（0~1）。
+
+    - 結果含 risk_score（關鍵詞、集成策略）時直接使用
+    - 分類器標籤：依風險等級（安全 0、情感連結 0.5、高風險 1）乘上可信度
+    - 其他策略：依標籤文字判斷
+
+    Args:
+        result: 檢測結果
+
+    Returns:
+        float: 風險分數
+    """
+    if not isinstance(result, dict):
+        return 0.0
+    label = str(result.get("label", ""))
+    confidence = result.get("confidence")
+    confidence = float(confidence) if isinstance(confidence, (int, float)) else 1.0
+    if isinstance(result.get("risk_score"), (int, float)):
+        return min(1.0, max(0.0, float(result["risk_score"])))
+    if label in CLASSIFIER_LABELS:
+        severity = CLASSIFIER_LABELS.index(label) / (len(CLASSIFIER_LABELS) - 1)
+    elif any(marker in label for marker in _HIGH_RISK_MARKERS):
+        severity = 1.0
+    elif any(marker in label for marker in _MEDIUM_RISK_MARKERS):
+        severity = 0.5
+    else:
+        severity = 0.0
+    return min(1.0, max(0.0, severity * confidence))
+
+
+class ConversationState:
+    """單一使用者的增量對話狀態"""
+
+    __slots__ = ("messages", "stage_id", "risk", "mean_risk", "message_count", "updated_at")
+
+    def __init__(self, history_size: int):
+        """
+        Args:
+            history_size: 環形緩衝區保留的最近訊息數
+        """
+        self.messages: deque = deque(maxlen=max(1, history_size))
+        self.stage_id: Optional[int] = None
+        self.risk = 0.0
+        self.mean_risk = 0.0
+        self.message_count = 0
+        self.updated_at: Optional[float] = None
+
+    @property
+    def stage(self) -> str:
+        """目前累積的詐騙階段（已命中的最進階階段）"""
+        return classify_stage_ids([] if self.stage_id is None else [self.stage_id])
+
+    def update(self, message: Union[str, LineExport], risk: float, stage_ids, half_life: float, alpha: float,
+               now: Optional[float] = None) -> None:
+        """
+        以新訊息更新狀態。
+
+        Args:
+            message: 新訊息或上傳檔案解析出的 LINE 匯出（只保存短摘要）
+            risk: 新訊息的風險分數
+            stage_ids: 新訊息命中的階段索引
+            half_life: 風險分數的半衰期（秒）
+            alpha: 平均風險的指數移動平均權重
+            now: 目前時間（time.time()），預設為現在
+        """
+        now = time.time() if now is None else now
+        if self.updated_at is not None and half_life > 0:
+            # 距上一則訊息越久，先前累積的風險衰減越多
+            decay = 0.5 ** (max(0.0, now - self.updated_at) / half_life)
+            self.risk *= decay
+            self.mean_risk *= decay
+        self.risk = max(self.risk, risk)
+        self.mean_risk = risk if self.message_count == 0 else alpha * risk + (1 - alpha) * self.mean_risk
+
+        if stage_ids:
+            self.stage_id = max(max(stage_ids), -1 if self.stage_id is None else self.stage_id)
+        self.messages.append(summarize_message(message))
+        self.message_count += 1
+        self.updated_at = now
+
+    def to_dict(self) -> Dict[str, Any]:
+        """附加在檢測結果中的狀態摘要"""
+        return {
+            "stage": self.stage,
+            "risk": round(self.risk, 4),
+            "mean_risk": round(self.mean_risk, 4),
+            "message_count": self.message_count,
+            "recent_messages": len(self.messages),
+        }
+
+
+class ConversationStateStore:
+    """以使用者 ID 保存對話狀態的有界儲存"""
+
+    def __init__(self, max_users: int = 10000, ttl: Optional[float] = 86400,
+                 history_size: int = 20, half_life: float = 3600, alpha: float = 0.3,
+                 alert_threshold: float = 0.7, automaton: Optional[KeywordAutomaton] = None):
+        """
+        Args:
+            max_users: 最多保存的使用者數，超過時淘汰最久未更新者
+            ttl: 使用者閒置多久（秒）後淘汰狀態，None 表示不過期
+            history_size: 每位使用者保留的最近訊息數
+            half_life: 風險分數的半衰期（秒），0 表示不衰減
+            alpha: 平均風險的指數移動平均權重
+            alert_threshold: 累積風險達此值、但新訊息本身未達時，於摘要標記 alert 提醒使用者
+            automaton: 關鍵字自動機，預設使用行程共用的自動機
+        """
+        self.states = TTLCache(max_size=max_users, ttl=ttl)
+        self.history_size = history_size
+        self.half_life = half_life
+        self.alpha = alpha
+        self.alert_threshold = alert_threshold
+        # 共用的關鍵字自動機，只使用其中的理論階段命中
+        self.automaton = automaton or get_default_automaton()
+        self._lock = threading.Lock()
+        self._users = metrics.gauge("conversation.state.users")
+
+    def update(self, user_id: str, message_text: Union[str, LineExport], result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        以新訊息及其檢測結果更新使用者狀態。
+
+        Args:
+            user_id: 使用者 ID
+            message_text: 新訊息，或上傳檔案解析出的 LINE 匯出（逐則掃描文字訊息的內容）
+            result: 新訊息的檢測結果
+
+        Returns:
+            Dict[str, Any]: 更新後的狀態摘要（stage、risk、mean_risk、message_count、recent_messages、alert）
+        """
+        if isinstance(message_text, LineExport):
+            stage_ids = sorted({i for text in message_text.texts() for i in self.automaton.scan(text).stage_ids})
+        else:
+            stage_ids = self.automaton.scan(message_text).stage_ids
+        risk = result_risk(result)
+        with self._lock:
+            state = self.states.get(user_id)
+            if state is None:
+                state = ConversationState(self.history_size)
+            state.update(message_text, risk, stage_ids, self.half_life, self.alpha)
+            # 重新寫入以更新 TTL 與 LRU 順序
+            self.states.set(user_id, state)
+            summary = state.to_dict()
+            self._users.set(len(self.states))
+        summary["alert"] = summary["risk"] >= self.alert_threshold > risk
+        logger.debug(f"更新 {user_id} 的對話狀態: {summary}")
+        return summary
+
+    def get(self, user_id: str) -> Optional[ConversationState]:
+        """取得使用者目前的對話狀態"""
+        return self.states.get(user_id)
+
+    def clear(self, user_id: str) -> None:
+        """清除使用者的對話狀態"""
+        self.states.pop(user_id)
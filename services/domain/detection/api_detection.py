@@ -2,26 +2,81 @@
 API 檢測策略
 
 此模組實現了基於外部 API 的詐騙檢測策略。
+外部 API 斷路器開啟或呼叫失敗時，改用本地後備策略（API_FALLBACK_STRATEGY）回覆，
+結果標記 fallback 欄位。
 """
 
+import asyncio
+import os
+
 from .base import DetectionStrategy
 from utils.logger import get_service_logger
-from utils.error_handler import DetectionError, with_error_handling
+from utils.metrics import metrics
+from utils.circuit_breaker import CircuitOpenError
+from utils.error_handler import DetectionError, with_error_handling, with_async_error_handling
 
 # 取得模組特定的日誌記錄器
 logger = get_service_logger("api_detection")
 
 class ApiDetectionStrategy(DetectionStrategy):
     """使用外部 API 的檢測策略"""
+
+    # 使用者資料會一併送往外部 API
+    needs_user_profile = True
+    # 結果可能依使用者資料而不同，不依內容快取
+    cacheable = False
     
-    def __init__(self, analysis_client):
+    def __init__(self, analysis_client, fallback=None):
         """
         初始化 API 檢測策略。
         
         Args:
             analysis_client: 外部分析 API 客戶端
+            fallback: API 無法使用時的後備策略名稱（keyword、bert、none），
+                預設讀取 API_FALLBACK_STRATEGY（預設 keyword）
         """
         self.analysis_client = analysis_client
+        self.fallback_name = (fallback or os.getenv("API_FALLBACK_STRATEGY", "keyword")).lower()
+        self.fallback = self._build_fallback(self.fallback_name)
+        self._fallback_count = metrics.counter("detection.api.fallback")
+
+    @staticmethod
+    def _build_fallback(name):
+        """依名稱建立後備策略，none 表示不使用後備、直接拋出錯誤"""
+        if name == "keyword":
+            from .keyword_detection import KeywordDetectionStrategy
+            return KeywordDetectionStrategy()
+        if name == "bert":
+            from .frauddetect import FraudSentimentDetectionStrategy
+            return FraudSentimentDetectionStrategy()
+        if name != "none":
+            logger.warning(f"未知的 API 後備策略: {name}，不使用後備")
+        return None
+
+    def _use_fallback(self, error):
+        """
+        記錄 API 錯誤；有後備策略時由呼叫端改用後備策略。
+
+        Raises:
+            DetectionError: 未設定後備策略時
+        """
+        if isinstance(error, CircuitOpenError):
+            error_msg = f"外部 API 暫停使用: {error.message}"
+            status_code = 503
+        else:
+            error_msg = f"API 檢測過程中發生錯誤: {str(error)}"
+            status_code = 500
+        if self.fallback is None:
+            logger.error(error_msg)
+            raise DetectionError(error_msg, status_code=status_code, original_error=error)
+        logger.warning(f"{error_msg}，改用 {self.fallback_name} 後備策略")
+        self._fallback_count.inc()
+
+    def _mark_fallback(self, result):
+        """在後備策略的結果中標記 fallback 來源"""
+        result = dict(result)
+        result["fallback"] = self.fallback_name
+        return result
     
     @with_error_handling(reraise=True)
     def analyze(self, message_text, user_id=None, user_profile=None):
@@ -34,10 +89,10 @@ class ApiDetectionStrategy(DetectionStrategy):
             user_profile: 可選的使用者資料
 
         Returns:
-            dict: 包含標籤、可信度和回覆的分析結果
+            dict: 包含標籤、可信度和回覆的分析結果；改用後備策略時含 fallback
             
         Raises:
-            DetectionError: 如果檢測過程中發生錯誤
+            DetectionError: 如果檢測過程中發生錯誤且未設定後備策略
         """
         logger.info("使用外部 API 檢測策略")
         
@@ -58,6 +113,41 @@ class ApiDetectionStrategy(DetectionStrategy):
             # 呼叫外部 API
             return self.analysis_client.analyze_text(analysis_data)
         except Exception as e:
-            error_msg = f"API 檢測過程中發生錯誤: {str(e)}"
+            self._use_fallback(e)
+        return self._mark_fallback(self.fallback.analyze(message_text, user_id, user_profile))
+
+    @with_async_error_handling(reraise=True)
+    async def analyze_async(self, message_text, user_id=None, user_profile=None):
+        """
+        analyze 的非同步版本，使用客戶端的非同步 HTTP 連線。
+
+        Args:
+            message_text: 要分析的文字
+            user_id: 可選的使用者 ID 作為上下文
+            user_profile: 可選的使用者資料
+
+        Returns:
+            dict: 包含標籤、可信度和回覆的分析結果；改用後備策略時含 fallback
+
+        Raises:
+            DetectionError: 如果檢測過程中發生錯誤且未設定後備策略
+        """
+        logger.info("使用外部 API 檢測策略（非同步）")
+
+        if not message_text or not isinstance(message_text, str):
+            error_msg = "訊息文本必須是非空字串"
             logger.error(error_msg)
-            raise DetectionError(error_msg, original_error=e)
+            raise DetectionError(error_msg, status_code=400)
+
+        analysis_data = {
+            "user_id": user_id,
+            "message": message_text,
+            "user_profile": user_profile
+        }
+
+        try:
+            return await self.analysis_client.analyze_text_async(analysis_data)
+        except Exception as e:
+            self._use_fallback(e)
+        result = await asyncio.to_thread(self.fallback.analyze, message_text, user_id, user_profile)
+        return self._mark_fallback(result)
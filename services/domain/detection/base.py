@@ -1,9 +1,30 @@
 from abc import ABC, abstractmethod
 
 class DetectionStrategy(ABC):
+    # 策略是否會使用 LINE 使用者資料；為 False 時對話服務不會取得使用者資料
+    needs_user_profile = False
+    # 結果是否只取決於訊息內容；為 True 時 DetectionService 會依內容快取結果
+    cacheable = True
+    # analyze 是否接受 export 參數（已解析的 LINE 匯出）；為 True 時 DetectionService 直接傳入解析結果，
+    # message_text 可為 None，否則改傳 export.to_text()
+    accepts_export = False
+
+    @property
+    def cache_version(self) -> str:
+        """
+        策略/模型版本標識，作為結果快取鍵的一部分；更換模型時應隨之改變
+        """
+        return type(self).__name__
+
     @abstractmethod
+    def analyze(self, message_text: str, user_id=None, user_profile=None) -> dict:
+        """
+        分析訊息，回傳包含 label、confidence、reply 的 dict 結果
+        """
+        pass
+
     def detect(self, text: str) -> dict:
         """
         分析輸入文字，回傳包含標籤與風險分數的 dict 結果
         """
-        pass
\ No newline at end of file
+        return self.analyze(text)
@@ -0,0 +1,197 @@
+"""
+串接檢測策略
+
+依成本由低到高逐層判斷，只有在前一層不確定時才進入下一層：
+1. keyword: 關鍵詞評分與詐騙階段規則，命中程度足夠時直接判定
+2. bert: BERT 詐騙分類器，可信度落在不確定區間外時直接判定
+3. agent: ADK agent（LLM）深度分析
+
+LINE 匯出只在進入串接時驗證並解析一次，各層共用同一份解析結果。
+結果中的 tier 欄位記錄由哪一層做出判定。
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from .base import DetectionStrategy
+from .frauddetect import FraudSentimentDetectionStrategy
+from .local_detection import LocalDetectionStrategy
+from utils.logger import get_service_logger
+from utils.metrics import metrics
+from utils.error_handler import DetectionError, ValidationError, with_error_handling, with_async_error_handling
+from utils.validator import parse_validated_line_export
+from utils.fraud_sentiment import LineExport, classify_stage_ids
+
+# 取得模組特定的日誌記錄器
+logger = get_service_logger("cascade_detection")
+
+TIER_KEYWORD = "keyword"
+TIER_BERT = "bert"
+TIER_AGENT = "agent"
+
+HIGH_RISK_LABEL = "高風險詐騙徵兆"
+
+
+class CascadeDetectionStrategy(DetectionStrategy):
+    """關鍵詞 → BERT → agent 的串接檢測策略"""
+
+    accepts_export = True
+
+    def __init__(self,
+                 keyword_strategy: Optional[LocalDetectionStrategy] = None,
+                 bert_strategy: Optional[FraudSentimentDetectionStrategy] = None,
+                 keyword_threshold: Optional[float] = None,
+                 uncertain_low: Optional[float] = None,
+                 uncertain_high: Optional[float] = None):
+        """
+        Args:
+            keyword_strategy: 提供關鍵詞分析與 agent 的本地策略（同時作為第一層與第三層）
+            bert_strategy: BERT 分類策略（第二層）
+            keyword_threshold: 關鍵詞風險評分達到此值即判定為高風險
+            uncertain_low: BERT 可信度不確定區間下限（含）
+            uncertain_high: BERT 可信度不確定區間上限（不含）
+        """
+        self.keyword_strategy = keyword_strategy or LocalDetectionStrategy()
+        self.bert_strategy = bert_strategy or FraudSentimentDetectionStrategy()
+        self.keyword_threshold = keyword_threshold if keyword_threshold is not None \
+            else float(os.getenv("CASCADE_KEYWORD_THRESHOLD", 0.8))
+        self.uncertain_low = uncertain_low if uncertain_low is not None \
+            else float(os.getenv("CASCADE_UNCERTAIN_LOW", 0.5))
+        self.uncertain_high = uncertain_high if uncertain_high is not None \
+            else float(os.getenv("CASCADE_UNCERTAIN_HIGH", 0.85))
+        logger.info(
+            f"串接檢測策略：關鍵詞門檻 {self.keyword_threshold}，"
+            f"BERT 不確定區間 [{self.uncertain_low}, {self.uncertain_high})"
+        )
+
+    @property
+    def cache_version(self) -> str:
+        return (
+            f"{type(self).__name__}:{self.keyword_threshold}:{self.uncertain_low}:{self.uncertain_high}|"
+            f"{self.bert_strategy.cache_version}|{self.keyword_strategy.cache_version}"
+        )
+
+    @with_error_handling(reraise=True)
+    def analyze(self, message_text: Optional[str], user_id: Optional[str] = None,
+                user_profile: Optional[Dict[str, Any]] = None,
+                export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """
+        逐層分析訊息，由最先能確定的一層回傳結果。
+
+        Args:
+            message_text: 要分析的文字 (預期是 LINE 匯出格式)；提供 export 時可為 None
+            user_id: 可選的使用者 ID 作為上下文
+            user_profile: 可選的使用者資料
+            export: 已驗證並解析的 LINE 匯出，提供時不再解析 message_text
+
+        Returns:
+            dict: 包含標籤、可信度、回覆與判定層級 tier 的分析結果
+
+        Raises:
+            ValidationError: 如果輸入不是 LINE 匯出格式
+            DetectionError: 如果檢測過程中發生錯誤
+        """
+        if export is None:
+            export = self._validate(message_text)
+
+        keyword_result = self._keyword_tier(message_text, export)
+        if keyword_result["decided"]:
+            return self._finish(TIER_KEYWORD, self._keyword_verdict(keyword_result), keyword_result)
+
+        bert_result = self.bert_strategy.analyze(message_text, export=export)
+        if not self._is_uncertain(bert_result):
+            return self._finish(TIER_BERT, bert_result, keyword_result)
+
+        try:
+            agent_result = self.keyword_strategy.analyze(
+                message_text, user_id=user_id, user_profile=user_profile, export=export
+            )
+        except ValidationError:
+            raise
+        except Exception as e:
+            logger.error(f"agent 分析失敗，改用 BERT 結果: {str(e)}")
+            return self._finish(TIER_BERT, bert_result, keyword_result)
+        return self._finish(TIER_AGENT, agent_result, keyword_result, fallback=bert_result)
+
+    @with_async_error_handling(reraise=True)
+    async def analyze_async(self, message_text: Optional[str], user_id: Optional[str] = None,
+                            user_profile: Optional[Dict[str, Any]] = None,
+                            export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """analyze 的非同步版本；BERT 推論在執行緒中執行，agent 使用非同步 Runner"""
+        if export is None:
+            export = self._validate(message_text)
+
+        keyword_result = self._keyword_tier(message_text, export)
+        if keyword_result["decided"]:
+            return self._finish(TIER_KEYWORD, self._keyword_verdict(keyword_result), keyword_result)
+
+        bert_result = await asyncio.to_thread(self.bert_strategy.analyze, message_text, export=export)
+        if not self._is_uncertain(bert_result):
+            return self._finish(TIER_BERT, bert_result, keyword_result)
+
+        try:
+            agent_result = await self.keyword_strategy.analyze_async(
+                message_text, user_id=user_id, user_profile=user_profile, export=export
+            )
+        except ValidationError:
+            raise
+        except Exception as e:
+            logger.error(f"agent 分析失敗，改用 BERT 結果: {str(e)}")
+            return self._finish(TIER_BERT, bert_result, keyword_result)
+        return self._finish(TIER_AGENT, agent_result, keyword_result, fallback=bert_result)
+
+    # === 輔助方法 ===
+
+    @staticmethod
+    def _validate(message_text: str) -> LineExport:
+        """驗證並解析 LINE 匯出，供各層共用"""
+        if not message_text or not isinstance(message_text, str):
+            error_msg = "訊息文本必須是非空字串"
+            logger.error(error_msg)
+            raise DetectionError(error_msg, status_code=400)
+        return parse_validated_line_export(message_text)
+
+    def _keyword_tier(self, text: Optional[str], export: LineExport) -> Dict[str, Any]:
+        """關鍵詞評分與詐騙階段判斷"""
+        analysis = self.keyword_strategy._keyword_analysis(text, export)
+        analysis["stage"] = classify_stage_ids(analysis["stage_ids"])
+        analysis["decided"] = analysis["risk_score"] >= self.keyword_threshold
+        return analysis
+
+    @staticmethod
+    def _keyword_verdict(keyword_result: Dict[str, Any]) -> Dict[str, Any]:
+        confidence = keyword_result["risk_score"]
+        keywords = "、".join(keyword_result["found_keywords"][:5])
+        return {
+            "label": HIGH_RISK_LABEL,
+            "confidence": confidence,
+            "reply": (
+                f"⚠️ 警告：此對話出現多個詐騙關鍵詞（{keywords}），"
+                f"疑似處於「{keyword_result['stage']}」階段。請提高警覺！"
+            )
+        }
+
+    def _is_uncertain(self, bert_result: Dict[str, Any]) -> bool:
+        confidence = bert_result.get("confidence")
+        if confidence is None:
+            return True
+        return self.uncertain_low <= confidence < self.uncertain_high
+
+    @staticmethod
+    def _finish(tier: str, result: Any, keyword_result: Dict[str, Any],
+                fallback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """標記判定層級並附上關鍵詞階段資訊"""
+        if not isinstance(result, dict) or not result:
+            # agent 回傳空結果時沿用 BERT 判定
+            logger.warning(f"{tier} 層回傳空結果，改用前一層結果")
+            result, tier = fallback or {}, TIER_BERT
+        result = dict(result)
+        result["tier"] = tier
+        result.setdefault("stage", keyword_result["stage"])
+        result.setdefault("found_keywords", keyword_result["found_keywords"] + [
+            kw for kw in keyword_result["stage_keywords"] if kw not in keyword_result["found_keywords"]
+        ])
+        metrics.counter(f"detection.cascade.{tier}").inc()
+        logger.info(f"串接檢測由 {tier} 層判定: {result.get('label')}")
+        return result
@@ -3,13 +3,23 @@
 
 此服務負責分析訊息並檢測潛在的詐騙。
 作為入口點，根據配置選擇使用 API 或本地檢測策略。
+相同內容（經正規化後）的檢測結果會依策略版本快取，
+轉傳多次的詐騙訊息不需重新推論。
+上傳的 LINE 匯出檔以解析結果（LineExport）傳入，直接交給接受解析結果的策略，
+快取鍵以其標準格式逐行正規化計算，不需要先組回完整文字。
+策略模組在選用時才匯入，未使用的策略不會載入 torch、transformers 或 ADK。
+提供對話狀態儲存時，每則新訊息的結果會增量更新使用者的階段與衰減風險分數。
 """
-from .frauddetect import FraudSentimentDetectionStrategy
+import asyncio
+import copy
+import hashlib
 import os
-from typing import Dict, List, Any, Optional
+import time
+from typing import Dict, List, Any, Optional, Tuple, Union
+from utils.cache import TTLCache, SQLiteCache, normalize_text
+from utils.fraud_sentiment import LineExport
 from utils.logger import get_service_logger
-from .local_detection import LocalDetectionStrategy
-from .api_detection import ApiDetectionStrategy
+from utils.metrics import metrics
 
 # 取得模組特定的日誌記錄器
 logger = get_service_logger("detection")
@@ -19,33 +29,76 @@ logger = get_service_logger("detection")
 class DetectionService:
     """詐騙檢測服務，根據配置選擇使用 API 或本地檢測策略"""
     
-    def __init__(self, analysis_client: Optional[Any] = None):
+    def __init__(self, analysis_client: Optional[Any] = None,
+                 cache_size: int = 2048, cache_ttl: Optional[float] = 86400,
+                 cache_path: Optional[str] = None, cache_disk_size: int = 100000,
+                 conversation_states: Optional[Any] = None):
         """
         初始化檢測服務，根據設定選擇適當的策略。
         優先順序：.env DETECTION_STRATEGY > analysis_client > local
+
+        Args:
+            analysis_client: 外部分析 API 客戶端（可選）
+            cache_size: 記憶體結果快取的項目數，0 表示停用結果快取
+            cache_ttl: 快取結果的存活秒數，None 表示不過期
+            cache_path: SQLite 快取檔案路徑，None 表示不使用磁碟快取
+            cache_disk_size: 磁碟快取最多保留的項目數
+            conversation_states: 使用者對話狀態儲存（ConversationStateStore），None 表示不追蹤
         """
+        self.conversation_states = conversation_states
         strategy = os.getenv("DETECTION_STRATEGY", "local").lower()
+        start = time.perf_counter()
         if strategy == "bert":
+            from .frauddetect import FraudSentimentDetectionStrategy
             self.strategy = FraudSentimentDetectionStrategy()
             logger.info("使用 BERT 詐騙分類器策略")
+        elif strategy == "cascade":
+            from .cascade_detection import CascadeDetectionStrategy
+            self.strategy = CascadeDetectionStrategy()
+            logger.info("使用串接檢測策略（關鍵詞 → BERT → agent）")
+        elif strategy == "ensemble":
+            from .ensemble_detection import EnsembleDetectionStrategy
+            self.strategy = EnsembleDetectionStrategy(analysis_client=analysis_client)
+            logger.info("使用集成檢測策略（關鍵詞、BERT、API 並行）")
         elif strategy == "api" and analysis_client:
+            from .api_detection import ApiDetectionStrategy
             self.strategy = ApiDetectionStrategy(analysis_client)
             logger.info("使用 API 檢測策略")
         else:
+            from .local_detection import LocalDetectionStrategy
             self.strategy = LocalDetectionStrategy()
             logger.info("使用本地規則檢測策略")
+        load_seconds = time.perf_counter() - start
+        metrics.gauge("detection.strategy_load_seconds").set(round(load_seconds, 3))
+        logger.info(f"檢測策略載入耗時 {load_seconds:.2f} 秒")
+
+        self.result_cache = None
+        self.disk_cache = None
+        if cache_size > 0 and self.strategy.cacheable:
+            self.result_cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+            if cache_path:
+                self.disk_cache = SQLiteCache(cache_path, max_size=cache_disk_size,
+                                              ttl=cache_ttl, table="detection_results")
+            logger.info(f"啟用檢測結果快取：記憶體 {cache_size} 筆，磁碟 {cache_path or '停用'}")
     
-    def analyze_message(self, message_text: str, user_id: Optional[str] = None, 
+    @property
+    def needs_user_profile(self) -> bool:
+        """目前策略是否需要 LINE 使用者資料"""
+        return getattr(self.strategy, "needs_user_profile", False)
+
+    def analyze_message(self, message_text: Optional[str], user_id: Optional[str] = None, 
                       chat_history: Optional[List[str]] = None, 
-                      user_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                      user_profile: Optional[Dict[str, Any]] = None,
+                      export: Optional[LineExport] = None) -> Dict[str, Any]:
         """
         分析訊息以檢測是否為潛在詐騙。
         
         Args:
-            message_text: 要分析的文字
+            message_text: 要分析的文字；提供 export 時可為 None
             user_id: 可選的使用者 ID 作為上下文
             chat_history: 可選的聊天歷史作為上下文
             user_profile: 可選的使用者資料
+            export: 已解析的 LINE 匯出（例如上傳的檔案）
             
         Returns:
             Dict[str, Any]: 包含標籤、可信度和回覆的分析結果
@@ -53,11 +106,158 @@ class DetectionService:
         Raises:
             Exception: 如果檢測過程中發生錯誤
         """
+        message = export if export is not None else message_text
+        cache_key = self._cache_key(message)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return self._track_conversation(user_id, message, cached)
+
         try:
             # 呼叫當前策略的 analyze 方法
             logger.debug(f"呼叫策略 {type(self.strategy).__name__} 的 analyze 方法")
-            return self.strategy.analyze(message_text, user_id=user_id, user_profile=user_profile)
+            start = time.perf_counter()
+            text, kwargs = self._strategy_input(message_text, export)
+            result = self.strategy.analyze(text, user_id=user_id, user_profile=user_profile, **kwargs)
+            metrics.histogram("detection.analyze_seconds").observe(time.perf_counter() - start)
+            self._cache_set(cache_key, result)
+            return self._track_conversation(user_id, message, result)
         except Exception as e:
             strategy_type = type(self.strategy).__name__
             logger.error(f"使用 {strategy_type} 進行檢測時發生錯誤: {str(e)}", exc_info=True)
             raise
+
+    async def analyze_message_async(self, message_text: Optional[str], user_id: Optional[str] = None,
+                                    chat_history: Optional[List[str]] = None,
+                                    user_profile: Optional[Dict[str, Any]] = None,
+                                    export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """
+        analyze_message 的非同步版本。
+
+        策略提供 analyze_async 時直接等待；否則（例如 CPU 密集的 BERT 策略）
+        於執行緒中執行，避免阻塞事件迴圈。
+
+        Args:
+            message_text: 要分析的文字；提供 export 時可為 None
+            user_id: 可選的使用者 ID 作為上下文
+            chat_history: 可選的聊天歷史作為上下文
+            user_profile: 可選的使用者資料
+            export: 已解析的 LINE 匯出（例如上傳的檔案）
+
+        Returns:
+            Dict[str, Any]: 包含標籤、可信度和回覆的分析結果
+        """
+        message = export if export is not None else message_text
+        cache_key = self._cache_key(message)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return self._track_conversation(user_id, message, cached)
+
+        try:
+            analyze_async = getattr(self.strategy, "analyze_async", None)
+            logger.debug(f"非同步呼叫策略 {type(self.strategy).__name__}")
+            start = time.perf_counter()
+            text, kwargs = self._strategy_input(message_text, export)
+            if analyze_async is not None:
+                result = await analyze_async(text, user_id=user_id, user_profile=user_profile, **kwargs)
+            else:
+                result = await asyncio.to_thread(
+                    self.strategy.analyze, text, user_id=user_id, user_profile=user_profile, **kwargs
+                )
+            metrics.histogram("detection.analyze_seconds").observe(time.perf_counter() - start)
+            self._cache_set(cache_key, result)
+            return self._track_conversation(user_id, message, result)
+        except Exception as e:
+            strategy_type = type(self.strategy).__name__
+            logger.error(f"使用 {strategy_type} 進行檢測時發生錯誤: {str(e)}", exc_info=True)
+            raise
+
+    def _strategy_input(self, message_text: Optional[str],
+                        export: Optional[LineExport]) -> Tuple[Optional[str], Dict[str, Any]]:
+        """接受解析結果的策略直接傳入 export；其餘策略改傳標準格式的文字"""
+        if export is None:
+            return message_text, {}
+        if self.strategy.accepts_export:
+            return message_text, {"export": export}
+        return (message_text if message_text is not None else export.to_text()), {}
+
+    def _track_conversation(self, user_id: Optional[str], message: Union[str, LineExport], result: Any) -> Any:
+        """
+        以新訊息的結果增量更新使用者對話狀態，並將狀態摘要附加於結果的 conversation 欄位。
+        結果已寫入快取後才附加，快取內容不含使用者狀態。
+        """
+        if self.conversation_states is None or not user_id or not isinstance(result, dict):
+            return result
+        try:
+            result = dict(result)
+            result["conversation"] = self.conversation_states.update(user_id, message, result)
+        except Exception as e:
+            logger.warning(f"更新 {user_id} 的對話狀態失敗: {str(e)}")
+        return result
+
+    # === 結果快取 ===
+
+    @staticmethod
+    def normalize_text(message_text: str) -> str:
+        """正規化訊息內容供快取比對（見 utils.cache.normalize_text）"""
+        return normalize_text(message_text)
+
+    def _cache_key(self, message: Union[str, LineExport, None]) -> Optional[str]:
+        """
+        以策略版本與正規化內容的 SHA-256 作為快取鍵；停用快取時為 None。
+
+        LineExport 逐行正規化其標準格式（見 LineExport.iter_lines），
+        與貼上 export.to_text() 的文字得到相同的快取鍵。
+        """
+        if self.result_cache is None or not message:
+            return None
+        digest = hashlib.sha256()
+        digest.update(self.strategy.cache_version.encode("utf-8"))
+        digest.update(b"\0")
+        if isinstance(message, LineExport):
+            for index, line in enumerate(message.iter_lines()):
+                if index:
+                    digest.update(b"\n")
+                digest.update(self.normalize_text(line).encode("utf-8"))
+        elif isinstance(message, str):
+            digest.update(self.normalize_text(message).encode("utf-8"))
+        else:
+            return None
+        return digest.hexdigest()
+
+    def _cache_get(self, cache_key: Optional[str]) -> Optional[Any]:
+        """依序查詢記憶體與磁碟快取，回傳結果的副本"""
+        if cache_key is None:
+            return None
+        result = self.result_cache.get(cache_key)
+        if result is not None:
+            metrics.counter("detection.cache.hits").inc()
+            return copy.deepcopy(result)
+        if self.disk_cache is not None:
+            try:
+                result = self.disk_cache.get(cache_key)
+            except Exception as e:
+                logger.warning(f"讀取磁碟檢測快取失敗: {str(e)}")
+                result = None
+            if result is not None:
+                metrics.counter("detection.cache.disk_hits").inc()
+                self.result_cache.set(cache_key, result)
+                return copy.deepcopy(result)
+        metrics.counter("detection.cache.misses").inc()
+        return None
+
+    def _cache_set(self, cache_key: Optional[str], result: Any) -> None:
+        """寫入成功的檢測結果；錯誤與部分成員逾時的集成結果不會被快取"""
+        if cache_key is None or result is None:
+            return
+        if isinstance(result, dict) and result.get("partial"):
+            return
+        self.result_cache.set(cache_key, copy.deepcopy(result))
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.set(cache_key, result)
+            except Exception as e:
+                logger.warning(f"寫入磁碟檢測快取失敗: {str(e)}")
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """回傳記憶體結果快取的統計資料；停用時為空 dict"""
+        return self.result_cache.stats() if self.result_cache is not None else {}
@@ -0,0 +1,382 @@
+"""
+集成檢測策略
+
+在執行緒池上同時執行多個檢測策略（預設為關鍵詞、BERT 與外部 API），
+每個成員有各自的逾時；逾時的成員直接捨棄、不再等待，
+其餘成員的風險分數依權重合併成最終判定。
+
+回應延遲上限為各成員逾時的最大值；設定 quorum 時，
+完成成員的權重達總權重的該比例即回傳，不等待較慢的成員。
+
+限制：捨棄只是不再等待，已在執行緒中執行的阻塞成員（BERT 推論、同步 API 呼叫）
+無法中斷，會持續佔用工作執行緒直到自身的逾時（如 HTTP 逾時）或完成。
+因此每個阻塞成員最多只能佔用執行緒池的 1/成員數；某成員仍在執行中的呼叫
+（包含已被捨棄的）達此上限時，新的請求直接略過該成員（計入 shed 指標），
+不排隊等待，避免單一緩慢成員佔滿執行緒池而拖垮其他成員。
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base import DetectionStrategy
+from .keyword_detection import HIGH_RISK_SCORE, MEDIUM_RISK_SCORE
+from services.domain.conversation_state import result_risk
+from utils.logger import get_service_logger
+from utils.metrics import metrics
+from utils.error_handler import DetectionError, with_error_handling, with_async_error_handling
+from utils.fraud_sentiment import CLASSIFIER_LABELS, LineExport
+
+# 取得模組特定的日誌記錄器
+logger = get_service_logger("ensemble_detection")
+
+MEMBER_KEYWORD = "keyword"
+MEMBER_BERT = "bert"
+MEMBER_API = "api"
+
+DEFAULT_MEMBERS = "keyword,bert,api"
+DEFAULT_WEIGHTS = "keyword=1,bert=2,api=2"
+DEFAULT_TIMEOUTS = "keyword=0.5,bert=3,api=5"
+
+# 成員皆未提供對應標籤的回覆時使用
+LABEL_REPLIES = {
+    CLASSIFIER_LABELS[2]: "⚠️ 警告：綜合多項檢測，此訊息疑似詐騙（風險 {risk:.2f}）。請提高警覺！",
+    CLASSIFIER_LABELS[1]: "❗ 注意：綜合多項檢測，此訊息有潛在風險（風險 {risk:.2f}）。請小心求證。",
+    CLASSIFIER_LABELS[0]: "✅ 綜合多項檢測，此訊息暫無明顯詐騙徵兆（風險 {risk:.2f}）。",
+}
+
+
+def parse_member_values(spec: Optional[str]) -> Dict[str, float]:
+    """
+    解析成員設定字串。
+
+    Args:
+        spec: 形如 "keyword=1,bert=2,api=2" 的字串
+
+    Returns:
+        Dict[str, float]: 成員名稱對應數值
+    """
+    values = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        try:
+            values[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"忽略無效的集成成員設定: {item}")
+    return values
+
+
+def _export_kwargs(strategy: DetectionStrategy, export: Optional[LineExport]) -> Dict[str, Any]:
+    """只對接受解析結果的策略傳入 export"""
+    return {"export": export} if export is not None and strategy.accepts_export else {}
+
+
+class EnsembleMember:
+    """集成成員：策略、權重與逾時"""
+
+    def __init__(self, name: str, strategy: DetectionStrategy, weight: float = 1.0, timeout: float = 5.0):
+        """
+        Args:
+            name: 成員名稱（指標與結果中使用）
+            strategy: 檢測策略
+            weight: 合併時的權重
+            timeout: 逾時秒數，自請求開始起算
+        """
+        self.name = name
+        self.strategy = strategy
+        self.weight = weight
+        self.timeout = timeout
+        self._seconds = metrics.histogram(f"detection.ensemble.{name}.seconds")
+        self._timeouts = metrics.counter(f"detection.ensemble.{name}.timeouts")
+        self._errors = metrics.counter(f"detection.ensemble.{name}.errors")
+        self._shed = metrics.counter(f"detection.ensemble.{name}.shed")
+        # 執行緒池中仍在執行或排隊的呼叫數（包含已被捨棄、不再等待的呼叫）
+        self._in_flight = 0
+
+
+class EnsembleDetectionStrategy(DetectionStrategy):
+    """並行執行多個策略並依權重合併的集成檢測策略"""
+
+    accepts_export = True
+
+    def __init__(self,
+                 members: Optional[List[EnsembleMember]] = None,
+                 analysis_client: Optional[Any] = None,
+                 quorum: Optional[float] = None,
+                 max_workers: Optional[int] = None):
+        """
+        Args:
+            members: 集成成員，預設依 ENSEMBLE_MEMBERS、ENSEMBLE_WEIGHTS、ENSEMBLE_TIMEOUTS 建立
+            analysis_client: 外部分析 API 客戶端，未提供時略過 api 成員
+            quorum: 完成成員的權重比例達此值即回傳（0~1），預設讀取 ENSEMBLE_QUORUM（1 表示等待所有成員）
+            max_workers: 執行緒池大小，預設為成員數的 4 倍；每個成員最多佔用其中的 1/成員數
+        """
+        self.members = members or self._build_members(analysis_client)
+        if not self.members:
+            raise DetectionError("集成策略至少需要一個成員")
+        self.quorum = quorum if quorum is not None else float(os.getenv("ENSEMBLE_QUORUM", 1.0))
+        self.max_workers = max_workers or 4 * len(self.members)
+        self.member_slots = max(1, self.max_workers // len(self.members))
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._in_flight_lock = threading.Lock()
+        self._partial = metrics.counter("detection.ensemble.partial")
+
+        # 任一成員依使用者而異時整體不快取
+        self.cacheable = all(m.strategy.cacheable for m in self.members)
+        self.needs_user_profile = any(getattr(m.strategy, "needs_user_profile", False) for m in self.members)
+        logger.info("集成檢測策略：" + "，".join(
+            f"{m.name}（權重 {m.weight}，逾時 {m.timeout}s）" for m in self.members
+        ) + f"，quorum {self.quorum}")
+
+    @staticmethod
+    def _build_members(analysis_client: Optional[Any]) -> List[EnsembleMember]:
+        """依環境變數建立成員；策略模組在選用時才匯入"""
+        names = [n.strip() for n in os.getenv("ENSEMBLE_MEMBERS", DEFAULT_MEMBERS).split(",") if n.strip()]
+        weights = parse_member_values(DEFAULT_WEIGHTS)
+        weights.update(parse_member_values(os.getenv("ENSEMBLE_WEIGHTS")))
+        timeouts = parse_member_values(DEFAULT_TIMEOUTS)
+        timeouts.update(parse_member_values(os.getenv("ENSEMBLE_TIMEOUTS")))
+
+        members = []
+        for name in names:
+            if name == MEMBER_KEYWORD:
+                from .keyword_detection import KeywordDetectionStrategy
+                strategy = KeywordDetectionStrategy()
+            elif name == MEMBER_BERT:
+                from .frauddetect import FraudSentimentDetectionStrategy
+                strategy = FraudSentimentDetectionStrategy()
+            elif name == MEMBER_API:
+                if analysis_client is None:
+                    logger.warning("未設定 ANALYSIS_API_URL，集成策略略過 api 成員")
+                    continue
+                from .api_detection import ApiDetectionStrategy
+                # 斷路器開啟時直接失敗並捨棄此成員，由其他成員決定結果
+                strategy = ApiDetectionStrategy(analysis_client, fallback="none")
+            else:
+                logger.warning(f"忽略未知的集成成員: {name}")
+                continue
+            members.append(EnsembleMember(name, strategy, weights.get(name, 1.0), timeouts.get(name, 5.0)))
+        return members
+
+    @property
+    def cache_version(self) -> str:
+        return f"{type(self).__name__}:{self.quorum}|" + "|".join(
+            f"{m.name}={m.weight}:{m.strategy.cache_version}" for m in self.members
+        )
+
+    @with_error_handling(reraise=True)
+    def analyze(self, message_text: Optional[str], user_id: Optional[str] = None,
+                user_profile: Optional[Dict[str, Any]] = None,
+                export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """
+        在執行緒池上同時執行所有成員，於各自的逾時內收集結果後合併。
+
+        Args:
+            message_text: 要分析的文字；提供 export 時可為 None
+            user_id: 可選的使用者 ID
+            user_profile: 可選的使用者資料
+            export: 已解析的 LINE 匯出，傳給接受解析結果的成員；其餘成員共用一次 to_text() 的輸出
+
+        Returns:
+            dict: 包含 label、confidence、reply、risk_score 與各成員結果 members 的分析結果
+
+        Raises:
+            DetectionError: 如果所有成員皆逾時或失敗
+        """
+        start = time.monotonic()
+        message_text = self._member_text(message_text, export)
+        futures = {}
+        for member in self.members:
+            future = self._submit(member, message_text, user_id, user_profile, export)
+            if future is not None:
+                futures[future] = member
+        results: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=self._next_wait(pending, futures, start),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                self._record(futures[future], future, results)
+            pending = self._drop_expired(pending, futures, start, results)
+        return self._merge(results, start)
+
+    @with_async_error_handling(reraise=True)
+    async def analyze_async(self, message_text: Optional[str], user_id: Optional[str] = None,
+                            user_profile: Optional[Dict[str, Any]] = None,
+                            export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """analyze 的非同步版本；有 analyze_async 的成員以協程執行，其餘在同一個執行緒池中執行"""
+        start = time.monotonic()
+        message_text = self._member_text(message_text, export)
+        tasks = {}
+        for member in self.members:
+            if getattr(member.strategy, "analyze_async", None) is not None:
+                # 協程可被取消，不佔用執行緒池
+                task = asyncio.ensure_future(
+                    self._run_member_async(member, message_text, user_id, user_profile, export)
+                )
+            else:
+                future = self._submit(member, message_text, user_id, user_profile, export)
+                if future is None:
+                    continue
+                task = asyncio.wrap_future(future)
+            tasks[task] = member
+        results: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=self._next_wait(pending, tasks, start),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                self._record(tasks[task], task, results)
+            pending = self._drop_expired(pending, tasks, start, results)
+        return self._merge(results, start)
+
+    # === 內部方法 ===
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """延遲建立執行緒池（避免在 fork 前建立執行緒）"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="ensemble")
+        return self._executor
+
+    def _member_text(self, message_text: Optional[str], export: Optional[LineExport]) -> Optional[str]:
+        """有成員不接受解析結果時，以 export 產生一次文字供這些成員共用"""
+        if message_text is None and export is not None and \
+                not all(m.strategy.accepts_export for m in self.members):
+            return export.to_text()
+        return message_text
+
+    def _submit(self, member: EnsembleMember, message_text: Optional[str], user_id: Optional[str],
+                user_profile: Optional[Dict[str, Any]], export: Optional[LineExport] = None):
+        """在執行緒池上執行成員；該成員執行中的呼叫已達上限時略過並回傳 None"""
+        with self._in_flight_lock:
+            if member._in_flight >= self.member_slots:
+                member._shed.inc()
+                logger.warning(f"集成成員 {member.name} 已有 {member._in_flight} 個呼叫執行中，本次略過")
+                return None
+            member._in_flight += 1
+        future = self._get_executor().submit(self._run_member, member, message_text, user_id, user_profile, export)
+        # 呼叫實際結束（或排隊中被取消）時才釋放，捨棄不等於結束
+        future.add_done_callback(lambda _: self._release(member))
+        return future
+
+    def _release(self, member: EnsembleMember) -> None:
+        with self._in_flight_lock:
+            member._in_flight -= 1
+
+    @staticmethod
+    def _run_member(member: EnsembleMember, message_text: Optional[str], user_id: Optional[str],
+                    user_profile: Optional[Dict[str, Any]],
+                    export: Optional[LineExport] = None) -> Tuple[Dict[str, Any], float]:
+        start = time.perf_counter()
+        result = member.strategy.analyze(message_text, user_id=user_id, user_profile=user_profile,
+                                         **_export_kwargs(member.strategy, export))
+        return result, time.perf_counter() - start
+
+    @staticmethod
+    async def _run_member_async(member: EnsembleMember, message_text: Optional[str], user_id: Optional[str],
+                                user_profile: Optional[Dict[str, Any]],
+                                export: Optional[LineExport] = None) -> Tuple[Dict[str, Any], float]:
+        start = time.perf_counter()
+        result = await member.strategy.analyze_async(message_text, user_id=user_id, user_profile=user_profile,
+                                                     **_export_kwargs(member.strategy, export))
+        return result, time.perf_counter() - start
+
+    @staticmethod
+    def _next_wait(pending, members: Dict[Any, EnsembleMember], start: float) -> float:
+        """距離最近一個未完成成員逾時的秒數"""
+        deadline = min(start + members[f].timeout for f in pending)
+        return max(0.0, deadline - time.monotonic())
+
+    @staticmethod
+    def _record(member: EnsembleMember, future, results: Dict[str, Tuple[Dict[str, Any], float]]) -> None:
+        """記錄已完成成員的結果；失敗的成員視同捨棄"""
+        try:
+            result, seconds = future.result()
+        except Exception as e:
+            member._errors.inc()
+            logger.warning(f"集成成員 {member.name} 失敗，已捨棄: {str(e)}")
+            return
+        member._seconds.observe(seconds)
+        if isinstance(result, dict) and result:
+            results[member.name] = (result, seconds)
+        else:
+            member._errors.inc()
+            logger.warning(f"集成成員 {member.name} 回傳空結果，已捨棄")
+
+    def _drop_expired(self, pending, members: Dict[Any, EnsembleMember], start: float,
+                      results: Dict[str, Tuple[Dict[str, Any], float]]) -> set:
+        """捨棄已逾時的成員；完成權重達 quorum 時捨棄其餘成員。被捨棄的成員不再等待"""
+        now = time.monotonic()
+        done_weight = sum(m.weight for m in self.members if m.name in results)
+        total_weight = sum(m.weight for m in self.members)
+        quorum_reached = results and done_weight >= self.quorum * total_weight
+        remaining = set()
+        for future in pending:
+            member = members[future]
+            if quorum_reached or start + member.timeout <= now:
+                if not quorum_reached:
+                    member._timeouts.inc()
+                    logger.warning(f"集成成員 {member.name} 超過 {member.timeout} 秒，已捨棄")
+                # 協程成員（例如經由微批次的 API 呼叫）會收到 CancelledError；
+                # 批次處理器略過或照常完成已取消的項目，不影響之後的呼叫
+                future.cancel()
+            else:
+                remaining.add(future)
+        return remaining
+
+    def _merge(self, results: Dict[str, Tuple[Dict[str, Any], float]], start: float) -> Dict[str, Any]:
+        """依權重合併各成員的風險分數"""
+        if not results:
+            raise DetectionError("集成檢測失敗：所有成員皆逾時或失敗")
+
+        weights = {m.name: m.weight for m in self.members}
+        total = sum(weights[name] for name in results) or 1.0
+        risk = sum(weights[name] * result_risk(result) for name, (result, _) in results.items()) / total
+
+        if risk >= HIGH_RISK_SCORE:
+            label, confidence = CLASSIFIER_LABELS[2], risk
+        elif risk >= MEDIUM_RISK_SCORE:
+            label, confidence = CLASSIFIER_LABELS[1], risk
+        else:
+            label, confidence = CLASSIFIER_LABELS[0], 1.0 - risk
+
+        # 沿用權重最高且判定相同的成員回覆
+        reply = None
+        for name in sorted(results, key=lambda n: -weights[n]):
+            result = results[name][0]
+            if result.get("label") == label and isinstance(result.get("reply"), str):
+                reply = result["reply"]
+                break
+
+        dropped = [m.name for m in self.members if m.name not in results]
+        if dropped:
+            self._partial.inc()
+        logger.info(f"集成檢測完成：{label}（風險 {risk:.2f}），採用 {list(results)}，捨棄 {dropped}")
+        return {
+            "label": label,
+            "confidence": round(confidence, 4),
+            "reply": reply or LABEL_REPLIES[label].format(risk=risk),
+            "risk_score": round(risk, 4),
+            "members": {
+                name: {
+                    "label": result.get("label"),
+                    "risk": round(result_risk(result), 4),
+                    "seconds": round(seconds, 3),
+                }
+                for name, (result, seconds) in results.items()
+            },
+            "dropped": dropped,
+            # 有成員被捨棄的結果不寫入快取
+            "partial": bool(dropped),
+            "seconds": round(time.monotonic() - start, 3),
+        }
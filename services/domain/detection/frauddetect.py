@@ -2,69 +2,161 @@
 FraudSentimentDetectionStrategy
 
 將 BERT 詐騙分類器（finetuned_classifier）包裝成服務策略，供 DetectionService 調用。
+並行請求經由微批次處理器合併成一次 padded batch 前向傳播。
+超過 token 上限的長對話依訊息邊界切窗，所有視窗一次推論後彙整成整段對話的判定。
 """
 
-from typing import Dict, Any, Optional
-from transformers import BertTokenizerFast, BertForSequenceClassification
-import torch
+from typing import Dict, Any, List, Optional, Tuple
 import os
 from utils.logger import get_service_logger
+from utils.metrics import metrics
 from utils.error_handler import DetectionError, with_error_handling
+from utils.micro_batcher import MicroBatcher
+from utils.fraud_sentiment import (
+    CLASSIFIER_LABELS, WINDOW_RULES, LineExport, aggregate_windows, load_classifier_backend, split_windows
+)
 from .base import DetectionStrategy
 
-LABELS = ["安全或初期探索", "情感連結強化疑慮", "高風險詐騙徵兆"]
+LABELS = CLASSIFIER_LABELS
 
 logger = get_service_logger("fraud_sentiment_detection")
 
-class FraudSentimentDetectionStrategy:
+class FraudSentimentDetectionStrategy(DetectionStrategy):
     """
     使用 BERT 詐騙分類器進行訊息分類。
     """
-    def __init__(self, model_path: Optional[str] = None):
+    accepts_export = True
+
+    def __init__(self, model_path: Optional[str] = None,
+                 backend: Optional[str] = None,
+                 batch_size: Optional[int] = None,
+                 batch_wait_ms: Optional[float] = None,
+                 batch_target_ms: Optional[float] = None,
+                 window_rule: Optional[str] = None,
+                 max_windows: Optional[int] = None,
+                 window_last_k: Optional[int] = None):
         """
         Args:
             model_path: finetuned_classifier 的資料夾路徑
+            backend: 推論後端 torch 或 onnx，預設讀取 CLASSIFIER_BACKEND（預設 torch）
+            batch_size: 微批次上限，1 表示每則訊息單獨推論
+            batch_wait_ms: 湊批最多等待的毫秒數
+            batch_target_ms: 單批推論延遲目標，批次上限依此自動調整
+            window_rule: 長對話視窗彙整規則 max、mean 或 last_k
+            max_windows: 單則訊息最多推論的視窗數（保留最新的視窗）
+            window_last_k: last_k 規則使用的視窗數
         """
         self.model_path = model_path or os.getenv("BERT_MODEL_PATH", "models/finetuned_classifier")
         logger.info(f"載入 BERT 模型與 tokenizer，路徑: {self.model_path}")
         try:
-            self.tokenizer = BertTokenizerFast.from_pretrained(self.model_path)
-            self.model = BertForSequenceClassification.from_pretrained(self.model_path)
-            self.model.eval()
+            self.backend = load_classifier_backend(self.model_path, backend=backend)
+            logger.info(f"BERT 推論後端: {self.backend.name}")
+            self._model_mtime = self._latest_mtime(self.model_path)
         except Exception as e:
             logger.error(f"載入 BERT 模型失敗: {str(e)}")
             raise DetectionError(f"BERT 模型載入失敗: {str(e)}")
 
+        self.window_rule = (window_rule or os.getenv("BERT_WINDOW_RULE", "max")).lower()
+        if self.window_rule not in WINDOW_RULES:
+            raise DetectionError(f"不支援的視窗彙整規則: {self.window_rule}（可用 {', '.join(WINDOW_RULES)}）")
+        self.max_windows = max_windows or int(os.getenv("BERT_MAX_WINDOWS", 16))
+        self.window_last_k = window_last_k or int(os.getenv("BERT_WINDOW_LAST_K", 3))
+        self._windows = metrics.histogram("bert.windows")
+
+        batch_size = batch_size or int(os.getenv("BERT_BATCH_MAX_SIZE", 16))
+        self.batcher = None
+        if batch_size > 1:
+            self.batcher = MicroBatcher(
+                self.classify_batch,
+                max_batch_size=batch_size,
+                max_wait_ms=batch_wait_ms if batch_wait_ms is not None else float(os.getenv("BERT_BATCH_MAX_WAIT_MS", 5)),
+                target_latency_ms=batch_target_ms if batch_target_ms is not None else float(os.getenv("BERT_BATCH_TARGET_MS", 200)),
+                name="bert.batch"
+            )
+            logger.info(f"啟用 BERT 微批次推論，批次上限 {batch_size}")
+
+    @property
+    def cache_version(self) -> str:
+        """以模型路徑與模型檔案修改時間作為版本標識，重新訓練後快取自動失效"""
+        return (
+            f"{type(self).__name__}:{self.backend.name}:{getattr(self.backend, 'onnx_path', '')}:"
+            f"{os.path.abspath(self.model_path)}:{self._model_mtime:.0f}:"
+            f"{self.window_rule}:{self.max_windows}:{self.window_last_k}"
+        )
+
+    @staticmethod
+    def _latest_mtime(path: str) -> float:
+        """模型資料夾內檔案的最新修改時間"""
+        try:
+            return max((entry.stat().st_mtime for entry in os.scandir(path) if entry.is_file()), default=0.0)
+        except OSError:
+            return 0.0
+
     @with_error_handling(reraise=True)
-    def analyze(self, message_text: str, user_id: Optional[str] = None, user_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def analyze(self, message_text: Optional[str], user_id: Optional[str] = None, user_profile: Optional[Dict[str, Any]] = None,
+                export: Optional[LineExport] = None) -> Dict[str, Any]:
         """
         使用 BERT 模型分析訊息。
         Args:
-            message_text: 要分析的文字
+            message_text: 要分析的文字；提供 export 時可為 None
             user_id: 可選，使用者 ID
             user_profile: 可選，使用者資料
+            export: 已解析的 LINE 匯出，提供時直接依訊息紀錄切窗
         Returns:
             dict: 包含 label、confidence、reply
         """
-        logger.info(f"BERT 分析訊息: {message_text[:30]}...")
+        if export is not None:
+            logger.info(f"BERT 分析 LINE 匯出: {len(export.messages)} 則訊息")
+        else:
+            logger.info(f"BERT 分析訊息: {message_text[:30]}...")
         try:
-            inputs = self.tokenizer(message_text, return_tensors="pt", truncation=True, padding=True, max_length=64)
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                logits = outputs.logits
-                pred = torch.argmax(logits, dim=1).item()
-                confidence = torch.softmax(logits, dim=1)[0, pred].item()
-            label = LABELS[pred]
+            windows = split_windows(export if export is not None else message_text,
+                                    self.backend.max_length, self.max_windows)
+            self._windows.observe(len(windows))
+            if len(windows) > 1:
+                # 長對話：所有視窗一次 batch 推論後彙整
+                label, confidence = self.classify_windows(windows)
+            elif self.batcher is not None:
+                label, confidence = self.batcher(windows[0])
+            else:
+                label, confidence = self.classify_batch(windows)[0]
             reply = self._generate_reply(label, confidence)
             return {
                 "label": label,
                 "confidence": confidence,
-                "reply": reply
+                "reply": reply,
+                "windows": len(windows)
             }
         except Exception as e:
             logger.error(f"BERT 分析失敗: {str(e)}")
             raise DetectionError(f"BERT 分析失敗: {str(e)}")
 
+    def classify_batch(self, texts: List[str]) -> List[Tuple[str, float]]:
+        """
+        以單次 padded batch 前向傳播分類多則訊息。
+
+        Args:
+            texts: 要分類的文字列表
+
+        Returns:
+            List[Tuple[str, float]]: 與輸入順序相同的 (標籤, 可信度)
+        """
+        return self.backend.predict(texts)
+
+    def classify_windows(self, windows: List[str]) -> Tuple[str, float]:
+        """
+        以單次 padded batch 推論同一段對話的所有視窗，並依 window_rule 彙整。
+
+        Args:
+            windows: 依訊息邊界切好的視窗文字
+
+        Returns:
+            Tuple[str, float]: 整段對話的 (標籤, 可信度)
+        """
+        probs = aggregate_windows(self.backend.predict_proba(windows), self.window_rule, self.window_last_k)
+        pred = int(probs.argmax())
+        return LABELS[pred], float(probs[pred])
+
     def _generate_reply(self, label: str, confidence: float) -> str:
         """
         根據分類結果產生回覆。
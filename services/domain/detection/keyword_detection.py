@@ -0,0 +1,161 @@
+"""
+關鍵詞檢測策略
+
+以 data/scam_data.json 的詐騙關鍵詞與理論階段規則建立關鍵字自動機，
+單次線性掃描訊息並依關鍵詞數量與密度評分。不需要模型或 LLM，
+供本地策略、串接策略與集成策略共用。
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from .base import DetectionStrategy
+from utils.logger import get_service_logger
+from utils.error_handler import DetectionError, with_error_handling
+from utils.fraud_sentiment import (
+    CLASSIFIER_LABELS, TAG_SCAM, TAG_STAGE, LineExport, build_keyword_automaton, classify_stage_ids,
+    get_default_automaton
+)
+
+# 設定預設資料檔案路徑
+PROJECT_ROOT = os.path.abspath(os.path.join(__file__, '../../../..'))
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
+SCAM_DATA_PATH = os.path.join(DATA_DIR, 'scam_data.json')
+
+# 風險評分達此值判定為高風險、情感連結疑慮
+HIGH_RISK_SCORE = 0.6
+MEDIUM_RISK_SCORE = 0.3
+
+# 取得模組特定的日誌記錄器
+logger = get_service_logger("keyword_detection")
+
+
+def load_scam_data() -> Dict[str, Any]:
+    """
+    載入詐騙範本資料，包含範例和關鍵字。
+
+    Returns:
+        Dict[str, Any]: 詐騙範例和關鍵字數據
+    """
+    try:
+        with open(SCAM_DATA_PATH, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        logger.error(f"無法載入詐騙範本資料: {str(e)}")
+        # 返回預設的最小資料
+        return {
+            "scam_examples": [],
+            "keywords": []
+        }
+
+
+class KeywordDetectionStrategy(DetectionStrategy):
+    """以關鍵字自動機評分的檢測策略"""
+
+    accepts_export = True
+
+    def __init__(self, keywords: Optional[List[str]] = None):
+        """
+        Args:
+            keywords: 詐騙關鍵詞，預設從 data/scam_data.json 載入
+        """
+        if keywords is None:
+            self.data = load_scam_data()
+            keywords = self.data.get("keywords", [])
+            # 預設關鍵詞使用行程共用的自動機（詐騙關鍵詞、pipeline 詞庫與理論階段規則）
+            self.automaton = get_default_automaton(SCAM_DATA_PATH)
+        else:
+            self.data = {"scam_examples": [], "keywords": list(keywords)}
+            self.automaton = build_keyword_automaton(scam_keywords=keywords)
+        self.keywords = keywords
+        logger.info(f"載入了 {len(self.keywords)} 個關鍵詞")
+
+    @property
+    def cache_version(self) -> str:
+        return f"{type(self).__name__}:{len(self.keywords)}"
+
+    def keyword_analysis(self, message_text: Optional[str], export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """
+        基於關鍵詞分析訊息，檢查詐騙指標。
+
+        以共用的關鍵字自動機單次掃描全文，同時取得詐騙關鍵詞與理論階段命中。
+
+        Args:
+            message_text: 要分析的文字；提供 export 時不使用
+            export: 已解析的 LINE 匯出；提供時只掃描文字訊息的內容
+                （與對話壓縮相同，略過標頭、系統訊息與時間欄位），命中位置相對於以換行連接的內容，
+                字數以標準格式的各行計算
+
+        Returns:
+            Dict: 包含檢測到的關鍵詞、命中位置、階段索引和評分的分析結果
+        """
+        scan = self.automaton.scan("\n".join(export.texts()) if export is not None else message_text)
+
+        # 詐騙關鍵詞（不含僅屬於階段規則的詞）
+        found_keywords = scan.keywords_with_tag(self.automaton, TAG_SCAM)
+        keyword_count = len(found_keywords)
+
+        # 計算關鍵詞密度（關鍵詞數量 / 總字數）
+        if export is not None:
+            total_words = sum(len(line.split()) for line in export.iter_lines())
+        else:
+            total_words = len(message_text.split())
+        keyword_density = keyword_count / max(total_words, 1)
+
+        # 基於關鍵詞密度和數量的風險評估
+        risk_score = min(1.0, (keyword_count * 0.1) + (keyword_density * 2))
+
+        logger.info(f"關鍵詞分析完成，找到 {keyword_count} 個關鍵詞，風險評分: {risk_score:.2f}")
+
+        return {
+            "found_keywords": found_keywords,
+            "keyword_count": keyword_count,
+            "keyword_density": keyword_density,
+            "risk_score": risk_score,
+            "stage_keywords": scan.keywords_with_tag(self.automaton, TAG_STAGE),
+            "stage_ids": scan.stage_ids,
+            "hits": [(hit.start, hit.end, hit.keyword) for hit in scan.hits]
+        }
+
+    @with_error_handling(reraise=True)
+    def analyze(self, message_text: Optional[str], user_id: Optional[str] = None,
+                user_profile: Optional[Dict[str, Any]] = None,
+                export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """
+        以關鍵詞評分分析訊息。
+
+        Args:
+            message_text: 要分析的文字；提供 export 時可為 None
+            user_id: 可選的使用者 ID
+            user_profile: 可選的使用者資料
+            export: 已解析的 LINE 匯出（例如上傳的檔案），見 keyword_analysis
+
+        Returns:
+            dict: 包含 label、confidence、reply、risk_score、stage、found_keywords
+        """
+        if export is None and (not message_text or not isinstance(message_text, str)):
+            error_msg = "訊息文本必須是非空字串"
+            logger.error(error_msg)
+            raise DetectionError(error_msg, status_code=400)
+
+        analysis = self.keyword_analysis(message_text, export=export)
+        risk_score = analysis["risk_score"]
+        stage = classify_stage_ids(analysis["stage_ids"])
+        if risk_score >= HIGH_RISK_SCORE:
+            label, confidence = CLASSIFIER_LABELS[2], risk_score
+            reply = f"⚠️ 警告：此訊息出現多個詐騙關鍵詞（{'、'.join(analysis['found_keywords'][:5])}）。請提高警覺！"
+        elif risk_score >= MEDIUM_RISK_SCORE:
+            label, confidence = CLASSIFIER_LABELS[1], risk_score
+            reply = f"❗ 注意：此訊息出現可疑關鍵詞（{'、'.join(analysis['found_keywords'][:5])}）。請小心求證。"
+        else:
+            label, confidence = CLASSIFIER_LABELS[0], 1.0 - risk_score
+            reply = "✅ 此訊息未出現明顯的詐騙關鍵詞。"
+        return {
+            "label": label,
+            "confidence": confidence,
+            "reply": reply,
+            "risk_score": risk_score,
+            "stage": stage,
+            "found_keywords": analysis["found_keywords"],
+        }
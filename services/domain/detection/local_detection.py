@@ -2,52 +2,36 @@
 本地檢測策略
 
 此模組實現了基於本地規則的詐騙檢測策略。
-使用 ADK agent 進行詐騙檢測。
+使用 ADK agent 進行詐騙檢測；LINE 匯出驗證時解析一次，
+同一份訊息紀錄用於關鍵詞掃描與壓縮，壓縮到 token 預算內再交給 agent。
 """
 
 from typing import Dict, List, Any, Optional, Union
+import asyncio
 import json
 import os
-import re
 from pathlib import Path
 
 from .base import DetectionStrategy
+from config import Config
 from utils.logger import get_service_logger
-from utils.error_handler import DetectionError, ValidationError, with_error_handling
-from utils.validator import validate_line_export
+from utils.metrics import metrics
+from utils.error_handler import DetectionError, ValidationError, with_error_handling, with_async_error_handling
+from utils.validator import parse_validated_line_export
 from utils.agents.agent_factory import create_agent
-
-# 設定預設資料檔案路徑
-PROJECT_ROOT = os.path.abspath(os.path.join(__file__, '../../../..'))
-DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
-SCAM_DATA_PATH = os.path.join(DATA_DIR, 'scam_data.json')
+from utils.fraud_sentiment import LineExport
+from services.domain.conversation_compactor import CompactedConversation, compact_conversation
+from .keyword_detection import KeywordDetectionStrategy
 
 # 取得模組特定的日誌記錄器
 logger = get_service_logger("local_detection")
 
-# 加載詐騙範本資料
-def _load_scam_data() -> Dict[str, Any]:
-    """
-    載入詐騙範本資料，包含範例和關鍵字。
-    
-    Returns:
-        Dict[str, Any]: 詐騙範例和關鍵字數據
-    """
-    try:
-        with open(SCAM_DATA_PATH, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.error(f"無法載入詐騙範本資料: {str(e)}")
-        # 返回預設的最小資料
-        return {
-            "scam_examples": [],
-            "keywords": []
-        }
-
 class LocalDetectionStrategy(DetectionStrategy):
     """
     基於本地規則和 agent 的檢測策略。
     """
+    accepts_export = True
+
     def detect(self, text: str) -> dict:
         # 你可以先寫一個假的回傳，之後再串模型邏輯
         print(f"[偵測中] 收到訊息：{text}")
@@ -57,57 +41,67 @@ class LocalDetectionStrategy(DetectionStrategy):
             "stage": 1
         }
     
-    def __init__(self):
-        """初始化本地檢測策略。"""
-        # 載入詐騙樣本和關鍵詞資料
-        self.data = _load_scam_data()
-        self.keywords = self.data.get("keywords", [])
-        
-        logger.info(f"載入了 {len(self.keywords)} 個關鍵詞")
+    def __init__(self, keyword_detector: Optional[KeywordDetectionStrategy] = None):
+        """
+        初始化本地檢測策略。
+
+        Args:
+            keyword_detector: 關鍵詞檢測策略，預設載入 data/scam_data.json
+        """
+        # 載入詐騙關鍵詞並建立關鍵字自動機（單次線性掃描）
+        self.keyword_detector = keyword_detector or KeywordDetectionStrategy()
+        self.data = self.keyword_detector.data
+        self.keywords = self.keyword_detector.keywords
+        self.automaton = self.keyword_detector.automaton
         
         # 初始化詐騙檢測 agent
         self.agent = create_agent(agent_type="scam_detection")
         logger.info("本地檢測策略初始化完成，已載入詐騙檢測 agent")
+
+        # 送給 agent 前的對話壓縮設定
+        self.token_budget = Config.AGENT_TOKEN_BUDGET
+        self.recent_messages = Config.AGENT_RECENT_MESSAGES
+        self.keyword_context = Config.AGENT_KEYWORD_CONTEXT
+
+    @property
+    def cache_version(self) -> str:
+        """以 LLM 供應商、模型與壓縮預算作為版本標識"""
+        return f"{type(self).__name__}:{Config.LLM_PROVIDER}:{Config.LLM_MODEL}:{self.token_budget}"
     
-    def _keyword_analysis(self, message_text: str) -> Dict[str, Any]:
-        """
-        基於關鍵詞分析訊息，檢查詐騙指標。
-        
-        Args:
-            message_text: 要分析的文字
-            
-        Returns:
-            Dict: 包含檢測到的關鍵詞和評分的分析結果
-        """
-        # 計算詐騙關鍵詞的出現次數
-        keyword_count = 0
-        found_keywords = []
-        
-        # 檢查每個關鍵詞
-        for keyword in self.keywords:
-            if re.search(r'\b' + re.escape(keyword) + r'\b', message_text, re.IGNORECASE):
-                keyword_count += 1
-                found_keywords.append(keyword)
-        
-        # 計算關鍵詞密度（關鍵詞數量 / 總字數）
-        total_words = len(message_text.split())
-        keyword_density = keyword_count / max(total_words, 1)
-        
-        # 基於關鍵詞密度和數量的風險評估
-        risk_score = min(1.0, (keyword_count * 0.1) + (keyword_density * 2))
-        
-        logger.info(f"關鍵詞分析完成，找到 {keyword_count} 個關鍵詞，風險評分: {risk_score:.2f}")
-        
-        return {
-            "found_keywords": found_keywords,
-            "keyword_count": keyword_count,
-            "keyword_density": keyword_density,
-            "risk_score": risk_score
-        }
+    def _keyword_analysis(self, message_text: str, export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """基於關鍵詞分析訊息（見 KeywordDetectionStrategy.keyword_analysis）"""
+        return self.keyword_detector.keyword_analysis(message_text, export=export)
+
+    def _compact(self, validated_text: Optional[str], export: LineExport) -> CompactedConversation:
+        """移除非內容行並將對話壓縮到 token 預算內，記錄省下的 token"""
+        compacted = compact_conversation(
+            validated_text,
+            self.token_budget,
+            automaton=self.automaton,
+            recent_messages=self.recent_messages,
+            context=self.keyword_context,
+            export=export
+        )
+        metrics.histogram("agent.compaction.tokens").observe(compacted.tokens)
+        metrics.counter("agent.compaction.saved_tokens").inc(compacted.saved_tokens)
+        logger.info(
+            f"對話壓縮：{compacted.total_messages} 則保留 {compacted.kept_messages} 則，"
+            f"約 {compacted.original_tokens} → {compacted.tokens} tokens"
+        )
+        return compacted
+
+    @staticmethod
+    def _with_compaction(result: Any, compacted: CompactedConversation) -> Any:
+        """在 agent 結果中附加壓縮摘要"""
+        if isinstance(result, dict) and result:
+            result = dict(result)
+            result["compaction"] = compacted.summary()
+        return result
     
     @with_error_handling(reraise=True)
-    def analyze(self, message_text: str, user_id: Optional[str] = None,
-                user_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def analyze(self, message_text: Optional[str], user_id: Optional[str] = None,
+                user_profile: Optional[Dict[str, Any]] = None,
+                export: Optional[LineExport] = None) -> Dict[str, Any]:
         """
         使用本地規則和 agent 分析訊息。
         主要處理看起來像 LINE 匯出格式的文字輸入。
@@ -116,6 +110,7 @@ class LocalDetectionStrategy(DetectionStrategy):
             message_text: 要分析的文字 (預期是 LINE 匯出格式)
             user_id: 可選的使用者 ID 作為上下文
             user_profile: 可選的使用者資料
+            export: 已驗證並解析的 LINE 匯出，提供時不再解析 message_text（可為 None）
 
         Returns:
             dict: 包含標籤、可信度和回覆的分析結果
@@ -125,29 +120,73 @@ class LocalDetectionStrategy(DetectionStrategy):
         """
         logger.info(f"開始分析訊息，用戶ID: {user_id}")
         
-        # 檢查輸入
-        if not message_text or not isinstance(message_text, str):
+        # 檢查輸入（已解析的匯出不需要原文）
+        if export is None and (not message_text or not isinstance(message_text, str)):
             error_msg = "訊息文本必須是非空字串"
             logger.error(error_msg)
             raise DetectionError(error_msg, status_code=400)
 
         try:
-            # 步驟 1: 驗證輸入是否為 LINE 匯出格式
+            # 步驟 1: 驗證並解析 LINE 匯出格式（單次走訪）
             try:
-                validated_text = validate_line_export(message_text)
+                if export is None:
+                    export = parse_validated_line_export(message_text)
                 logger.debug("LINE 匯出格式驗證通過。")
             except ValidationError as ve:
                 logger.warning(f"輸入格式驗證失敗: {str(ve)}")
                 raise 
 
-            # 步驟 2: (可選) 基於關鍵詞的快速掃描 
-            keyword_result = self._keyword_analysis(validated_text)
+            # 步驟 2: 逐則訊息掃描關鍵詞並壓縮對話，交給 agent 進行深度分析
+            compacted = self._compact(message_text, export)
+            agent_result_list = self.agent(compacted.text, user_id) # agent 返回的是列表
+
+            return self._with_compaction(agent_result_list, compacted)
+        except ValidationError as ve:
+            logger.warning(f"輸入格式驗證失敗，向上拋出錯誤: {str(ve)}")
+            raise
+        except Exception as e:
+            error_msg = f"本地檢測過程中發生未預期錯誤: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            raise DetectionError(error_msg, original_error=e)
+
+    @with_async_error_handling(reraise=True)
+    async def analyze_async(self, message_text: Optional[str], user_id: Optional[str] = None,
+                            user_profile: Optional[Dict[str, Any]] = None,
+                            export: Optional[LineExport] = None) -> Dict[str, Any]:
+        """
+        analyze 的非同步版本，使用 agent 的非同步 Runner 進行深度分析。
+
+        Args:
+            message_text: 要分析的文字 (預期是 LINE 匯出格式)
+            user_id: 可選的使用者 ID 作為上下文
+            user_profile: 可選的使用者資料
+            export: 已驗證並解析的 LINE 匯出，提供時不再解析 message_text（可為 None）
+
+        Returns:
+            dict: 包含標籤、可信度和回覆的分析結果
+
+        Raises:
+            DetectionError: 如果檢測過程中發生錯誤
+        """
+        logger.info(f"開始非同步分析訊息，用戶ID: {user_id}")
+
+        if export is None and (not message_text or not isinstance(message_text, str)):
+            error_msg = "訊息文本必須是非空字串"
+            logger.error(error_msg)
+            raise DetectionError(error_msg, status_code=400)
 
-            # 步驟 3: 使用 agent 進行深度分析，直接傳遞驗證後的原始文字
-            logger.debug("將驗證後的原始文字傳遞給 agent 進行分析。")
-            agent_result_list = self.agent(validated_text, user_id) # agent 返回的是列表
+        try:
+            if export is None:
+                export = parse_validated_line_export(message_text)
+            compacted = self._compact(message_text, export)
 
-            return agent_result_list
+            # agent 沒有非同步版本時退回執行緒執行
+            run_async = getattr(self.agent, "run_async", None)
+            if run_async is not None:
+                result = await run_async(compacted.text, user_id)
+            else:
+                result = await asyncio.to_thread(self.agent, compacted.text, user_id)
+            return self._with_compaction(result, compacted)
         except ValidationError as ve:
             logger.warning(f"輸入格式驗證失敗，向上拋出錯誤: {str(ve)}")
             raise
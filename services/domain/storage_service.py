@@ -1,5 +1,5 @@
 """
-儲存服務 - 基礎設施服務層(棄用)
+儲存服務 - 基礎設施服務層(棄用，改用 services/domain/conversation_state.py)
 
 此服務負責儲存和檢索聊天歷史。
 當前實現使用記憶體儲存，但未來可以擴展為使用
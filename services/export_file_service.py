@@ -0,0 +1,182 @@
+"""
+LINE 匯出檔案服務
+
+使用者以檔案上傳 LINE 聊天記錄（.txt）時，從 LINE 內容端點串流下載，
+邊下載邊以增量 UTF-8 解碼器切行並交給 line_export 解析器，
+只保留解析出的訊息紀錄，不在記憶體中保存完整的原始內容。
+貼上文字會受 LINE 訊息長度限制截斷，上傳檔案則能分析完整對話。
+
+大小上限依序以事件的 fileSize、回應的 Content-Length 與實際讀取的位元組數檢查，
+超過時立即中止下載。
+"""
+
+import codecs
+import time
+from typing import List, Optional
+
+from utils.error_handler import ValidationError
+from utils.fraud_sentiment import LineExport, LineExportParser, LineMessage
+from utils.logger import get_service_logger
+from utils.metrics import metrics
+from clients.line_client import LineClient
+
+# 取得模組特定的日誌記錄器
+logger = get_service_logger("export_file")
+
+# 超過大小上限時 ValidationError 的狀態碼，呼叫端據此回覆不同的提示
+FILE_TOO_LARGE_STATUS = 413
+
+
+class _StreamingExportReader:
+    """將位元組區塊增量解碼、切行並解析為訊息紀錄"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.parser = LineExportParser()
+        self.messages: List[LineMessage] = []
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._tail = ""
+
+    def feed(self, chunk: bytes) -> None:
+        """推入一個區塊；超過大小上限時拋出 ValidationError"""
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        self._feed_text(self._decoder.decode(chunk))
+
+    def close(self) -> LineExport:
+        """結束解析並回傳完整結果"""
+        self._feed_text(self._decoder.decode(b"", final=True))
+        if self._tail:
+            self._push(self._tail)
+            self._tail = ""
+        message = self.parser.close()
+        if message is not None:
+            self.messages.append(message)
+        return LineExport(self.messages, self.parser.senders, self.parser)
+
+    def _feed_text(self, text: str) -> None:
+        # 最後一段可能是不完整的行，留到下一個區塊
+        lines = (self._tail + text).split("\n")
+        self._tail = lines.pop()
+        for line in lines:
+            self._push(line)
+
+    def _push(self, line: str) -> None:
+        message = self.parser.feed(line)
+        if message is not None:
+            self.messages.append(message)
+
+
+class ExportFileService:
+    """下載並解析使用者上傳的 LINE 匯出檔"""
+
+    def __init__(self, line_client: LineClient, max_bytes: int = 5 * 1024 * 1024,
+                 chunk_size: int = 64 * 1024, extensions: tuple = (".txt",)):
+        """
+        初始化匯出檔案服務。
+
+        Args:
+            line_client: 與 LINE API 互動的客戶端
+            max_bytes: 檔案大小上限（位元組）
+            chunk_size: 串流讀取的區塊大小（位元組）
+            extensions: 接受的副檔名（小寫）
+        """
+        self.line_client = line_client
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.extensions = tuple(ext.lower() for ext in extensions)
+
+    def is_supported(self, file_name: Optional[str]) -> bool:
+        """是否為可分析的檔案類型"""
+        return bool(file_name) and file_name.lower().endswith(self.extensions)
+
+    def load(self, message_id: str, file_size: int = 0) -> LineExport:
+        """
+        串流下載並解析檔案。
+
+        Args:
+            message_id: 檔案訊息的 ID
+            file_size: webhook 事件中的檔案大小，超過上限時不下載
+
+        Returns:
+            LineExport: 解析結果
+
+        Raises:
+            ValidationError: 檔案超過大小上限或不是 LINE 匯出格式
+            LineError: 下載失敗
+        """
+        self._check_size(file_size)
+        start = time.perf_counter()
+        reader = _StreamingExportReader(self.max_bytes)
+        parse_seconds = 0.0
+
+        response = self.line_client.get_message_content(message_id)
+        try:
+            self._check_size(response.headers.get("Content-Length"))
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                parse_start = time.perf_counter()
+                reader.feed(chunk)
+                parse_seconds += time.perf_counter() - parse_start
+        finally:
+            response.close()
+
+        return self._finish(reader, start, parse_seconds)
+
+    async def load_async(self, message_id: str, file_size: int = 0) -> LineExport:
+        """load 的非同步版本"""
+        self._check_size(file_size)
+        start = time.perf_counter()
+        reader = _StreamingExportReader(self.max_bytes)
+        parse_seconds = 0.0
+
+        response = await self.line_client.get_message_content_async(message_id)
+        try:
+            self._check_size(response.headers.get("Content-Length"))
+            async for chunk in response.aiter_bytes(chunk_size=self.chunk_size):
+                parse_start = time.perf_counter()
+                reader.feed(chunk)
+                parse_seconds += time.perf_counter() - parse_start
+        finally:
+            await response.aclose()
+
+        return self._finish(reader, start, parse_seconds)
+
+    # === 輔助方法 ===
+    def _check_size(self, size) -> None:
+        """依宣告的大小預先拒絕過大的檔案"""
+        try:
+            size = int(size or 0)
+        except (TypeError, ValueError):
+            return
+        if size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+
+    def _finish(self, reader: _StreamingExportReader, start: float, parse_seconds: float) -> LineExport:
+        """結束解析、記錄下載與解析耗時並檢查格式"""
+        parse_start = time.perf_counter()
+        export = reader.close()
+        parse_seconds += time.perf_counter() - parse_start
+        total = time.perf_counter() - start
+
+        metrics.histogram("export_file.bytes").observe(reader.bytes_read)
+        metrics.histogram("export_file.download_seconds").observe(total - parse_seconds)
+        metrics.histogram("export_file.parse_seconds").observe(parse_seconds)
+        logger.info(
+            f"匯出檔案 {reader.bytes_read} bytes 解析出 {len(export.messages)} 則訊息，"
+            f"下載 {total - parse_seconds:.3f} 秒、解析 {parse_seconds:.3f} 秒"
+        )
+
+        if not export.parser.is_valid:
+            metrics.counter("export_file.rejected").inc()
+            raise ValidationError("格式驗證失敗：檔案不符合 LINE 對話匯出格式的基本特徵。")
+        return export
+
+
+def _too_large(max_bytes: int) -> ValidationError:
+    """超過大小上限的錯誤；每次拒絕只在此計數一次"""
+    metrics.counter("export_file.rejected").inc()
+    error_msg = f"檔案超過大小上限 {max_bytes} bytes"
+    logger.warning(error_msg)
+    return ValidationError(error_msg, status_code=FILE_TOO_LARGE_STATUS)
@@ -0,0 +1,95 @@
+"""
+使用者資料服務
+
+此服務以有界的 LRU/TTL 快取包裝 LineClient.get_profile，
+避免每則訊息都多一次 LINE API 往返。取得失敗時會短暫快取失敗結果
+（負向快取），避免 LINE API 異常時每則訊息都重試。
+"""
+
+from typing import Any, Dict, Optional
+from utils.cache import TTLCache
+from utils.logger import get_service_logger
+from utils.metrics import metrics
+from clients.line_client import LineClient
+
+# 取得模組特定的日誌記錄器
+logger = get_service_logger("profile")
+
+# 快取中代表「取得失敗」的標記
+_FETCH_FAILED = object()
+# 快取未命中的標記
+_MISS = object()
+
+
+class ProfileService:
+    """提供快取的 LINE 使用者資料查詢"""
+
+    def __init__(self, line_client: LineClient, max_size: int = 1000,
+                 ttl: float = 3600, negative_ttl: float = 60):
+        """
+        初始化使用者資料服務。
+
+        Args:
+            line_client: 與 LINE API 互動的客戶端
+            max_size: 最多快取的使用者數
+            ttl: 成功結果的快取秒數
+            negative_ttl: 失敗結果的快取秒數
+        """
+        self.line_client = line_client
+        self.negative_ttl = negative_ttl
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        取得使用者資料，優先使用快取。
+
+        Args:
+            user_id: LINE 使用者 ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 使用者資料；取得失敗時為 None
+        """
+        cached = self._lookup(user_id)
+        if cached is not _MISS:
+            return cached
+
+        try:
+            profile = self.line_client.get_profile(user_id)
+        except Exception as e:
+            return self._store_failure(user_id, e)
+        self._cache.set(user_id, profile)
+        return profile
+
+    async def get_profile_async(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """get_profile 的非同步版本"""
+        cached = self._lookup(user_id)
+        if cached is not _MISS:
+            return cached
+
+        try:
+            profile = await self.line_client.get_profile_async(user_id)
+        except Exception as e:
+            return self._store_failure(user_id, e)
+        self._cache.set(user_id, profile)
+        return profile
+
+    def invalidate(self, user_id: str) -> None:
+        """移除使用者的快取資料"""
+        self._cache.pop(user_id)
+
+    # === 輔助方法 ===
+    def _lookup(self, user_id: str) -> Any:
+        cached = self._cache.get(user_id, _MISS)
+        if cached is _MISS:
+            metrics.counter("profile.cache.misses").inc()
+            return _MISS
+        if cached is _FETCH_FAILED:
+            metrics.counter("profile.cache.negative_hits").inc()
+            return None
+        metrics.counter("profile.cache.hits").inc()
+        return cached
+
+    def _store_failure(self, user_id: str, error: Exception) -> None:
+        logger.warning(f"獲取使用者 {user_id} 的資料失敗，{self.negative_ttl} 秒內不再重試: {str(error)}")
+        self._cache.set(user_id, _FETCH_FAILED, ttl=self.negative_ttl)
+        return None
@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from config import Config
+from utils.agents.agent_factory import _create_adk_agent
+
+
+def test_agent_does_not_replay_session_history(monkeypatch):
+    monkeypatch.setattr(Config, "GOOGLE_API_KEY", "test-key")
+    # 回應快取與檢測結果快取只以內容為鍵，代理不能帶入同一使用者先前的對話
+    agent = _create_adk_agent("scam_detection", "instruction", "gemini", "gemini-test")
+    assert agent is not None
+    assert agent.include_contents == "none"
@@ -0,0 +1,175 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from flask import jsonify, request
+from werkzeug.serving import make_server
+
+from clients.analysis_api import AnalysisApiClient
+from clients.analysis_stub_server import ANALYZE_PATH, BATCH_PATH, create_stub_app, start_stub_server
+from clients.http_transport import HttpTransport, RetryPolicy
+from services.domain.detection.keyword_detection import KeywordDetectionStrategy
+from utils.circuit_breaker import STATE_HALF_OPEN, CircuitBreaker
+from utils.error_handler import ApiError
+
+# 批次回應少一筆 results 的路由，用來測試長度不符
+SHORT_BATCH_PATH = "/analyze/batch-short"
+
+SCAM = "你的帳戶異常，請立即匯款到安全帳戶"
+NORMAL = "今天晚上一起吃飯嗎"
+
+
+def expected_label(message):
+    return KeywordDetectionStrategy().analyze(message)["label"]
+
+
+@pytest.fixture(scope="module")
+def stub():
+    app = create_stub_app(overhead_ms=0, per_item_ms=0, workers=8)
+
+    @app.route(SHORT_BATCH_PATH, methods=["POST"])
+    def short_batch():
+        items = request.get_json()["items"]
+        return jsonify({"results": [{"label": "ok", "confidence": 1.0, "reply": ""}] * (len(items) - 1)})
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield app, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def slow_stub():
+    server, base_url = start_stub_server(overhead_ms=200, per_item_ms=0, workers=8)
+    yield base_url
+    server.shutdown()
+
+
+def make_client(base_url, batch_path=BATCH_PATH, breaker=None, linger_ms=200.0, max_size=16, timeout=30.0):
+    return AnalysisApiClient(
+        base_url + ANALYZE_PATH, transport=HttpTransport(retry_policy=RetryPolicy(max_retries=0)), breaker=breaker,
+        batch_url=base_url + batch_path, batch_max_size=max_size, batch_linger_ms=linger_ms, batch_timeout=timeout
+    )
+
+
+def fan_out(client, messages):
+    """多個執行緒同時呼叫 analyze_text，回傳各自的結果或例外"""
+    results = [None] * len(messages)
+    barrier = threading.Barrier(len(messages))
+
+    def call(index):
+        barrier.wait()
+        try:
+            results[index] = client.analyze_text({"message": messages[index]})
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(messages))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_analyze_batch_keeps_order_and_returns_item_errors(stub):
+    _, base_url = stub
+    client = make_client(base_url, max_size=2)
+    results = client.analyze_batch([{"message": SCAM}, {"message": ""}, {"message": NORMAL}])
+
+    assert len(results) == 3
+    assert results[0]["label"] == expected_label(SCAM)
+    assert isinstance(results[1], ApiError) and results[1].status_code == 400
+    assert results[2]["label"] == expected_label(NORMAL)
+
+
+def test_concurrent_callers_share_one_batch_and_get_their_own_results(stub):
+    app, base_url = stub
+    client = make_client(base_url)
+    before = dict(app.config["STUB_STATS"])
+    results = fan_out(client, [SCAM, NORMAL, "", NORMAL])
+
+    assert results[0]["label"] == expected_label(SCAM)
+    assert results[1]["label"] == results[3]["label"] == expected_label(NORMAL)
+    # 伺服器無法分析的項目只拋給該項目的呼叫者
+    assert isinstance(results[2], ApiError) and results[2].status_code == 400
+    assert app.config["STUB_STATS"]["requests"] - before["requests"] == 1
+    client.batcher.close()
+
+
+def test_result_length_mismatch_fails_every_caller_and_records_once(stub):
+    _, base_url = stub
+    breaker = CircuitBreaker("test_batch_mismatch", min_calls=100)
+    client = make_client(base_url, batch_path=SHORT_BATCH_PATH, breaker=breaker)
+    results = fan_out(client, [SCAM, NORMAL, NORMAL, NORMAL])
+
+    assert all(isinstance(r, ApiError) and r.status_code == 502 for r in results)
+    assert len(breaker._calls) == 1 and breaker._failures == 1
+    with pytest.raises(ApiError):
+        client.analyze_batch([{"message": SCAM}, {"message": NORMAL}])
+    assert len(breaker._calls) == 2 and breaker._failures == 2
+    client.batcher.close()
+
+
+def test_batch_returns_every_half_open_slot(stub):
+    _, base_url = stub
+    breaker = CircuitBreaker("test_batch_half_open", min_calls=1, open_seconds=0.0, half_open_calls=3)
+    breaker.record_failure()
+    assert breaker.state == STATE_HALF_OPEN
+    client = make_client(base_url, breaker=breaker)
+    results = fan_out(client, [SCAM, NORMAL, NORMAL])
+
+    assert all(isinstance(r, dict) for r in results)
+    # 一次成功的批次只算一次試探，其餘名額已歸還
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker._half_open_in_flight == 0 and breaker._half_open_successes == 1
+    client.batcher.close()
+
+
+def test_cancelled_batched_call_does_not_break_later_calls(slow_stub):
+    client = make_client(slow_stub, linger_ms=0)
+
+    async def scenario():
+        # 批次請求進行中時取消呼叫者
+        task = asyncio.ensure_future(client.analyze_text_async({"message": SCAM}))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        after_async = await asyncio.wait_for(client.analyze_text_async({"message": NORMAL}), 5)
+        after_sync = await asyncio.to_thread(client.analyze_text, {"message": NORMAL})
+        return after_async, after_sync
+
+    after_async, after_sync = asyncio.run(scenario())
+    assert after_async["label"] == after_sync["label"] == expected_label(NORMAL)
+    client.batcher.close()
+
+
+def test_call_cancelled_before_sending_returns_its_half_open_slot(stub):
+    _, base_url = stub
+    breaker = CircuitBreaker("test_batch_cancel_queued", min_calls=1, open_seconds=0.0)
+    breaker.record_failure()
+    client = make_client(base_url, breaker=breaker, linger_ms=300)
+
+    async def scenario():
+        task = asyncio.ensure_future(client.analyze_text_async({"message": SCAM}))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert breaker.state == STATE_HALF_OPEN and breaker._half_open_in_flight == 0
+    assert breaker.allow()
+    client.batcher.close()
+
+
+def test_sync_batched_call_times_out(slow_stub):
+    client = make_client(slow_stub, linger_ms=0, timeout=0.05)
+    with pytest.raises(ApiError) as error:
+        client.analyze_text({"message": SCAM})
+    assert error.value.status_code == 504
+    client.batcher.close()
@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from utils.cache import SQLiteCache, TTLCache
+
+def test_ttl_cache_purge_counts_evictions():
+    evicted = []
+    cache = TTLCache(max_size=10, ttl=60, on_evict=lambda key, value: evicted.append(key))
+    cache.set("old", 1, ttl=0.0)
+    cache.set("fresh", 2)
+    assert cache.purge_expired() == 1
+    assert evicted == ["old"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.get("fresh") == 2
+
+def test_sqlite_cache_purge_expired(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), ttl=60, table="test_cache")
+    cache.set("old", {"v": 1}, ttl=-1)
+    cache.set("fresh", {"v": 2})
+    assert len(cache) == 2
+    assert cache.purge_expired() == 1
+    assert cache.evictions == 1
+    assert len(cache) == 1 and cache.get("fresh") == {"v": 2}
+    assert cache.purge_expired() == 0
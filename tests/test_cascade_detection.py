@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import utils.validator as validator
+from services.domain.detection.cascade_detection import TIER_AGENT, CascadeDetectionStrategy
+from services.domain.detection.keyword_detection import KeywordDetectionStrategy
+
+EXPORT = "[LINE] 與小明的聊天記錄\n2025/04/01(二)\n21:03 小明 哈囉\n21:05 雅婷 今天好嗎"
+
+
+class FakeLocalStrategy:
+    """以真正的關鍵詞分析作為第一層，agent 層記錄收到的解析結果"""
+    cache_version = "fake-local"
+
+    def __init__(self):
+        self.keyword_detector = KeywordDetectionStrategy()
+        self.exports = []
+
+    def _keyword_analysis(self, text, export=None):
+        self.exports.append(export)
+        return self.keyword_detector.keyword_analysis(text, export=export)
+
+    def analyze(self, message_text, user_id=None, user_profile=None, export=None):
+        self.exports.append(export)
+        return {"label": "agent", "confidence": 0.9, "reply": "agent"}
+
+
+class UncertainBertStrategy:
+    cache_version = "fake-bert"
+
+    def __init__(self):
+        self.exports = []
+
+    def analyze(self, message_text, user_id=None, user_profile=None, export=None):
+        self.exports.append(export)
+        return {"label": "bert", "confidence": 0.6, "reply": "bert"}
+
+
+def test_every_tier_shares_one_parse(monkeypatch):
+    calls = []
+    parse = validator.parse_line_export
+    monkeypatch.setattr(validator, "parse_line_export", lambda text: calls.append(text) or parse(text))
+
+    local, bert = FakeLocalStrategy(), UncertainBertStrategy()
+    cascade = CascadeDetectionStrategy(keyword_strategy=local, bert_strategy=bert)
+    result = cascade.analyze(EXPORT)
+
+    assert result["tier"] == TIER_AGENT
+    assert len(calls) == 1
+    exports = local.exports + bert.exports
+    assert len(exports) == 3 and all(e is exports[0] for e in exports)
+    assert [m.content for m in exports[0].messages] == ["哈囉", "今天好嗎"]
@@ -0,0 +1,46 @@
+import asyncio
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from clients.analysis_api import AnalysisApiClient
+from utils.circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, CircuitBreaker
+
+
+class SlowTransport:
+    """arequest 永遠不會完成，用來模擬被取消的試探呼叫"""
+
+    async def arequest(self, *args, **kwargs):
+        await asyncio.sleep(60)
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=0.0)
+    breaker.record_failure()
+    assert breaker.state == STATE_HALF_OPEN
+    return breaker
+
+def test_release_returns_half_open_probe_slot():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_success(0.01)
+    assert breaker.state == STATE_CLOSED
+
+def test_cancelled_async_probe_does_not_wedge_breaker():
+    breaker = half_open_breaker()
+    client = AnalysisApiClient("http://analysis.test/analyze", transport=SlowTransport(), breaker=breaker)
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(client.analyze_text_async({"message": "hi"}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow()
@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from services.domain.conversation_compactor import SKIP_MARKER, TRUNCATED_SUFFIX, compact_conversation
+from utils.agents.tokens import estimate_tokens
+from utils.fraud_sentiment import KeywordAutomaton
+
+HEADER = "[LINE] 與小明的聊天記錄\n儲存日期：2025/04/22 10:00\n\n2025/04/01(二)\n"
+
+
+def export(*lines):
+    return HEADER + "\n".join(lines)
+
+
+def automaton():
+    result = KeywordAutomaton()
+    result.add("匯款")
+    result.add("保證獲利")
+    return result.build()
+
+
+def test_within_budget_drops_non_content_lines_and_collapses_repeats():
+    text = export("21:03 小明 你好", "21:04 小明 你好", "21:05 雅婷 [貼圖]", "21:06 雅婷 嗨")
+    compacted = compact_conversation(text, token_budget=0)
+    assert compacted.total_messages == compacted.kept_messages == 2
+    assert compacted.collapsed == 1
+    assert "21:04 小明 你好 ×2" in compacted.text
+    assert "[貼圖]" not in compacted.text
+
+
+def test_over_budget_keeps_recent_and_keyword_dense_messages():
+    filler = [f"21:{minute:02d} 雅婷 今天天氣很好我們去散步吧第{minute}次" for minute in range(10, 40)]
+    text = export("21:00 小明 保證獲利的投資，匯款到這個帳戶", *filler, "21:59 小明 最新消息")
+    budget = 80
+    compacted = compact_conversation(text, budget, automaton=automaton(), recent_messages=2, context=0)
+    assert compacted.tokens <= budget
+    assert "保證獲利" in compacted.text
+    assert "最新消息" in compacted.text
+    assert "略過" in compacted.text
+    assert 2 <= compacted.kept_messages < compacted.total_messages
+
+
+def test_oversized_newest_message_is_truncated_instead_of_dropped():
+    text = export("21:03 小明 你好", "21:04 雅婷 嗨", "21:05 小明 " + "匯款" * 100)
+    compacted = compact_conversation(text, token_budget=50)
+    assert compacted.kept_messages == 1
+    assert compacted.tokens <= 50
+    assert "21:05 小明 匯款" in compacted.text
+    assert compacted.text.endswith(TRUNCATED_SUFFIX)
+    assert compacted.text.startswith(SKIP_MARKER.format(count=2))
+
+
+def test_tiny_budget_still_keeps_one_message():
+    text = export("21:03 小明 你好", "21:05 小明 " + "匯款" * 100)
+    compacted = compact_conversation(text, token_budget=1)
+    assert compacted.kept_messages == 1
+    assert "21:05 小明 " + TRUNCATED_SUFFIX in compacted.text
+    assert compacted.tokens == estimate_tokens(compacted.text)
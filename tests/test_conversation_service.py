@@ -0,0 +1,78 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from services.conversation_service import ConversationService
+from utils.error_handler import AppError, LineError
+
+RESULT = {"label": "安全或初期探索", "confidence": 0.9, "reply": "這則訊息看起來是安全的。"}
+
+
+class SlowDetectionService:
+    """等到 release 被設定才回傳結果，用來觸發延遲推送"""
+
+    needs_user_profile = False
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def analyze_message(self, message_text, **kwargs):
+        self.release.wait(5)
+        return dict(RESULT)
+
+    async def analyze_message_async(self, message_text, **kwargs):
+        await asyncio.to_thread(self.release.wait, 5)
+        return dict(RESULT)
+
+
+class FailingReplyLineClient:
+    """回覆一律失敗（例如回覆令牌已失效），推送正常"""
+
+    def __init__(self):
+        self.pushed = []
+        self.pushed_event = threading.Event()
+
+    def reply_message(self, reply_token, text):
+        raise LineError("Invalid reply token", status_code=400)
+
+    async def reply_message_async(self, reply_token, text):
+        self.reply_message(reply_token, text)
+
+    def push_message(self, user_id, text):
+        self.pushed.append((user_id, text))
+        self.pushed_event.set()
+
+    async def push_message_async(self, user_id, text):
+        self.push_message(user_id, text)
+
+
+def make_service():
+    detection = SlowDetectionService()
+    line_client = FailingReplyLineClient()
+    service = ConversationService(detection, line_client, reply_deadline=0.05, detection_workers=1)
+    return service, detection, line_client
+
+
+def test_result_is_pushed_even_if_pending_reply_fails():
+    service, detection, line_client = make_service()
+    with pytest.raises(AppError):
+        service.process_message("U1", "你好", "token")
+    detection.release.set()
+    assert line_client.pushed_event.wait(5)
+    assert line_client.pushed == [("U1", RESULT["reply"])]
+
+
+def test_async_result_is_pushed_even_if_pending_reply_fails():
+    service, detection, line_client = make_service()
+
+    async def scenario():
+        with pytest.raises(AppError):
+            await service.process_message_async("U1", "你好", "token")
+        detection.release.set()
+        await asyncio.wait_for(asyncio.gather(*service._deferred_tasks), 5)
+
+    asyncio.run(scenario())
+    assert line_client.pushed == [("U1", RESULT["reply"])]
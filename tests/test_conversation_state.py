@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from services.domain.conversation_state import (
+    MAX_MESSAGE_CHARS, ConversationState, ConversationStateStore, summarize_message
+)
+from utils.fraud_sentiment import TAG_STAGE, KeywordAutomaton, classify_stage_ids, parse_line_export
+
+EXPORT = (
+    "[LINE] 與小明的聊天記錄\n儲存日期：2025/04/22 10:00\n\n"
+    "2025/04/01(二)\n21:03 小明 你好\n21:05 小明 保證獲利的投資機會\n21:06 雅婷 [貼圖]"
+)
+
+
+def stage_automaton():
+    automaton = KeywordAutomaton()
+    automaton.add("認識", TAG_STAGE, 0)
+    automaton.add("寶貝", TAG_STAGE, 2)
+    return automaton.build()
+
+
+def make_store(**kwargs):
+    kwargs.setdefault("half_life", 0)
+    return ConversationStateStore(automaton=stage_automaton(), **kwargs)
+
+
+def test_export_is_stored_as_short_summary():
+    store = make_store()
+    store.update("U1", parse_line_export(EXPORT), {"risk_score": 0.2})
+    store.update("U1", "寶" * 1000, {"risk_score": 0.2})
+    messages = list(store.get("U1").messages)
+    assert messages[0] == "[LINE 匯出 2 則訊息] 保證獲利的投資機會"
+    assert messages[1] == "寶" * MAX_MESSAGE_CHARS
+    assert summarize_message(parse_line_export("[LINE] 與小明的聊天記錄\n")).startswith("[LINE 匯出 0 則訊息]")
+
+
+def test_risk_decays_with_half_life():
+    state = ConversationState(history_size=5)
+    state.update("第一則", 0.8, [], half_life=60, alpha=0.3, now=0)
+    state.update("第二則", 0.0, [], half_life=60, alpha=0.3, now=60)
+    assert state.risk == pytest.approx(0.4)
+    assert state.mean_risk == pytest.approx(0.7 * 0.4)
+    state.update("第三則", 0.0, [], half_life=60, alpha=0.3, now=180)
+    assert state.risk == pytest.approx(0.1)
+
+
+def test_stage_keeps_most_advanced_hit():
+    store = make_store()
+    assert store.update("U1", "很高興認識你", {"risk_score": 0.1})["stage"] == classify_stage_ids([0])
+    assert store.update("U1", "寶貝晚安", {"risk_score": 0.1})["stage"] == classify_stage_ids([2])
+    assert store.update("U1", "再次認識", {"risk_score": 0.1})["stage"] == classify_stage_ids([2])
+
+
+def test_alert_only_when_accumulated_risk_exceeds_new_message():
+    store = make_store(alert_threshold=0.7)
+    first = store.update("U1", "保證獲利", {"risk_score": 0.9})
+    assert not first["alert"]
+    second = store.update("U1", "晚安", {"risk_score": 0.1})
+    assert second["alert"]
+    assert second["message_count"] == 2
+    assert not store.update("U2", "晚安", {"risk_score": 0.1})["alert"]
@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from services.domain.conversation_state import ConversationStateStore
+from services.domain.detection.detection_service import DetectionService
+from utils.fraud_sentiment import LineExport, parse_line_export
+
+EXPORT = (
+    "[LINE] 與小明的聊天記錄\n儲存日期：2025/04/22 10:00\n\n"
+    "2025/04/01(二)\n21:03 小明 你好\n21:05 小明 保證獲利的投資機會，匯款到這個帳戶\n21:06 雅婷 [貼圖]"
+)
+
+
+def test_export_reaches_strategy_without_serializing_and_shares_cache_key(monkeypatch):
+    monkeypatch.setenv("DETECTION_STRATEGY", "ensemble")
+    monkeypatch.setenv("ENSEMBLE_MEMBERS", "keyword")
+    service = DetectionService(cache_size=8, conversation_states=ConversationStateStore())
+    export = parse_line_export(EXPORT)
+    canonical = export.to_text()
+
+    def fail(self):
+        raise AssertionError("export 不應被組回文字")
+
+    monkeypatch.setattr(LineExport, "to_text", fail)
+    result = service.analyze_message(None, user_id="u1", export=export)
+    assert result["members"]["keyword"]["label"] == result["label"]
+    assert result["conversation"]["message_count"] == 1
+    assert service.result_cache.stats()["misses"] == 1
+
+    # 貼上相同內容的標準格式文字命中同一個快取項目
+    assert service._cache_key(export) == service._cache_key(canonical)
+    cached = service.analyze_message(canonical, user_id="u1")
+    assert cached["label"] == result["label"]
+    assert service.result_cache.stats()["hits"] == 1
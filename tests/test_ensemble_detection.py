@@ -0,0 +1,94 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from services.domain.detection.base import DetectionStrategy
+from services.domain.detection.ensemble_detection import EnsembleDetectionStrategy, EnsembleMember
+
+
+class FixedStrategy(DetectionStrategy):
+    def analyze(self, message_text, user_id=None, user_profile=None):
+        return {"label": "正常", "confidence": 0.9, "reply": "ok", "risk_score": 0.1}
+
+
+class BlockingStrategy(DetectionStrategy):
+    """在 release 之前不會回傳，模擬無法中斷的推論或 API 呼叫"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def analyze(self, message_text, user_id=None, user_profile=None):
+        self.calls += 1
+        self.release.wait(10)
+        return {"label": "詐騙", "confidence": 0.9, "reply": "scam", "risk_score": 0.9}
+
+
+def build(slow):
+    members = [
+        EnsembleMember("fast", FixedStrategy(), timeout=1.0),
+        EnsembleMember("slow", slow, timeout=0.05),
+    ]
+    return EnsembleDetectionStrategy(members=members, max_workers=4)
+
+
+def test_abandoned_member_is_shed_instead_of_pinning_pool():
+    slow = BlockingStrategy()
+    ensemble = build(slow)
+    try:
+        # 每個成員最多佔用 2 個執行緒；之後的請求略過 slow，fast 仍可取得執行緒
+        for _ in range(5):
+            result = ensemble.analyze("hello")
+            assert result["dropped"] == ["slow"]
+            assert result["members"]["fast"]["label"] == "正常"
+        assert slow.calls == 2
+        assert ensemble.members[1]._in_flight == 2
+    finally:
+        slow.release.set()
+        ensemble._executor.shutdown(wait=True)
+    assert ensemble.members[1]._in_flight == 0
+
+
+def test_async_path_shares_the_in_flight_limit():
+    slow = BlockingStrategy()
+    ensemble = build(slow)
+    try:
+        for _ in range(3):
+            result = asyncio.run(ensemble.analyze_async("hello"))
+            assert result["dropped"] == ["slow"]
+        assert slow.calls == 2
+    finally:
+        slow.release.set()
+        ensemble._executor.shutdown(wait=True)
+    assert ensemble.members[1]._in_flight == 0
+
+
+def test_cancelled_batched_api_member_does_not_break_the_client():
+    from clients.analysis_api import AnalysisApiClient
+    from clients.analysis_stub_server import ANALYZE_PATH, BATCH_PATH, start_stub_server
+    from clients.http_transport import HttpTransport, RetryPolicy
+    from services.domain.detection.api_detection import ApiDetectionStrategy
+
+    server, base_url = start_stub_server(overhead_ms=200, per_item_ms=0)
+    client = AnalysisApiClient(
+        base_url + ANALYZE_PATH, transport=HttpTransport(retry_policy=RetryPolicy(max_retries=0)),
+        batch_url=base_url + BATCH_PATH, batch_max_size=4, batch_linger_ms=0
+    )
+    api = EnsembleMember("api", ApiDetectionStrategy(client, fallback="none"), timeout=0.05)
+    ensemble = EnsembleDetectionStrategy(members=[EnsembleMember("fast", FixedStrategy(), timeout=1.0), api])
+    try:
+        # api 成員逾時被取消（批次請求進行中）
+        for _ in range(2):
+            result = asyncio.run(ensemble.analyze_async("hello"))
+            assert result["dropped"] == ["api"]
+
+        # 之後的呼叫仍能取得結果
+        api.timeout = 5.0
+        result = asyncio.run(ensemble.analyze_async("hello"))
+        assert result["dropped"] == [] and "api" in result["members"]
+        assert "label" in client.analyze_text({"message": "hello"})
+    finally:
+        client.batcher.close()
+        server.shutdown()
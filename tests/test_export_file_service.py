@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from services.export_file_service import FILE_TOO_LARGE_STATUS, ExportFileService
+from utils.error_handler import ValidationError
+from utils.metrics import metrics
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, content_length=None):
+        self.body = body
+        self.headers = {} if content_length is None else {"Content-Length": str(content_length)}
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeLineClient:
+    def __init__(self, response):
+        self.response = response
+
+    def get_message_content(self, message_id):
+        return self.response
+
+
+def rejected():
+    return metrics.counter("export_file.rejected").value
+
+
+@pytest.mark.parametrize("file_size, content_length, body", [
+    (1000, None, b""),                  # 事件宣告的大小
+    (0, 1000, b""),                     # Content-Length
+    (0, None, b"x" * 1000),             # 實際讀取量
+])
+def test_each_size_rejection_is_counted_once(file_size, content_length, body):
+    response = FakeResponse(body, content_length)
+    service = ExportFileService(FakeLineClient(response), max_bytes=100, chunk_size=64)
+    before = rejected()
+    with pytest.raises(ValidationError) as error:
+        service.load("m1", file_size)
+    assert error.value.status_code == FILE_TOO_LARGE_STATUS
+    assert rejected() - before == 1
+
+
+def test_format_rejection_is_counted_once():
+    response = FakeResponse("不是 LINE 匯出\n只是一般文字".encode("utf-8"))
+    service = ExportFileService(FakeLineClient(response), max_bytes=1000)
+    before = rejected()
+    with pytest.raises(ValidationError):
+        service.load("m1")
+    assert rejected() - before == 1
+    assert response.closed
@@ -0,0 +1,108 @@
+import asyncio
+import io
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import httpx
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from clients.http_transport import HttpTransport, RetryPolicy
+
+URL = "https://api.line.me/v2/bot/message/reply"
+
+
+class FakeSession:
+    """依序丟出例外或回傳狀態碼的 requests.Session 替身"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, *args, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response.raw = io.BytesIO(b"")
+        return response
+
+
+def make_transport(outcomes):
+    transport = HttpTransport(retry_policy=RetryPolicy(max_retries=2, backoff_base=0.0))
+    transport.session = FakeSession(outcomes)
+    return transport
+
+
+def connect_failure():
+    reason = NewConnectionError(None, "connection refused")
+    return requests.ConnectionError(MaxRetryError(None, URL, reason=reason))
+
+
+def async_transport(outcomes):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, type):
+            raise outcome("boom", request=request)
+        return httpx.Response(outcome)
+
+    transport = HttpTransport(retry_policy=RetryPolicy(max_retries=2, backoff_base=0.0))
+    transport._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return transport, calls
+
+
+def test_reply_is_not_retried_after_read_timeout():
+    transport = make_transport([requests.exceptions.ReadTimeout(), 200])
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        transport.request("POST", URL, endpoint="line.reply")
+    assert transport.session.calls == 1
+
+
+def test_reply_is_not_retried_on_5xx():
+    transport = make_transport([503, 200])
+    response = transport.request("POST", URL, endpoint="line.reply")
+    assert response.status_code == 503
+    assert transport.session.calls == 1
+
+
+def test_reply_is_retried_when_request_was_never_sent():
+    transport = make_transport([connect_failure(), requests.exceptions.ConnectTimeout(), 429, 200])
+    transport.retry_policy.max_retries = 3
+    response = transport.request("POST", URL, endpoint="line.reply")
+    assert response.status_code == 200
+    assert transport.session.calls == 4
+
+
+def test_reply_is_not_retried_when_connection_drops_after_send():
+    transport = make_transport([requests.ConnectionError("Connection aborted."), 200])
+    with pytest.raises(requests.ConnectionError):
+        transport.request("POST", URL, endpoint="line.reply")
+    assert transport.session.calls == 1
+
+
+def test_idempotent_endpoints_still_retry_timeouts_and_5xx():
+    transport = make_transport([requests.exceptions.ReadTimeout(), 503, 200])
+    response = transport.request("GET", URL, endpoint="line.profile")
+    assert response.status_code == 200
+    assert transport.session.calls == 3
+
+
+def test_async_reply_retries_only_unsent_requests():
+    async def scenario():
+        sent, sent_calls = async_transport([httpx.ReadTimeout, 200])
+        with pytest.raises(httpx.ReadTimeout):
+            await sent.arequest("POST", URL, endpoint="line.reply")
+        failed, failed_calls = async_transport([502, 200])
+        status = (await failed.arequest("POST", URL, endpoint="line.reply")).status_code
+        unsent, unsent_calls = async_transport([httpx.ConnectError, 429, 200])
+        retried = (await unsent.arequest("POST", URL, endpoint="line.reply")).status_code
+        return len(sent_calls), (status, len(failed_calls)), (retried, len(unsent_calls))
+
+    assert asyncio.run(scenario()) == (1, (502, 1), (200, 3))
@@ -0,0 +1,28 @@
+import base64
+import hashlib
+import hmac
+import logging
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot.line_webhook import LineWebhookHandler
+
+SECRET = "channel-secret"
+BODY = '{"events": []}'
+
+
+def sign(body: str) -> str:
+    return base64.b64encode(hmac.new(SECRET.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()).decode()
+
+
+def test_validate_signature_does_not_leak_expected_signature(capsys, caplog):
+    handler = LineWebhookHandler(conversation_service=None, channel_secret=SECRET)
+    expected = sign(BODY)
+    with caplog.at_level(logging.DEBUG):
+        assert handler.validate_signature(BODY, expected)
+        assert not handler.validate_signature(BODY, sign(BODY + " "))
+        assert not handler.validate_signature(BODY, None)
+    captured = capsys.readouterr()
+    assert expected not in captured.out + captured.err
+    assert expected not in caplog.text
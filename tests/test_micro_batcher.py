@@ -0,0 +1,106 @@
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from utils.micro_batcher import MicroBatcher
+
+
+def test_concurrent_items_are_batched_and_results_fan_out():
+    batches = []
+
+    def batch_fn(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=100, name="test.fan_out")
+    futures = [batcher.submit(i) for i in range(5)]
+    assert [f.result(5) for f in futures] == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+    batcher.close()
+
+
+def test_batch_error_reaches_every_caller():
+    def batch_fn(items):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=50, name="test.error")
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(5)
+    batcher.close()
+
+
+def test_cancelled_async_caller_does_not_kill_the_worker():
+    started = threading.Event()
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items):
+        seen.extend(items)
+        started.set()
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=0, name="test.cancel")
+
+    async def scenario():
+        # 第一批進行中時提交並取消第二個項目，項目被略過
+        first = asyncio.ensure_future(batcher.submit_async("running"))
+        await asyncio.to_thread(started.wait, 5)
+        cancelled = asyncio.ensure_future(batcher.submit_async("cancelled"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        # 第一批中的呼叫者在結果交付前被取消
+        first.cancel()
+        # 取消經由事件迴圈傳遞到 concurrent Future
+        await asyncio.sleep(0.01)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await asyncio.wait_for(batcher.submit_async("next"), 5)
+
+    assert asyncio.run(scenario()) == "next"
+    assert "cancelled" not in seen
+    assert batcher._worker.is_alive()
+    batcher.close()
+
+
+def test_dead_worker_is_restarted():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=2, max_wait_ms=0, name="test.restart")
+    assert batcher("a", timeout=5) == "a"
+    batcher.close()
+    # 模擬工作執行緒意外結束但仍留有參考
+    batcher._worker = threading.Thread(target=lambda: None)
+    batcher._worker.start()
+    batcher._worker.join()
+    assert batcher("b", timeout=5) == "b"
+    batcher.close()
+
+
+def test_sync_timeout_cancels_pending_item():
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items):
+        seen.extend(items)
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=1, max_wait_ms=0, name="test.timeout")
+    first = batcher.submit("first")
+    time.sleep(0.05)
+    with pytest.raises(FuturesTimeoutError):
+        batcher("late", timeout=0.05)
+    release.set()
+    assert first.result(5) == "first"
+    assert batcher("after", timeout=5) == "after"
+    assert "late" not in seen
+    batcher.close()
@@ -3,14 +3,34 @@ Agent 工廠模組
 
 此模組提供創建不同類型 AI 代理的工具，
 特別是使用 Google 的 Agent Development Kit (ADK) 創建詐騙檢測代理。
+
+每個代理只建立一次 Runner 與會話服務；使用者的會話保存在有上限、閒置逾時的
+LRU 中重複使用，同一使用者的並行呼叫改用臨時會話，不會共用同一個會話。
+代理設定 include_contents="none"：會話只用於重複使用連線與狀態，
+每次分析只送出本次的對話，判定不受同一使用者先前的匯出影響，token 用量也不隨輪數增長，
+因此回應快取與檢測結果快取只需以內容作為鍵值。
+完全相同的對話直接回傳回應快取中的結果，不再呼叫 LLM。
+代理呼叫都在共用的背景事件迴圈上以 ADK 非同步 Runner 執行，
+受 provider 並行上限（AGENT_MAX_CONCURRENCY）與逾時（AGENT_TIMEOUT_SECONDS）限制。
 """
 
+import asyncio
+import hashlib
 import json
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
 from typing import Dict, Any, Optional, Union
 
 from utils.logger import get_adk_logger
 from utils.error_handler import ConfigError
+from utils.cache import TTLCache
+from utils.metrics import metrics
+from utils.agents.response_cache import AgentResponseCache
+from utils.agents.tokens import estimate_tokens
 from config import Config
 
 from google.adk.agents import Agent
@@ -25,6 +45,9 @@ DATA_DIR = os.path.join(
 )
 STAGE_DEFINITIONS_PATH = os.path.join(DATA_DIR, 'stage_definitions.json')
 
+APP_NAME = "scam-bot"
+DEFAULT_USER_ID = "default_user"
+
 logger = get_adk_logger("agent_factory")
 
 
@@ -33,8 +56,86 @@ def create_agent(
     llm_provider: Optional[str] = None,
     model_name: Optional[str] = None
 ) -> callable:
-    instruction = _get_instruction(agent_type)
-    agent = _create_adk_agent(agent_type, instruction, llm_provider, model_name)
+    """
+    創建代理並回傳執行函數。
+
+    回傳的 run_agent(conversation, user_id) 為同步呼叫；
+    run_agent.run_async(conversation, user_id) 為使用 ADK 非同步 Runner 的協程版本；
+    run_agent.sessions 為該代理共用的 AgentSessionPool（代理建立失敗時為 None）；
+    run_agent.cache 為代理回應快取（停用時為 None）。
+    """
+    provider = llm_provider or Config.LLM_PROVIDER
+    model = model_name or Config.LLM_MODEL
+    instruction_source = _InstructionSource(agent_type)
+    agent = _create_adk_agent(agent_type, instruction_source.instruction, provider, model)
+    sessions = AgentSessionPool(
+        agent,
+        max_sessions=Config.AGENT_SESSION_MAX,
+        ttl=Config.AGENT_SESSION_TTL,
+        max_turns=Config.AGENT_SESSION_MAX_TURNS
+    ) if agent else None
+    cache = AgentResponseCache(
+        max_size=Config.AGENT_CACHE_SIZE,
+        ttl=Config.AGENT_CACHE_TTL,
+        path=Config.AGENT_CACHE_PATH or None,
+        disk_size=Config.AGENT_CACHE_DISK_SIZE
+    ) if agent and Config.AGENT_CACHE_SIZE > 0 else None
+
+    def prepare(conversation):
+        """建立使用者訊息並查詢回應快取，回傳 (user_message, cache_key, 快取的回應)"""
+        if instruction_source.refresh():
+            # 階段定義變更：更新代理指令，指令雜湊改變使舊的快取回應失效
+            agent.instruction = instruction_source.instruction
+            if cache is not None:
+                cache.invalidate()
+            logger.info("階段定義已變更，重新產生代理指令並清除回應快取")
+        user_message = _build_user_message(conversation)
+        if cache is None:
+            return user_message, None, None
+        cache_key = cache.make_key(
+            agent_type, instruction_source.digest, f"{provider}/{model}", _message_text(user_message)
+        )
+        return user_message, cache_key, cache.get(cache_key)
+
+    def finish(user_message, cache_key, final_text, usage_tokens, started):
+        """解析最終回應，成功的回應寫入快取"""
+        result = _parse_final_response(final_text)
+        if cache_key is not None and final_text is not None:
+            tokens = usage_tokens or (
+                estimate_tokens(instruction_source.instruction)
+                + estimate_tokens(_message_text(user_message))
+                + estimate_tokens(json.dumps(result, ensure_ascii=False))
+            )
+            cache.set(cache_key, result, time.perf_counter() - started, tokens)
+        return result
+
+    async def invoke(user_message, user_id: Optional[str]):
+        """在代理事件迴圈上執行：等待 provider 並行名額，並在逾時內消費 Runner 的事件串流"""
+        final_text = None
+        usage_tokens = 0
+        semaphore = _agent_loop.semaphore(provider, Config.AGENT_MAX_CONCURRENCY)
+        queued = time.perf_counter()
+        async with semaphore:
+            metrics.histogram("agent.queue_wait_seconds").observe(time.perf_counter() - queued)
+            in_flight = metrics.gauge("agent.in_flight")
+            in_flight.inc()
+            try:
+                with sessions.session(user_id) as (runner, session_user_id, session_id):
+                    async for event in runner.run_async(
+                        user_id=session_user_id,
+                        session_id=session_id,
+                        new_message=user_message
+                    ):
+                        usage_tokens += _event_tokens(event)
+                        if event.is_final_response():
+                            final_text = event.content
+            finally:
+                in_flight.dec()
+        return final_text, usage_tokens
+
+    async def invoke_with_timeout(user_message, user_id: Optional[str]):
+        """逾時（含排隊時間）時取消事件串流"""
+        return await asyncio.wait_for(invoke(user_message, user_id), timeout=Config.AGENT_TIMEOUT_SECONDS or None)
 
     def run_agent(conversation: Union[str, Dict[str, Any]], user_id: Optional[str] = None) -> Dict[str, Any]:
         if not agent:
@@ -42,111 +143,344 @@ def create_agent(
             return {}
 
         try:
-            # 創建會話服務
-            session_service = InMemorySessionService()
-            
-            # 設定應用名稱和會話ID
-            app_name = "scam-bot"
-            session_id = f"session_{user_id or 'default'}"
-            
-            # 確保會話存在
-            session_service.create_session(
-                app_name=app_name,
-                user_id=user_id or "default_user",
-                session_id=session_id
-            )
-            
-            # 正確初始化 Runner
-            runner = Runner(
-                agent=agent,
-                app_name=app_name,
-                session_service=session_service
-            )
-            
-            # 檢查 conversation 是字符串還是字典
-            if isinstance(conversation, str):
-                # 如果是字符串，嘗試解析為 JSON
-                try:
-                    conv_dict = json.loads(conversation)
-                except json.JSONDecodeError:
-                    # 如果無法解析，將整個字符串作為消息內容
-                    conv_dict = {
-                        "conversation": [{"type": "user_message", "content": conversation, "source": "user"}]
-                    }
-            else:
-                # 已經是字典，直接使用
-                conv_dict = conversation
-                
-            # 取出最新的使用者訊息
-            msgs = conv_dict.get("conversation", [])
-            
-            # 取出用戶的主要訊息，移除可能的重複
-            user_messages = []
-            seen_contents = set()
-            
-            for msg in msgs:
-                if isinstance(msg, dict):
-                    # 如果是使用者訊息或不知類型的訊息
-                    if msg.get("source") == "user" or msg.get("type") == "user_message" or msg.get("type") == "unknown":
-                        content = msg.get("content", "")
-                        if content and content not in seen_contents:
-                            seen_contents.add(content)
-                            user_messages.append(content)
-            
-            # 組合使用者訊息，優先使用最後一條
-            if user_messages:
-                last = user_messages[-1]  # 使用最後一條使用者訊息
-            else:
-                # 如果沒有辨識到使用者訊息，預設使用最後一條消息
-                if msgs and isinstance(msgs[-1], dict):
-                    last = msgs[-1].get("content", "")
-                elif msgs:
-                    last = str(msgs[-1])
-                else:
-                    last = str(conversation)
-            
-            # 包裝為 Gemini/Google GenAI 要求的 Content
-            from google.genai.types import Content, Part
-            user_message = Content(role="user", parts=[Part(text=last)])
-            
-            # 執行代理
-            final_text = None
-            for event in runner.run(
-                user_id=user_id or "default_user",
-                session_id=session_id,
-                new_message=user_message
-            ):
-                if event.is_final_response():
-                    final_text = event.content
-            
-            # 分析並回傳結果
-            if final_text:
-                try:
-                    # 試著從 final_text 提取文本
-                    if hasattr(final_text, 'parts') and final_text.parts:
-                        text = final_text.parts[0].text
-                    else:
-                        text = str(final_text)
-                        
-                    # 嘗試解析 JSON
-                    return json.loads(text)
-                except (json.JSONDecodeError, AttributeError):
-                    # 如果無法解析 JSON 或處理屬性，返回原始文本
-                    if hasattr(final_text, 'parts') and final_text.parts:
-                        text = final_text.parts[0].text
-                    else:
-                        text = str(final_text)
-                    return {"analysis": text, "reply": text}
-            
-            return {"analysis": "無回應", "reply": "無回應"}
-            
+            started = time.perf_counter()
+            user_message, cache_key, cached = prepare(conversation)
+            if cached is not None:
+                return cached
+
+            # 在代理事件迴圈上執行，呼叫端執行緒最多等待 AGENT_TIMEOUT_SECONDS
+            future = _agent_loop.submit(invoke_with_timeout(user_message, user_id))
+            final_text, usage_tokens = future.result()
+            return finish(user_message, cache_key, final_text, usage_tokens, started)
+
+        except (asyncio.TimeoutError, FuturesTimeoutError):
+            return _timeout_result(started)
         except Exception as e:
             logger.error(f"運行代理時錯誤: {e}")
             return {}
 
+    async def run_agent_async(conversation: Union[str, Dict[str, Any]], user_id: Optional[str] = None) -> Dict[str, Any]:
+        if not agent:
+            logger.error("代理未創建成功")
+            return {}
+
+        try:
+            started = time.perf_counter()
+            user_message, cache_key, cached = prepare(conversation)
+            if cached is not None:
+                return cached
+
+            # 以非同步 Runner 在代理事件迴圈上執行，等待 LLM 期間不佔用執行緒；
+            # 呼叫端被取消時一併取消代理迴圈上的工作
+            future = _agent_loop.submit(invoke_with_timeout(user_message, user_id))
+            final_text, usage_tokens = await asyncio.wrap_future(future)
+            return finish(user_message, cache_key, final_text, usage_tokens, started)
+
+        except (asyncio.TimeoutError, FuturesTimeoutError):
+            return _timeout_result(started)
+        except Exception as e:
+            logger.error(f"運行代理時錯誤: {e}")
+            return {}
+
+    run_agent.run_async = run_agent_async
+    run_agent.sessions = sessions
+    run_agent.cache = cache
     return run_agent
 
 
+class _AgentLoop:
+    """
+    所有代理呼叫共用的背景事件迴圈。
+
+    同步與非同步呼叫端都把代理工作送到此迴圈，因此每個 provider 只有一個並行上限，
+    逾時也能直接取消 ADK 的非同步事件串流，不會留下仍在執行的執行緒。
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._owner_pid = None
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def submit(self, coro) -> Future:
+        """將協程送到代理迴圈執行，回傳 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def semaphore(self, provider: str, limit: int) -> asyncio.Semaphore:
+        """取得 provider 的並行上限（只在代理迴圈上呼叫）"""
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, limit))
+            self._semaphores[provider] = semaphore
+        return semaphore
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """延遲啟動迴圈執行緒；fork 後（例如 gunicorn worker）在子行程重新啟動"""
+        if self._loop is not None and self._owner_pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._owner_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+                self._semaphores = {}
+                self._owner_pid = os.getpid()
+                self._loop = loop
+        return self._loop
+
+
+_agent_loop = _AgentLoop()
+
+
+def _timeout_result(started: float) -> Dict[str, Any]:
+    """代理逾時時的後備結果；標記 partial，不寫入檢測結果快取"""
+    elapsed = time.perf_counter() - started
+    metrics.counter("agent.timeouts").inc()
+    logger.warning(f"代理分析逾時（{elapsed:.1f} 秒），回傳後備結果")
+    return {
+        "analysis": "分析逾時",
+        "reply": "目前分析服務較忙碌，暫時無法完成深度分析，請稍後再試一次。",
+        "timeout": True,
+        "partial": True,
+    }
+
+
+class _InstructionSource:
+    """依階段定義檔產生代理指令；檔案變更時重新產生"""
+
+    def __init__(self, agent_type: str):
+        self.agent_type = agent_type
+        self._lock = threading.Lock()
+        self._mtime = _stage_definitions_mtime()
+        self._build()
+
+    def _build(self) -> None:
+        self.instruction = _get_instruction(self.agent_type)
+        self.digest = hashlib.sha256(self.instruction.encode("utf-8")).hexdigest()[:16]
+
+    def refresh(self) -> bool:
+        """
+        檢查階段定義檔是否變更，變更時重新產生指令。
+
+        Returns:
+            bool: 指令是否已重新產生
+        """
+        mtime = _stage_definitions_mtime()
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            previous = self.digest
+            self._build()
+            return self.digest != previous
+
+
+def _stage_definitions_mtime() -> Optional[float]:
+    try:
+        return os.stat(STAGE_DEFINITIONS_PATH).st_mtime
+    except OSError:
+        return None
+
+
+def _message_text(user_message) -> str:
+    """取出 GenAI Content 的文字內容"""
+    return "".join(part.text or "" for part in (user_message.parts or []))
+
+
+def _event_tokens(event) -> int:
+    """事件回報的實際 token 用量（ADK 版本未提供時為 0）"""
+    usage = getattr(event, "usage_metadata", None)
+    return int(getattr(usage, "total_token_count", 0) or 0) if usage is not None else 0
+
+
+class _SessionEntry:
+    """使用者會話的使用狀態"""
+
+    __slots__ = ("user_id", "session_id", "turns", "busy", "evicted")
+
+    def __init__(self, user_id: str, session_id: str):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.turns = 0
+        self.busy = False
+        self.evicted = False
+
+
+class AgentSessionPool:
+    """單一代理共用的 Runner 與會話服務，以及每位使用者的會話（LRU + 閒置 TTL）"""
+
+    # 至少間隔多久（秒）清理一次過期會話
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, agent: Agent, app_name: str = APP_NAME, max_sessions: int = 1000,
+                 ttl: Optional[float] = 1800, max_turns: int = 20):
+        """
+        Args:
+            agent: ADK 代理
+            app_name: ADK 應用名稱
+            max_sessions: 最多保留的使用者會話數，超過時淘汰最久未使用者
+            ttl: 會話閒置多久（秒）後淘汰，None 表示不過期
+            max_turns: 單一會話累積的對話輪數上限，達到時改用新會話，避免歷史無限增長
+        """
+        self.app_name = app_name
+        self.max_turns = max(1, max_turns)
+        self.session_service = InMemorySessionService()
+        self.runner = Runner(agent=agent, app_name=app_name, session_service=self.session_service)
+        self.sessions = TTLCache(max_size=max_sessions, ttl=ttl, on_evict=self._on_evict)
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+        self._live = metrics.gauge("agent.sessions.live")
+        self._setup_time = metrics.histogram("agent.session_setup_seconds")
+        self._created = metrics.counter("agent.sessions.created")
+        self._overflow = metrics.counter("agent.sessions.concurrent")
+
+    @contextmanager
+    def session(self, user_id: Optional[str]):
+        """
+        取得使用者的會話，離開時歸還。
+
+        同一使用者的會話正在使用中時，改用用完即刪的臨時會話。
+
+        Yields:
+            Tuple: (runner, ADK user_id, session_id)
+        """
+        start = time.perf_counter()
+        session_user_id = user_id or DEFAULT_USER_ID
+        with self._lock:
+            self._maybe_purge()
+            entry = self.sessions.get(session_user_id)
+            if entry is not None and entry.busy:
+                # 同一使用者的並行呼叫，不共用會話
+                self._overflow.inc()
+                entry = self._create_entry(session_user_id)
+                ephemeral = True
+            else:
+                if entry is not None and entry.turns >= self.max_turns:
+                    self._delete(entry)
+                    entry = None
+                if entry is None:
+                    entry = self._create_entry(session_user_id)
+                    self.sessions.set(session_user_id, entry)
+                ephemeral = False
+            entry.busy = True
+            self._live.set(len(self.sessions))
+        self._setup_time.observe(time.perf_counter() - start)
+
+        try:
+            yield self.runner, session_user_id, entry.session_id
+        finally:
+            with self._lock:
+                entry.busy = False
+                entry.turns += 1
+                if ephemeral or entry.evicted:
+                    self._delete(entry)
+                else:
+                    # 重新寫入以更新閒置 TTL 與 LRU 順序
+                    self.sessions.set(session_user_id, entry)
+                self._live.set(len(self.sessions))
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    # === 內部方法（呼叫時須持有 self._lock） ===
+
+    def _create_entry(self, user_id: str) -> _SessionEntry:
+        session_id = f"session_{user_id}_{uuid.uuid4().hex[:8]}"
+        self.session_service.create_session(app_name=self.app_name, user_id=user_id, session_id=session_id)
+        self._created.inc()
+        return _SessionEntry(user_id, session_id)
+
+    def _delete(self, entry: _SessionEntry) -> None:
+        try:
+            self.session_service.delete_session(
+                app_name=self.app_name, user_id=entry.user_id, session_id=entry.session_id
+            )
+        except Exception as e:
+            logger.warning(f"刪除會話 {entry.session_id} 時錯誤: {e}")
+
+    def _on_evict(self, user_id: str, entry: _SessionEntry) -> None:
+        """快取淘汰會話時一併刪除 ADK 會話；使用中的會話於歸還時刪除"""
+        if entry.busy:
+            entry.evicted = True
+        else:
+            self._delete(entry)
+
+    def _maybe_purge(self) -> None:
+        now = time.monotonic()
+        if now - self._last_purge >= self.PURGE_INTERVAL:
+            self._last_purge = now
+            self.sessions.purge_expired()
+
+
+def _build_user_message(conversation: Union[str, Dict[str, Any]]):
+    """從對話內容取出要送給代理的使用者訊息，包裝為 GenAI Content。"""
+    # 檢查 conversation 是字符串還是字典
+    if isinstance(conversation, str):
+        # 如果是字符串，嘗試解析為 JSON
+        try:
+            conv_dict = json.loads(conversation)
+        except json.JSONDecodeError:
+            # 如果無法解析，將整個字符串作為消息內容
+            conv_dict = {
+                "conversation": [{"type": "user_message", "content": conversation, "source": "user"}]
+            }
+    else:
+        # 已經是字典，直接使用
+        conv_dict = conversation
+
+    # 取出最新的使用者訊息
+    msgs = conv_dict.get("conversation", [])
+
+    # 取出用戶的主要訊息，移除可能的重複
+    user_messages = []
+    seen_contents = set()
+
+    for msg in msgs:
+        if isinstance(msg, dict):
+            # 如果是使用者訊息或不知類型的訊息
+            if msg.get("source") == "user" or msg.get("type") == "user_message" or msg.get("type") == "unknown":
+                content = msg.get("content", "")
+                if content and content not in seen_contents:
+                    seen_contents.add(content)
+                    user_messages.append(content)
+
+    # 組合使用者訊息，優先使用最後一條
+    if user_messages:
+        last = user_messages[-1]  # 使用最後一條使用者訊息
+    else:
+        # 如果沒有辨識到使用者訊息，預設使用最後一條消息
+        if msgs and isinstance(msgs[-1], dict):
+            last = msgs[-1].get("content", "")
+        elif msgs:
+            last = str(msgs[-1])
+        else:
+            last = str(conversation)
+
+    # 包裝為 Gemini/Google GenAI 要求的 Content
+    from google.genai.types import Content, Part
+    return Content(role="user", parts=[Part(text=last)])
+
+
+def _parse_final_response(final_text) -> Dict[str, Any]:
+    """解析代理最終回應為結果字典。"""
+    if final_text:
+        # 試著從 final_text 提取文本
+        if hasattr(final_text, 'parts') and final_text.parts:
+            text = final_text.parts[0].text
+        else:
+            text = str(final_text)
+        try:
+            # 嘗試解析 JSON
+            return json.loads(text)
+        except (json.JSONDecodeError, TypeError):
+            # 如果無法解析 JSON，返回原始文本
+            return {"analysis": text, "reply": text}
+
+    return {"analysis": "無回應", "reply": "無回應"}
+
+
 def _get_instruction(agent_type: str = "scam_detection") -> str:
     stage_definitions = _load_stage_definitions()
     
@@ -271,6 +605,8 @@ def _create_adk_agent(
             name=f"{agent_type}_agent",
             model=llm,
             instruction=instruction,
+            # 每次呼叫不帶入會話中先前的對話，結果只取決於本次內容
+            include_contents="none",
         )
         return agent
 
@@ -0,0 +1,109 @@
+"""
+LLM 代理回應快取
+
+以「代理類型 + 指令雜湊 + 模型名稱 + 正規化對話內容」的 SHA-256 作為鍵，
+完全相同的對話（例如多位群組成員貼上同一段匯出）直接回傳先前的代理回應。
+記憶體層為 LRU/TTL 快取，可選擇加上 SQLite 磁碟層跨 worker 共用並在重啟後保留。
+指令（階段定義）變更時雜湊隨之改變，舊回應不會被誤用。
+
+每筆快取記錄原始呼叫的延遲與 token 數，命中時累計省下的秒數與 token。
+"""
+
+import copy
+import hashlib
+from typing import Any, Dict, Optional
+
+from utils.cache import SQLiteCache, TTLCache, normalize_text
+from utils.logger import get_adk_logger
+from utils.metrics import metrics
+
+logger = get_adk_logger("response_cache")
+
+
+class AgentResponseCache:
+    """代理回應的兩層快取（記憶體 + 可選的 SQLite）"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 86400,
+                 path: Optional[str] = None, disk_size: int = 10000):
+        """
+        Args:
+            max_size: 記憶體層最多保留的回應數
+            ttl: 回應存活秒數，None 表示不過期
+            path: SQLite 檔案路徑，None 表示只使用記憶體
+            disk_size: 磁碟層最多保留的回應數
+        """
+        self.memory = TTLCache(max_size=max_size, ttl=ttl)
+        self.disk = SQLiteCache(path, max_size=disk_size, ttl=ttl, table="agent_responses") if path else None
+
+        self._hits = metrics.counter("agent.cache.hits")
+        self._disk_hits = metrics.counter("agent.cache.disk_hits")
+        self._misses = metrics.counter("agent.cache.misses")
+        self._saved_seconds = metrics.counter("agent.cache.saved_seconds")
+        self._saved_tokens = metrics.counter("agent.cache.saved_tokens")
+
+    @staticmethod
+    def make_key(agent_type: str, instruction_digest: str, model_name: str, text: str) -> str:
+        """
+        產生快取鍵。
+
+        Args:
+            agent_type: 代理類型
+            instruction_digest: 系統指令的雜湊
+            model_name: 提供商與模型名稱
+            text: 送給代理的對話內容
+
+        Returns:
+            str: SHA-256 十六進位字串
+        """
+        digest = hashlib.sha256()
+        for part in (agent_type, instruction_digest, model_name, normalize_text(text)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """依序查詢記憶體與磁碟快取，命中時回傳代理回應的副本"""
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            try:
+                entry = self.disk.get(key)
+            except Exception as e:
+                logger.warning(f"讀取磁碟代理快取失敗: {str(e)}")
+                entry = None
+            if entry is not None:
+                self._disk_hits.inc()
+                self.memory.set(key, entry)
+        if entry is None:
+            self._misses.inc()
+            return None
+
+        self._hits.inc()
+        self._saved_seconds.inc(entry.get("seconds", 0.0))
+        self._saved_tokens.inc(entry.get("tokens", 0))
+        return copy.deepcopy(entry["result"])
+
+    def set(self, key: str, result: Dict[str, Any], seconds: float, tokens: int) -> None:
+        """
+        寫入代理回應。
+
+        Args:
+            key: 快取鍵
+            result: 代理回應
+            seconds: 原始呼叫的延遲
+            tokens: 原始呼叫的 token 數（輸入 + 輸出）
+        """
+        entry = {"result": copy.deepcopy(result), "seconds": round(seconds, 3), "tokens": int(tokens)}
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, entry)
+            except Exception as e:
+                logger.warning(f"寫入磁碟代理快取失敗: {str(e)}")
+
+    def invalidate(self) -> None:
+        """清空記憶體層；磁碟層的舊鍵因指令雜湊改變不會再命中，依 TTL 與容量淘汰"""
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """回傳記憶體層的統計資料"""
+        return self.memory.stats()
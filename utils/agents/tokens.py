@@ -0,0 +1,31 @@
+"""
+LLM token 數估計
+
+不依賴特定 tokenizer 的粗略估計，用於統計快取與壓縮省下的 token：
+CJK 字元約每字 1 個 token，其他字元約每 4 個字元 1 個 token。
+"""
+
+import re
+
+# CJK 統一表意文字、注音、全形標點與假名
+_CJK_REGEX = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3100-\u312f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+# 非 CJK 字元平均每個 token 的字元數
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估計文字的 token 數。
+
+    Args:
+        text: 文字
+
+    Returns:
+        int: 估計的 token 數（非空文字至少為 1）
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_REGEX.findall(text))
+    other = len(text) - cjk
+    return max(1, cjk + (other + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
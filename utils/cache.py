@@ -0,0 +1,319 @@
+"""
+快取工具
+
+提供執行緒安全、具容量上限與存活時間（TTL）的快取：
+- TTLCache: 行程內 LRU 快取
+- SQLiteCache: SQLite（WAL 模式）檔案快取，可跨 worker 共用並在重啟後保留
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# 標記快取未命中
+_MISSING = object()
+
+
+def normalize_text(text: str) -> str:
+    """
+    正規化文字內容供快取比對：NFKC 全半形統一、每行合併連續空白並去除首尾空白。
+    保留換行，避免不同格式的輸入對應到同一個快取項目。
+    """
+    text = unicodedata.normalize("NFKC", text)
+    lines = (" ".join(line.split()) for line in text.strip().splitlines())
+    return "\n".join(lines)
+
+
+class TTLCache:
+    """
+    具容量上限與 TTL 的 LRU 快取。
+
+    - 所有操作皆為 O(1)（以 OrderedDict 維護順序）
+    - 超過容量時移除最久未使用（或最早插入）的項目
+    - 過期項目在存取時移除
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None,
+                 refresh_on_get: bool = True,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        """
+        初始化快取。
+
+        Args:
+            max_size: 最大項目數
+            ttl: 預設存活秒數，None 表示不過期
+            refresh_on_get: 讀取時是否更新使用順序（False 則為純插入順序淘汰）
+            on_evict: 項目因超量或過期被移除時呼叫 on_evict(key, value)，用於釋放值持有的資源；
+                於持有快取鎖時執行，不得再操作此快取（pop 與 clear 不會呼叫）
+        """
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.refresh_on_get = refresh_on_get
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return time.monotonic() + ttl if ttl is not None else None
+
+    def _lookup(self, key: Hashable) -> Any:
+        """在持有鎖的情況下查找項目，過期則移除。"""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+            return _MISSING
+        return value
+
+    def _evict_overflow(self) -> None:
+        while len(self._data) > self.max_size:
+            key, (_, value) = self._data.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        取得快取值。
+
+        Args:
+            key: 快取鍵
+            default: 未命中時的回傳值
+
+        Returns:
+            Any: 快取值或 default
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            if self.refresh_on_get:
+                self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        設定快取值。
+
+        Args:
+            key: 快取鍵
+            value: 快取值
+            ttl: 此項目的存活秒數，None 則使用預設值
+        """
+        with self._lock:
+            self._data[key] = (self._expires_at(ttl), value)
+            self._data.move_to_end(key)
+            self._evict_overflow()
+
+    def add(self, key: Hashable, value: Any = True, ttl: Optional[float] = None) -> bool:
+        """
+        僅在鍵不存在（或已過期）時寫入，檢查與寫入為同一原子操作。
+
+        Returns:
+            bool: 寫入成功則為 True，鍵已存在則為 False
+        """
+        with self._lock:
+            if self._lookup(key) is not _MISSING:
+                return False
+            self._data[key] = (self._expires_at(ttl), value)
+            self._evict_overflow()
+            return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """移除並回傳快取值"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                return default
+            del self._data[key]
+            return value
+
+    def purge_expired(self) -> int:
+        """
+        移除所有過期項目（O(n)，供需要及早釋放資源的呼叫端定期執行）。
+
+        Returns:
+            int: 移除的項目數
+        """
+        with self._lock:
+            now = time.monotonic()
+            expired = [key for key, (expires_at, _) in self._data.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                self._lookup(key)
+            self.evictions += len(expired)
+            return len(expired)
+
+    def clear(self) -> None:
+        """清空快取"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._lookup(key) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """回傳命中、未命中、淘汰次數與目前大小"""
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteCache:
+    """
+    以 SQLite 檔案實作的鍵值快取，值以 JSON 儲存。
+
+    每個執行緒（與行程）使用各自的連線；超過容量時依最後寫入時間淘汰。
+    """
+
+    # 每寫入多少筆清理一次過期與超量資料
+    PURGE_INTERVAL = 200
+
+    def __init__(self, path: str, max_size: int = 100000, ttl: Optional[float] = None,
+                 table: str = "cache"):
+        """
+        初始化快取。
+
+        Args:
+            path: SQLite 檔案路徑
+            max_size: 最多保留的項目數
+            ttl: 預設存活秒數，None 表示不過期
+            table: 資料表名稱（同一檔案可存放多個快取）
+        """
+        if not table.isidentifier():
+            raise ValueError(f"無效的資料表名稱: {table}")
+        self.path = path
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.table = table
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        # 因過期或超量被移除的項目數（本行程執行的清理）
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_updated_at ON {table}(updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """取得目前執行緒（與行程）專用的連線"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        取得快取值。
+
+        Args:
+            key: 快取鍵
+            default: 未命中或已過期時的回傳值
+
+        Returns:
+            Any: 快取值或 default
+        """
+        row = self._connect().execute(
+            f"SELECT value FROM {self.table} WHERE key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        設定快取值。
+
+        Args:
+            key: 快取鍵
+            value: 可序列化為 JSON 的值
+            ttl: 此項目的存活秒數，None 則使用預設值
+        """
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        conn = self._connect()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False),
+             now + ttl if ttl is not None else None, now)
+        )
+        self._maybe_purge(conn, now)
+
+    def pop(self, key: str) -> None:
+        """移除快取項目"""
+        self._connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        """
+        立即移除所有過期項目（不等待定期清理）。
+
+        Returns:
+            int: 移除的項目數
+        """
+        cursor = self._connect().execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        with self._lock:
+            self.evictions += cursor.rowcount
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        """清空快取"""
+        self._connect().execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _maybe_purge(self, conn: sqlite3.Connection, now: float) -> None:
+        """定期移除過期資料，並依寫入時間淘汰超出上限的最舊資料"""
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.PURGE_INTERVAL:
+                return
+        expired = conn.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        )
+        overflow = conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f"SELECT key FROM {self.table} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,)
+        )
+        with self._lock:
+            self.evictions += expired.rowcount + overflow.rowcount
@@ -0,0 +1,209 @@
+"""
+斷路器工具
+
+依滑動時間視窗內的錯誤率與慢呼叫比例保護對外依賴：
+- closed: 正常放行，視窗內呼叫數達下限且錯誤率或慢呼叫比例超過門檻時轉為 open
+- open: 直接拒絕呼叫（由呼叫端改用後備方案），經過 open_seconds 後轉為 half_open
+- half_open: 只放行少量試探呼叫，全部成功則回到 closed，任一失敗則重新 open
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from utils.error_handler import AppError, ErrorType
+from utils.logger import get_utils_logger
+from utils.metrics import metrics
+
+# 取得模組特定的日誌記錄器
+logger = get_utils_logger("circuit_breaker")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 狀態在指標中的數值
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+class CircuitOpenError(AppError):
+    """斷路器開啟，呼叫被拒絕"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} 斷路器開啟，{retry_in:.1f} 秒後試探", ErrorType.API, 503)
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """以滑動視窗錯誤率與慢呼叫比例判斷的斷路器（執行緒安全）"""
+
+    def __init__(self, name: str,
+                 window_seconds: float = 30.0,
+                 min_calls: int = 10,
+                 error_rate_threshold: float = 0.5,
+                 slow_call_seconds: Optional[float] = None,
+                 slow_rate_threshold: float = 0.8,
+                 open_seconds: float = 30.0,
+                 half_open_calls: int = 1):
+        """
+        Args:
+            name: 名稱（日誌與指標前綴 circuit.<name>）
+            window_seconds: 統計錯誤率的滑動視窗秒數
+            min_calls: 視窗內至少有此數量的呼叫才會判斷是否開啟
+            error_rate_threshold: 錯誤率達此值時開啟
+            slow_call_seconds: 超過此秒數視為慢呼叫，None 表示不判斷延遲
+            slow_rate_threshold: 慢呼叫比例達此值時開啟
+            open_seconds: 開啟後多久轉為 half_open
+            half_open_calls: half_open 狀態放行的試探呼叫數
+        """
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(1, half_open_calls)
+
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        # (時間, 是否失敗, 是否慢呼叫)
+        self._calls: deque = deque()
+        self._failures = 0
+        self._slow = 0
+        self._lock = threading.Lock()
+
+        self._state_gauge = metrics.gauge(f"circuit.{name}.state")
+        self._rejected = metrics.counter(f"circuit.{name}.rejected")
+        self._opened = metrics.counter(f"circuit.{name}.opened")
+        self._state_gauge.set(_STATE_VALUES[STATE_CLOSED])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        是否放行一次呼叫；放行後呼叫端必須以 record_success 或 record_failure 回報結果，
+        無法回報時（例如呼叫被取消）以 release 歸還試探名額。
+
+        Returns:
+            bool: False 表示斷路器開啟，應改用後備方案
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN and self._half_open_in_flight < self.half_open_calls:
+                self._half_open_in_flight += 1
+                return True
+            self._rejected.inc()
+            return False
+
+    def check(self) -> None:
+        """
+        同 allow，但在拒絕時拋出例外。
+
+        Raises:
+            CircuitOpenError: 斷路器開啟
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def retry_in(self) -> float:
+        """距離下一次試探的秒數"""
+        with self._lock:
+            if self._state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def record_success(self, latency: float) -> None:
+        """回報一次成功的呼叫及其延遲（秒）；超過 slow_call_seconds 視為慢呼叫"""
+        slow = self.slow_call_seconds is not None and latency >= self.slow_call_seconds
+        self._record(failed=False, slow=slow)
+
+    def record_failure(self, latency: float = 0.0) -> None:
+        """回報一次失敗的呼叫"""
+        self._record(failed=True, slow=False)
+
+    def release(self) -> None:
+        """
+        歸還已放行但不回報結果的呼叫（例如呼叫被取消）。
+
+        half_open 狀態下釋放試探名額，避免斷路器卡在 half_open 拒絕所有呼叫；
+        其他狀態不受影響。
+        """
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    # === 內部方法 ===
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if failed or slow:
+                    self._open(now, "試探呼叫失敗" if failed else "試探呼叫過慢")
+                    return
+                self._half_open_successes += 1
+                if self._half_open_successes >= self.half_open_calls:
+                    self._close()
+                return
+            if self._state == STATE_OPEN:
+                # 開啟前已放行的呼叫，結果不影響狀態
+                return
+
+            self._calls.append((now, failed, slow))
+            self._failures += failed
+            self._slow += slow
+            self._prune(now)
+
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            if self._failures / total >= self.error_rate_threshold:
+                self._open(now, f"錯誤率 {self._failures / total:.0%}")
+            elif self.slow_call_seconds is not None and self._slow / total >= self.slow_rate_threshold:
+                self._open(now, f"慢呼叫比例 {self._slow / total:.0%}")
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            _, failed, slow = self._calls.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == STATE_OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = STATE_HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+            self._state_gauge.set(_STATE_VALUES[STATE_HALF_OPEN])
+            logger.info(f"{self.name} 斷路器轉為 half_open，開始試探")
+
+    def _open(self, now: float, reason: str) -> None:
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self._failures = 0
+        self._slow = 0
+        self._opened.inc()
+        self._state_gauge.set(_STATE_VALUES[STATE_OPEN])
+        logger.warning(f"{self.name} 斷路器開啟（{reason}），{self.open_seconds} 秒內改用後備方案")
+
+    def _close(self) -> None:
+        self._state = STATE_CLOSED
+        self._calls.clear()
+        self._failures = 0
+        self._slow = 0
+        self._state_gauge.set(_STATE_VALUES[STATE_CLOSED])
+        logger.info(f"{self.name} 斷路器恢復為 closed")
@@ -4,6 +4,7 @@
 提供統一的錯誤處理機制，包括錯誤記錄、分類和格式化。
 """
 
+import functools
 import traceback
 from enum import Enum
 from utils.logger import get_service_logger
@@ -169,3 +170,24 @@ def with_error_handling(reraise=True):
                 return handle_error(e, reraise)
         return wrapper
     return decorator
+
+
+def with_async_error_handling(reraise=True):
+    """
+    非同步函數版本的錯誤處理裝飾器
+
+    Args:
+        reraise: 是否重新拋出錯誤
+
+    Returns:
+        裝飾器函數
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                return handle_error(e, reraise)
+        return wrapper
+    return decorator
@@ -0,0 +1,38 @@
+"""
+Fraud-Sentiment 模組橋接
+
+Fraud-Sentiment 目錄名稱含連字號，無法以套件方式匯入，
+其中的模組彼此也以頂層名稱互相匯入（例如 `from theory_stage_classifier import ...`）。
+此模組將該目錄加入 sys.path，讓主服務可以共用其中的階段規則與工具。
+"""
+
+import os
+import sys
+
+FRAUD_SENTIMENT_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "Fraud-Sentiment")
+)
+
+if FRAUD_SENTIMENT_DIR not in sys.path:
+    sys.path.append(FRAUD_SENTIMENT_DIR)
+
+from theory_stage_classifier import STAGE_MAPPING, classify_stage, classify_stage_ids  # noqa: E402
+from keyword_automaton import (  # noqa: E402
+    LEXICON, TAG_LEXICON, TAG_SCAM, TAG_STAGE, KeywordAutomaton, KeywordHit, KeywordScan,
+    build_keyword_automaton, get_default_automaton
+)
+from classifier_backend import LABELS as CLASSIFIER_LABELS, load_classifier_backend  # noqa: E402
+from conversation_windows import RULES as WINDOW_RULES, aggregate as aggregate_windows, split_windows  # noqa: E402
+from line_export import (  # noqa: E402
+    KIND_MEDIA, KIND_SYSTEM, KIND_TEXT, NO_SENDER, LineExport, LineExportParser, LineMessage, parse_line_export
+)
+
+__all__ = [
+    "FRAUD_SENTIMENT_DIR", "STAGE_MAPPING", "classify_stage", "classify_stage_ids",
+    "TAG_LEXICON", "TAG_SCAM", "TAG_STAGE",
+    "LEXICON", "KeywordAutomaton", "KeywordHit", "KeywordScan", "build_keyword_automaton", "get_default_automaton",
+    "CLASSIFIER_LABELS", "load_classifier_backend",
+    "WINDOW_RULES", "aggregate_windows", "split_windows",
+    "KIND_MEDIA", "KIND_SYSTEM", "KIND_TEXT", "NO_SENDER",
+    "LineExport", "LineExportParser", "LineMessage", "parse_line_export",
+]
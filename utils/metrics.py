@@ -0,0 +1,171 @@
+"""
+指標收集工具
+
+提供行程內的輕量指標（計數器、量表、直方圖），供佇列深度、等待時間、
+外部呼叫延遲等統計使用，並可透過 /metrics 端點輸出快照。
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# 直方圖保留的最近樣本數，用於估算百分位數
+DEFAULT_HISTOGRAM_WINDOW = 1024
+
+
+def _percentile(sorted_samples, pct: float) -> float:
+    """從已排序的樣本中取出百分位數，無樣本時回傳 0。"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100.0 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+class Counter:
+    """單調遞增的計數器"""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> float:
+        return self._value
+
+
+class Gauge:
+    """可上下變動的量表"""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> float:
+        return self._value
+
+
+class Histogram:
+    """
+    直方圖，保留總數、總和、最大值與最近樣本的滑動視窗，
+    以視窗內樣本估算 p50/p95/p99。
+    """
+
+    def __init__(self, window: int = DEFAULT_HISTOGRAM_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._samples.append(value)
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def percentile(self, pct: float) -> float:
+        """回傳視窗內樣本的百分位數，無樣本時回傳 0。"""
+        with self._lock:
+            samples = sorted(self._samples)
+        return _percentile(samples, pct)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total, maximum = self._count, self._sum, self._max
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "avg": round(total / count, 6) if count else 0.0,
+            "max": round(maximum, 6),
+            "p50": round(_percentile(samples, 50), 6),
+            "p95": round(_percentile(samples, 95), 6),
+            "p99": round(_percentile(samples, 99), 6),
+        }
+
+
+class MetricsRegistry:
+    """依名稱管理指標的登錄表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = factory()
+                    self._metrics[name] = metric
+        return metric
+
+    def counter(self, name: str) -> Counter:
+        return self._get_or_create(name, Counter)
+
+    def gauge(self, name: str) -> Gauge:
+        return self._get_or_create(name, Gauge)
+
+    def histogram(self, name: str) -> Histogram:
+        return self._get_or_create(name, Histogram)
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        量測區塊執行時間（秒）並記錄到指定直方圖。
+
+        Args:
+            name: 直方圖名稱
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name).observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        取得所有指標的快照。
+
+        Returns:
+            Dict[str, Any]: 指標名稱對應目前數值
+        """
+        with self._lock:
+            items = list(self._metrics.items())
+        return {name: metric.snapshot() for name, metric in sorted(items)}
+
+
+# 應用程式共用的指標登錄表
+metrics = MetricsRegistry()
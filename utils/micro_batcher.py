@@ -0,0 +1,209 @@
+"""
+動態微批次處理工具
+
+將多個執行緒同時提交的單筆請求在短時間內（max_wait_ms）或湊滿 N 筆後
+合併成一批交給批次函數處理，再把結果逐一交還給各自的呼叫者。
+適用於 BERT 等每次前向傳播有固定開銷、批次處理效率較高的推論。
+
+批次上限會依實測延遲調整：批次延遲超過目標時縮小，遠低於目標且批次已滿時放大。
+
+呼叫者取消的項目（例如 submit_async 的協程被取消）在批次開始前略過，不送入批次函數；
+工作執行緒意外結束時，下一次提交會重新啟動。
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, List, Optional, Sequence
+
+from utils.logger import get_service_logger
+from utils.metrics import metrics
+
+# 取得模組特定的日誌記錄器
+logger = get_service_logger("micro_batcher")
+
+# 停止工作執行緒用的哨兵
+_STOP = object()
+
+
+class MicroBatcher:
+    """收集並合併並行請求的微批次處理器"""
+
+    def __init__(self,
+                 batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0,
+                 target_latency_ms: Optional[float] = None,
+                 name: str = "batcher"):
+        """
+        初始化微批次處理器。
+
+        Args:
+            batch_fn: 批次函數，輸入項目列表，回傳等長且順序相同的結果列表
+            max_batch_size: 批次上限的最大值
+            max_wait_ms: 第一筆請求到達後最多等待湊批的毫秒數
+            target_latency_ms: 單批處理延遲目標；None 表示固定使用 max_batch_size
+            name: 指標名稱前綴
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.target_latency = target_latency_ms / 1000.0 if target_latency_ms else None
+        self.name = name
+        self.batch_limit = self.max_batch_size
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._owner_pid = None
+        self._lock = threading.Lock()
+
+        self._batch_size = metrics.histogram(f"{name}.batch_size")
+        self._wait_time = metrics.histogram(f"{name}.queue_wait_seconds")
+        self._batch_time = metrics.histogram(f"{name}.batch_seconds")
+        self._items = metrics.counter(f"{name}.items")
+        self._throughput = metrics.gauge(f"{name}.items_per_second")
+        self._limit_gauge = metrics.gauge(f"{name}.batch_limit")
+        self._limit_gauge.set(self.batch_limit)
+
+    def submit(self, item: Any) -> Future:
+        """
+        提交單筆項目。
+
+        Args:
+            item: 要處理的項目
+
+        Returns:
+            Future: 完成後取得該項目的結果（或批次函數拋出的例外）
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((time.monotonic(), item, future))
+        return future
+
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """
+        同步提交並等待結果。
+
+        Raises:
+            concurrent.futures.TimeoutError: 超過 timeout 秒仍未完成（尚未送入批次的項目會被取消）
+        """
+        future = self.submit(item)
+        try:
+            return future.result(timeout)
+        except FuturesTimeoutError:
+            future.cancel()
+            raise
+
+    async def submit_async(self, item: Any) -> Any:
+        """非同步提交並等待結果，不阻塞事件迴圈"""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def close(self, timeout: float = 5.0) -> None:
+        """停止工作執行緒，已提交的項目會先處理完畢"""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None:
+            self._queue.put(_STOP)
+            worker.join(timeout)
+
+    # === 內部方法 ===
+
+    def _worker_ready(self) -> bool:
+        return self._worker is not None and self._owner_pid == os.getpid() and self._worker.is_alive()
+
+    def _ensure_worker(self) -> None:
+        """
+        延遲啟動工作執行緒；fork 後（例如 gunicorn worker）在子行程重新啟動，
+        工作執行緒意外結束時也重新啟動（保留佇列中尚未處理的項目）。
+        """
+        if self._worker_ready():
+            return
+        with self._lock:
+            if self._worker_ready():
+                return
+            if self._worker is None or self._owner_pid != os.getpid():
+                self._queue = queue.Queue()
+            else:
+                logger.error(f"{self.name} 工作執行緒已結束，重新啟動")
+            self._owner_pid = os.getpid()
+            self._worker = threading.Thread(target=self._worker_loop, name=f"{self.name}-worker", daemon=True)
+            self._worker.start()
+
+    def _collect(self, first) -> List[tuple]:
+        """以第一筆為起點，在等待時限內湊滿批次"""
+        batch = [first]
+        deadline = first[0] + self.max_wait
+        while len(batch) < self.batch_limit:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _worker_loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            # 已被呼叫者取消的項目不送入批次函數
+            batch = [entry for entry in self._collect(first) if entry[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.monotonic()
+            for enqueued_at, _, _ in batch:
+                self._wait_time.observe(start - enqueued_at)
+
+            items = [item for _, item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise ValueError(f"批次函數回傳 {len(results)} 筆結果，預期 {len(items)} 筆")
+            except Exception as e:
+                logger.error(f"{self.name} 批次處理失敗（{len(items)} 筆）: {str(e)}")
+                for _, _, future in batch:
+                    self._deliver(future, error=e)
+                continue
+            finally:
+                elapsed = time.monotonic() - start
+                self._batch_time.observe(elapsed)
+                self._batch_size.observe(len(items))
+                self._items.inc(len(items))
+                if elapsed > 0:
+                    self._throughput.set(round(len(items) / elapsed, 2))
+
+            for (_, _, future), result in zip(batch, results):
+                self._deliver(future, result=result)
+            self._adjust_limit(len(items), elapsed)
+
+    def _deliver(self, future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """交付單一項目的結果；單一 future 的狀態錯誤不影響工作執行緒"""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except Exception as e:
+            logger.warning(f"{self.name} 無法交付結果: {str(e)}")
+
+    def _adjust_limit(self, size: int, elapsed: float) -> None:
+        """依實測延遲調整批次上限（延遲過高時縮小，批次已滿且延遲充裕時放大）"""
+        if self.target_latency is None:
+            return
+        limit = self.batch_limit
+        if elapsed > self.target_latency and limit > 1:
+            limit = max(1, int(limit * 0.75))
+        elif size >= limit and elapsed < self.target_latency * 0.5:
+            limit = min(self.max_batch_size, limit + 1)
+        if limit != self.batch_limit:
+            self.batch_limit = limit
+            self._limit_gauge.set(limit)
@@ -0,0 +1,166 @@
+"""
+Pre-fork 部署工具
+
+gunicorn 以 preload 模式在 master 行程載入應用程式與模型後再 fork worker，
+模型權重頁面由各 worker 以 copy-on-write 方式共用。此模組負責：
+- 依 worker 數與可用核心數分配每個 worker 的推論執行緒（torch/OpenMP/ONNX Runtime），避免 CPU 超額使用
+- 在 fork 前凍結已載入的模型與 Python 物件，減少 worker 觸發的頁面複製
+- 輸出啟動時的行程與執行緒配置
+"""
+
+import gc
+import os
+import sys
+from typing import Optional
+
+from utils.logger import get_utils_logger
+
+# 取得模組特定的日誌記錄器
+logger = get_utils_logger("prefork")
+
+# 各數值函式庫讀取的執行緒數環境變數（須在匯入 torch/numpy 前設定）
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+class ThreadBudget:
+    """每個 worker 的 CPU 執行緒配置"""
+
+    def __init__(self, cores: int, workers: int, inference_threads: int):
+        """
+        Args:
+            cores: 可用 CPU 核心數
+            workers: worker 行程數
+            inference_threads: 每個 worker 的推論執行緒數（torch intra-op / OpenMP / ONNX Runtime intra-op）
+        """
+        self.cores = cores
+        self.workers = workers
+        self.inference_threads = inference_threads
+
+    @property
+    def oversubscribed(self) -> bool:
+        """所有 worker 的推論執行緒總數是否超過核心數"""
+        return self.workers * self.inference_threads > self.cores
+
+    def __str__(self) -> str:
+        return (f"核心 {self.cores}，worker {self.workers}，"
+                f"每個 worker 推論執行緒 {self.inference_threads}"
+                f"（共 {self.workers * self.inference_threads}）")
+
+
+def available_cores() -> int:
+    """
+    目前行程可用的 CPU 核心數，考慮 CPU affinity 與 cgroup v2 配額（容器環境）。
+
+    Returns:
+        int: 至少為 1 的核心數
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cores = os.cpu_count() or 1
+
+    # cgroup v2: cpu.max 內容為「配額 週期」或「max 週期」
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cores)
+
+
+def plan_thread_budget(workers: int, cores: Optional[int] = None,
+                       inference_threads: Optional[int] = None) -> ThreadBudget:
+    """
+    依 worker 數與核心數計算每個 worker 的推論執行緒數。
+
+    Args:
+        workers: worker 行程數
+        cores: 可用核心數，None 表示自動偵測
+        inference_threads: 指定每個 worker 的推論執行緒數，None 或 0 表示平均分配核心
+
+    Returns:
+        ThreadBudget: 執行緒配置
+    """
+    workers = max(1, workers)
+    cores = cores or available_cores()
+    threads = inference_threads or max(1, cores // workers)
+    return ThreadBudget(cores, workers, threads)
+
+
+def apply_thread_env(budget: ThreadBudget) -> None:
+    """
+    以環境變數設定推論執行緒數，須在 master 行程匯入 torch 之前呼叫。
+    已明確設定的環境變數不會被覆寫。
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(budget.inference_threads))
+    # tokenizers 的 Rust 執行緒池在 fork 後無法使用，且會額外佔用核心
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def apply_thread_budget(budget: ThreadBudget) -> None:
+    """
+    在 worker 行程內套用推論執行緒數（fork 後呼叫）。
+    torch 若已在 master 匯入，直接設定其 intra-op 與 inter-op 執行緒數。
+    """
+    apply_thread_env(budget)
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    torch.set_num_threads(budget.inference_threads)
+    try:
+        # 批次推論由微批次處理器序列化，不需要額外的 inter-op 平行
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # inter-op 執行緒池已啟動後無法再調整
+        pass
+
+
+def freeze_loaded_models() -> None:
+    """
+    在 fork 前凍結 master 已載入的模型：
+    關閉參數的梯度追蹤，並將目前所有 Python 物件移出垃圾回收追蹤，
+    避免 worker 的 GC 寫入物件標頭而複製共用頁面。
+    """
+    model_registry = sys.modules.get("model_registry")
+    if model_registry is not None:
+        model_registry.freeze()
+    gc.collect()
+    gc.freeze()
+
+
+def rss_mb() -> float:
+    """目前行程的常駐記憶體（MB），無法取得時回傳 0"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def log_master_layout(budget: ThreadBudget, preload: bool, web_threads: int) -> None:
+    """輸出 master 行程的啟動配置"""
+    model_registry = sys.modules.get("model_registry")
+    models = [key[0] for key in model_registry.loaded_keys()] if model_registry is not None else []
+    logger.info(
+        f"Pre-fork 配置：{budget}，每個 worker 請求執行緒 {web_threads}，"
+        f"preload={'啟用' if preload else '停用'}，"
+        f"master 已載入 {', '.join(models) or '無模型'}，master RSS {rss_mb():.0f} MB"
+    )
+    if budget.oversubscribed:
+        logger.warning(f"推論執行緒總數超過可用核心數（{budget}），建議減少 worker 數")
+
+
+def log_worker_layout(budget: ThreadBudget) -> None:
+    """輸出 worker 行程的執行緒配置"""
+    torch = sys.modules.get("torch")
+    torch_threads = f"torch intra-op {torch.get_num_threads()}，" if torch is not None else ""
+    logger.info(
+        f"Worker {os.getpid()} 啟動：{torch_threads}"
+        f"OMP_NUM_THREADS={os.environ.get('OMP_NUM_THREADS')}，RSS {rss_mb():.0f} MB"
+    )